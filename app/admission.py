@@ -0,0 +1,238 @@
+"""Adaptive admission control with separate concurrency budgets per route class.
+
+Requests are split into four classes: auth (bcrypt-heavy login and
+registration), exports (long CSV/NDJSON streams), reads and writes. Each
+class has its own concurrency limit and a bounded wait queue, so an auth
+spike or a run of exports cannot take the threadpool and connection pool
+away from the cheap calculation endpoints.
+
+Limits adapt AIMD-style to observed latency. A response faster than the
+class's target while the limit is saturated raises the limit by about one
+per window. A slower one cuts it by ADMISSION_BACKOFF, at most once per
+target interval. A request that finds the queue full, or waits longer than
+its class's queue timeout for a slot, is shed with 503 and Retry-After.
+Auth is sized from the bcrypt pool it feeds. It queues up to
+HASH_QUEUE_DEPTH requests for AUTH_QUEUE_TIMEOUT_MS, which is never less
+than AUTH_TARGET_MS, so a queued login can outlast the hashes ahead of it.
+Its limit never drops below HASH_POOL_SIZE, so backoff cannot leave hashing
+workers idle. Exports hold their slot for the whole stream and likewise
+queue for EXPORT_QUEUE_TIMEOUT_MS.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+import orjson
+from app.hashing import HASH_POOL_SIZE, HASH_QUEUE_DEPTH
+from app.metrics import admission_in_flight, admission_limit, admission_shed
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "250"))
+ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+# Limits may grow up to this multiple of their initial value
+ADMISSION_MAX_FACTOR = float(os.getenv("ADMISSION_MAX_FACTOR", "4"))
+
+# Initial concurrency limit and latency target per route class
+AUTH_CONCURRENCY = int(os.getenv("AUTH_CONCURRENCY", "8"))
+AUTH_TARGET_MS = float(os.getenv("AUTH_TARGET_MS", "1000"))
+AUTH_QUEUE_TIMEOUT_MS = float(os.getenv("AUTH_QUEUE_TIMEOUT_MS", "10000"))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "8"))
+EXPORT_TARGET_MS = float(os.getenv("EXPORT_TARGET_MS", "1000"))
+EXPORT_QUEUE_TIMEOUT_MS = float(os.getenv("EXPORT_QUEUE_TIMEOUT_MS", "10000"))
+READ_CONCURRENCY = int(os.getenv("READ_CONCURRENCY", "64"))
+READ_TARGET_MS = float(os.getenv("READ_TARGET_MS", "100"))
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", "32"))
+WRITE_TARGET_MS = float(os.getenv("WRITE_TARGET_MS", "250"))
+READ_QUEUE_TIMEOUT_MS = float(os.getenv("READ_QUEUE_TIMEOUT_MS", str(ADMISSION_QUEUE_TIMEOUT_MS)))
+WRITE_QUEUE_TIMEOUT_MS = float(os.getenv("WRITE_QUEUE_TIMEOUT_MS", str(ADMISSION_QUEUE_TIMEOUT_MS)))
+
+AUTH_PATHS = ("/users/login", "/users/register")
+EXPORT_PATHS = ("/calculations/export",)
+# Never limited; feed streams stay open indefinitely and would each pin a read slot
+EXEMPT_PREFIXES = ("/health", "/metrics", "/docs", "/redoc", "/openapi.json", "/calculations/feed")
+READ_METHODS = ("GET", "HEAD")
+
+
+class Shed(Exception):
+    """Raised when a request is rejected instead of admitted."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with a bounded FIFO wait queue and AIMD adjustment."""
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        target_ms: float,
+        max_limit: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        queue_timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+        min_limit: float = 1,
+        backoff: float = ADMISSION_BACKOFF,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit if max_limit is not None else initial * ADMISSION_MAX_FACTOR
+        self.target = target_ms / 1000
+        self.queue_size = queue_size if queue_size is not None else initial
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.backoff = backoff
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+        # Requests may run on different event loops (threads) under test clients
+        self._lock = threading.Lock()
+        admission_limit.set(self.limit, name)
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue until the deadline; raises Shed otherwise."""
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                admission_in_flight.set(self.in_flight, self.name)
+                return
+            if len(self._waiters) >= self.queue_size:
+                raise Shed("queue_full")
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    raise Shed("timeout")
+            # The slot was handed over just as the deadline passed; keep it
+        except BaseException:
+            # Cancelled, e.g. the client disconnected: leave the queue, or
+            # give back a slot that was already handed over
+            with self._lock:
+                granted = future not in self._waiters
+                if not granted:
+                    self._waiters.remove(future)
+            if granted:
+                self.release(None)
+            raise
+
+    def release(self, latency: Optional[float]):
+        """Return a slot, adapt the limit to the request's latency and admit waiters.
+
+        A latency of None returns the slot of a request that never ran
+        without adapting the limit.
+        """
+        granted = []
+        with self._lock:
+            saturated = self.in_flight >= int(self.limit) or bool(self._waiters)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency is None:
+                pass
+            elif latency > self.target:
+                if now - self._last_decrease >= self.target:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif saturated:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            while self._waiters and self.in_flight < int(self.limit):
+                granted.append(self._waiters.popleft())
+                self.in_flight += 1
+            admission_limit.set(self.limit, self.name)
+            admission_in_flight.set(self.in_flight, self.name)
+
+        for future in granted:
+            future.get_loop().call_soon_threadsafe(_grant, future)
+
+
+def default_limiters() -> Dict[str, AdaptiveLimiter]:
+    return {
+        "auth": AdaptiveLimiter(
+            "auth", AUTH_CONCURRENCY, AUTH_TARGET_MS,
+            queue_size=HASH_QUEUE_DEPTH,
+            queue_timeout_ms=max(AUTH_QUEUE_TIMEOUT_MS, AUTH_TARGET_MS),
+            min_limit=max(HASH_POOL_SIZE, 1),
+        ),
+        "exports": AdaptiveLimiter(
+            "exports", EXPORT_CONCURRENCY, EXPORT_TARGET_MS,
+            queue_timeout_ms=max(EXPORT_QUEUE_TIMEOUT_MS, EXPORT_TARGET_MS),
+        ),
+        "reads": AdaptiveLimiter("reads", READ_CONCURRENCY, READ_TARGET_MS, queue_timeout_ms=READ_QUEUE_TIMEOUT_MS),
+        "writes": AdaptiveLimiter("writes", WRITE_CONCURRENCY, WRITE_TARGET_MS, queue_timeout_ms=WRITE_QUEUE_TIMEOUT_MS),
+    }
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Budget a request is admitted under, or None for requests that are never limited."""
+    if method == "OPTIONS" or path == "/" or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path.startswith(AUTH_PATHS):
+        return "auth"
+    if path.startswith(EXPORT_PATHS):
+        return "exports"
+    return "reads" if method in READ_METHODS else "writes"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests through their route class's limiter."""
+
+    def __init__(self, app, limiters: Optional[Dict[str, AdaptiveLimiter]] = None, enabled: bool = ADMISSION_CONTROL):
+        self.app = app
+        self.limiters = limiters if limiters is not None else default_limiters()
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        budget = route_class(scope["method"], scope["path"]) if scope["type"] == "http" and self.enabled else None
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self.limiters[budget]
+        try:
+            await limiter.acquire()
+        except Shed as e:
+            admission_shed.inc(1, budget, e.reason)
+            await _send_busy(send)
+            return
+
+        start = time.perf_counter()
+        first_byte = None
+
+        async def send_wrapper(message):
+            nonlocal first_byte
+            if message["type"] == "http.response.start" and first_byte is None:
+                first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Time to first byte, so long streamed exports do not read as slow
+            limiter.release((first_byte or time.perf_counter()) - start)
+
+
+async def _send_busy(send):
+    body = orjson.dumps({"detail": "Server is busy, retry shortly"})
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", b"1"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# memory (in-process LRU), redis (shared, needs the redis package) or none
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+
+
+class CacheBackend:
+    """Interface for caches of serialized response payloads."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Return hit/miss/eviction counters."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class LRUCache(CacheBackend):
+    """In-process LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["entries"] = len(self._entries)
+        return stats
+
+
+class RedisCache(CacheBackend):
+    """Cache shared by all workers, backed by Redis; Redis handles expiry and eviction."""
+
+    def __init__(self, url: str = CACHE_URL, ttl: float = CACHE_TTL_SECONDS):
+        super().__init__()
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.client.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes):
+        self.client.set(key, value, px=int(self.ttl * 1000))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    """Create the cache backend selected by configuration."""
+    if backend == "redis":
+        return RedisCache()
+    if backend == "none":
+        return LRUCache(max_entries=0)
+    if backend == "memory":
+        return LRUCache()
+    raise ValueError(f"Invalid CACHE_BACKEND: {backend}")
+
+
+cache = create_cache()
+
+
+def calculation_key(calculation_id: int) -> str:
+    """Cache key for a serialized CalculationRead payload."""
+    return f"calculation:{calculation_id}"
+
+
+def user_key(user_id: int) -> str:
+    """Cache key for a serialized UserRead payload."""
+    return f"user:{user_id}"
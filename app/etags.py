@@ -0,0 +1,56 @@
+"""Strong ETags and If-None-Match handling for calculation reads.
+
+A single calculation's tag is derived from (id, updated_at). A page's tag
+comes from the row count, newest updated_at and ID range of the rows it
+contains. Both can be computed from a small metadata query, so a
+conditional request that matches gets a 304 without loading or
+serializing the rows.
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+from fastapi import Response
+
+
+def _tag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def _timestamp(value) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.isoformat() if value is not None else ""
+
+
+def row_etag(calculation_id: int, updated_at) -> str:
+    """ETag of one calculation."""
+    return _tag("calculation", calculation_id, _timestamp(updated_at))
+
+
+def page_etag(count: int, max_updated_at, min_id: Optional[int], max_id: Optional[int]) -> str:
+    """ETag of a page of calculations, from aggregates over its rows."""
+    return _tag("page", count, _timestamp(max_updated_at), min_id, max_id)
+
+
+def rows_page_etag(rows) -> str:
+    """Page ETag computed from rows already loaded, matching page_etag's metadata query."""
+    if not rows:
+        return page_etag(0, None, None, None)
+    updated = [row.updated_at for row in rows if row.updated_at is not None]
+    return page_etag(
+        len(rows), max(updated) if updated else None, min(row.id for row in rows), max(row.id for row in rows)
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against a tag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    """304 response carrying the current tag."""
+    return Response(status_code=304, headers={"ETag": etag})
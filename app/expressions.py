@@ -0,0 +1,194 @@
+import ast
+import math
+import os
+import string
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import Float, func, literal
+
+# Limits that keep parsing and evaluation cost bounded
+MAX_EXPRESSION_LENGTH = 200
+MAX_EXPRESSION_NODES = 64
+EXPRESSION_CACHE_SIZE = int(os.getenv("EXPRESSION_CACHE_SIZE", "1024"))
+
+# Operands are bound positionally to a, b, c, ... (a = operand1, b = operand2)
+VARIABLES = string.ascii_lowercase
+# Operands a stored calculation has, so its operation may only read a and b
+STORED_OPERANDS = 2
+
+# Named operations handled by the fast paths in app.utils
+BASIC_OPERATIONS = ("add", "subtract", "multiply", "divide")
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod)
+_UNARY_OPERATORS = (ast.UAdd, ast.USub)
+_FUNCTIONS = ("sqrt", "abs")
+
+
+def _scalar_pow(base: float, exponent: float) -> float:
+    """Real-valued power; math.pow raises instead of returning complex numbers."""
+    return math.pow(base, exponent)
+
+
+_SCALAR_NAMESPACE = {"__builtins__": {}, "_pow": _scalar_pow, "sqrt": math.sqrt, "abs": abs}
+_VECTOR_NAMESPACE = {"__builtins__": {}, "_pow": np.power, "sqrt": np.sqrt, "abs": np.abs}
+
+
+class _PowToCall(ast.NodeTransformer):
+    """Rewrite ``x ** y`` as ``_pow(x, y)`` so each namespace picks its implementation."""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.Call(func=ast.Name(id="_pow", ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return node
+
+
+def _validate(tree: ast.Expression) -> int:
+    """Check the tree only uses supported syntax and return the number of operands it reads."""
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_EXPRESSION_NODES:
+        raise ValueError("Expression is too complex")
+
+    called = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    arity = 0
+    for node in nodes:
+        if isinstance(node, (ast.Expression, ast.Load)) or isinstance(node, _BINARY_OPERATORS + _UNARY_OPERATORS):
+            continue
+        if isinstance(node, ast.BinOp) and isinstance(node.op, _BINARY_OPERATORS):
+            continue
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, _UNARY_OPERATORS):
+            continue
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            node.value = float(node.value)
+            continue
+        if isinstance(node, ast.Call):
+            if (
+                isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS
+                and len(node.args) == 1 and not node.keywords
+            ):
+                continue
+            raise ValueError("Unsupported function call in expression")
+        if isinstance(node, ast.Name):
+            if node.id in _FUNCTIONS and id(node) in called:
+                continue
+            if len(node.id) == 1 and node.id in VARIABLES:
+                arity = max(arity, VARIABLES.index(node.id) + 1)
+                continue
+            raise ValueError(f"Unknown variable in expression: {node.id}")
+        raise ValueError(f"Unsupported syntax in expression: {type(node).__name__}")
+    return arity
+
+
+class CompiledExpression:
+    """An arithmetic expression compiled once into scalar and vectorized evaluators."""
+
+    def __init__(self, text: str):
+        if len(text) > MAX_EXPRESSION_LENGTH:
+            raise ValueError("Expression is too long")
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError:
+            raise ValueError(f"Invalid expression: {text}")
+
+        self.text = text
+        self.arity = _validate(tree)
+        params = ", ".join(VARIABLES[:self.arity])
+        lambda_tree = ast.Expression(body=ast.Lambda(
+            args=ast.parse(f"lambda {params}: 0", mode="eval").body.args,
+            body=_PowToCall().visit(tree.body),
+        ))
+        self._body = lambda_tree.body.body
+        code = compile(ast.fix_missing_locations(lambda_tree), "<expression>", "eval")
+        self._scalar = eval(code, dict(_SCALAR_NAMESPACE))
+        self._vector = eval(code, dict(_VECTOR_NAMESPACE))
+
+    def _check_arity(self, count: int):
+        if count < self.arity:
+            raise ValueError(f"Expression needs {self.arity} operands, got {count}")
+
+    def evaluate(self, *operands: float) -> float:
+        """Evaluate the expression for one operand set."""
+        self._check_arity(len(operands))
+        try:
+            result = self._scalar(*operands[:self.arity])
+        except ZeroDivisionError:
+            raise ValueError("Division by zero is not allowed")
+        except OverflowError:
+            raise ValueError("Result is out of range")
+        except (ValueError, TypeError):
+            raise ValueError("Expression is undefined for these operands")
+        if not math.isfinite(result):
+            raise ValueError("Result is out of range")
+        return float(result)
+
+    def evaluate_many(self, operand_columns: Sequence[Sequence[float]]) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """Evaluate the expression over many operand sets in one vectorized pass.
+
+        ``operand_columns[i]`` holds the values of the i-th operand for every
+        row. Returns the results and a per-row error message (or None); rows
+        whose result is not a finite number get an error and a NaN result.
+        """
+        self._check_arity(len(operand_columns))
+        columns = [np.asarray(column, dtype=np.float64) for column in operand_columns[:self.arity]]
+        rows = len(operand_columns[0]) if operand_columns else 0
+        with np.errstate(all="ignore"):
+            results = np.broadcast_to(np.asarray(self._vector(*columns), dtype=np.float64), (rows,)).copy()
+
+        invalid = ~np.isfinite(results)
+        results[invalid] = np.nan
+        errors = [None] * rows
+        for i in np.flatnonzero(invalid):
+            errors[i] = "Expression is undefined for these operands"
+        return results, errors
+
+    def to_sql(self, *operands):
+        """Translate the expression into a SQL expression over the given operand columns.
+
+        Errors surface from the database instead: Postgres raises on division
+        by zero or out-of-domain input, SQLite returns NULL.
+        """
+        self._check_arity(len(operands))
+        return _to_sql(self._body, operands)
+
+
+def _to_sql(node, operands):
+    """Build the SQL expression for one validated node."""
+    if isinstance(node, ast.Constant):
+        return literal(node.value, Float)
+    if isinstance(node, ast.Name):
+        return operands[VARIABLES.index(node.id)]
+    if isinstance(node, ast.UnaryOp):
+        operand = _to_sql(node.operand, operands)
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.Call):
+        args = [_to_sql(arg, operands) for arg in node.args]
+        sql_function = {"_pow": func.power, "sqrt": func.sqrt, "abs": func.abs}[node.func.id]
+        return sql_function(*args, type_=Float)
+
+    left, right = _to_sql(node.left, operands), _to_sql(node.right, operands)
+    if isinstance(node.op, ast.Add):
+        return left + right
+    if isinstance(node.op, ast.Sub):
+        return left - right
+    if isinstance(node.op, ast.Mult):
+        return left * right
+    if isinstance(node.op, ast.Div):
+        return left / right
+    # Python's float modulo takes the sign of the divisor, unlike SQL's
+    return left - right * func.floor(left / right, type_=Float)
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(text: str) -> CompiledExpression:
+    """Compile an expression, reusing the cached form for repeated expression text."""
+    return CompiledExpression(text)
+
+
+def validate_operation(operation: str) -> str:
+    """Accept a named operation or an expression in a and b that compiles; raise ValueError otherwise."""
+    if operation not in BASIC_OPERATIONS:
+        arity = compile_expression(operation).arity
+        if arity > STORED_OPERANDS:
+            raise ValueError(f"Expression may only use a and b, it reads {arity} operands")
+    return operation
@@ -0,0 +1,268 @@
+"""Live per-user calculation feed, fanned out in process.
+
+add, edit and delete, single, batch and bulk, publish each committed
+change to the process-wide ``broker``. Every open ``GET /calculations/feed`` stream holds a
+subscription with a bounded queue of pre-encoded Server-Sent Events frames.
+A subscriber that falls FEED_QUEUE_SIZE events behind is evicted. It gets a
+final ``evicted`` event and should re-sync with a browse before
+reconnecting, so one slow client never holds memory or slows publishers.
+
+With FEED_BRIDGE=postgres, publishes go out through ``NOTIFY`` on
+FEED_CHANNEL instead. Every worker ``LISTEN``s and fans the notifications
+out to its own subscribers, so a client sees changes made through any
+worker.
+"""
+import asyncio
+import logging
+import os
+import queue
+import select
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Set
+import orjson
+from app.metrics import feed_evictions, feed_subscribers
+from app.serialization import calculation_dict
+
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "100"))
+FEED_HEARTBEAT_SECONDS = float(os.getenv("FEED_HEARTBEAT_SECONDS", "15"))
+# none (in-process only) or postgres (LISTEN/NOTIFY between workers)
+FEED_BRIDGE = os.getenv("FEED_BRIDGE", "none").lower()
+FEED_CHANNEL = os.getenv("FEED_CHANNEL", "calculation_feed")
+
+HEARTBEAT = b": keep-alive\n\n"
+EVICTED = b'event: evicted\ndata: {"detail":"Too far behind, re-sync and reconnect"}\n\n'
+
+logger = logging.getLogger(__name__)
+
+
+def sse_frame(event: str, data: bytes) -> bytes:
+    """Encode one Server-Sent Events message."""
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class Subscription:
+    """One feed stream's bounded queue of frames, filled from any thread."""
+
+    def __init__(self, broker: "FeedBroker", user_id: int, max_queued: int):
+        self.broker = broker
+        self.user_id = user_id
+        self.max_queued = max_queued
+        self.evicted = False
+        self._frames: deque = deque()
+        self._lock = threading.Lock()
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def offer(self, frame: bytes) -> bool:
+        """Queue a frame; returns False once the subscriber has been evicted."""
+        with self._lock:
+            if self.evicted:
+                return False
+            if len(self._frames) >= self.max_queued:
+                self.evicted = True
+                self._frames.clear()
+            else:
+                self._frames.append(frame)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The stream's event loop is gone
+            self.evicted = True
+        return not self.evicted
+
+    async def next_frames(self, timeout: Optional[float] = None) -> List[bytes]:
+        """Wait up to ``timeout`` seconds for frames and return everything queued."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+        return frames
+
+
+class FeedBroker:
+    """In-process pub/sub from calculation writes to per-user subscriptions."""
+
+    def __init__(self, max_queued: int = FEED_QUEUE_SIZE):
+        self.max_queued = max_queued
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a subscription for a user's changes; call from the stream's event loop."""
+        subscription = Subscription(self, user_id, self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        feed_subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a subscription; safe to call more than once."""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if not subscribers or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+        feed_subscribers.dec()
+
+    def deliver(self, user_id: int, frame: bytes) -> int:
+        """Offer a frame to every subscriber of ``user_id``, evicting the ones that fell behind."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        delivered = 0
+        for subscription in subscribers:
+            if subscription.offer(frame):
+                delivered += 1
+            else:
+                feed_evictions.inc()
+                self.unsubscribe(subscription)
+        return delivered
+
+    def subscriber_count(self) -> int:
+        """Number of open subscriptions across all users."""
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class PostgresBridge:
+    """Carries feed events between workers over Postgres LISTEN/NOTIFY."""
+
+    def __init__(self, url: str, broker: FeedBroker, channel: str = FEED_CHANNEL):
+        self.url = url
+        self.broker = broker
+        self.channel = channel
+        self._outbox: queue.Queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the listening and notifying threads."""
+        for target, name in ((self._listen, "feed-listen"), (self._notify, "feed-notify")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop both threads after the queued notifications are sent."""
+        self._stopped.set()
+        self._outbox.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def publish(self, user_id: int, event: str, data: bytes):
+        """Queue an event for NOTIFY; it reaches this worker's subscribers through LISTEN."""
+        # data is already JSON, so it is spliced in rather than decoded and re-encoded
+        self._outbox.put(b'{"user_id":%d,"event":%s,"data":%s}' % (user_id, orjson.dumps(event), data))
+
+    def dispatch(self, payload: str):
+        """Deliver one notification payload to local subscribers."""
+        message = orjson.loads(payload)
+        self.broker.deliver(message["user_id"], sse_frame(message["event"], orjson.dumps(message["data"])))
+
+    def _connect(self):
+        import psycopg2
+        from sqlalchemy.engine import make_url
+
+        url = make_url(self.url).set(drivername="postgresql")
+        connection = psycopg2.connect(url.render_as_string(hide_password=False))
+        connection.autocommit = True
+        return connection
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                while not self._stopped.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(connection.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Feed listener lost its connection, reconnecting")
+                self._stopped.wait(1.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def _notify(self):
+        connection = None
+        while True:
+            payload = self._outbox.get()
+            if payload is None:
+                break
+            try:
+                connection = connection or self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, payload.decode()))
+            except Exception:
+                logger.exception("Feed notification dropped")
+                connection = None
+        if connection is not None:
+            connection.close()
+
+
+broker = FeedBroker()
+bridge: Optional[PostgresBridge] = None
+
+
+def publish(user_id: int, event: str, data: bytes):
+    """Publish a committed change to the user's feed subscribers on every worker."""
+    if bridge is not None:
+        bridge.publish(user_id, event, data)
+    else:
+        broker.deliver(user_id, sse_frame(event, data))
+
+
+def publish_calculation(event: str, calculation):
+    """Publish a created or updated calculation row."""
+    publish(calculation.user_id, event, orjson.dumps(calculation_dict(calculation)))
+
+
+def publish_deleted(user_id: int, calculation_id: int):
+    """Publish the deletion of a calculation."""
+    publish(user_id, "deleted", orjson.dumps({"id": calculation_id}))
+
+
+def start_bridge(url: Optional[str] = None) -> Optional[PostgresBridge]:
+    """Start the LISTEN/NOTIFY bridge when FEED_BRIDGE=postgres."""
+    global bridge
+    if FEED_BRIDGE != "postgres":
+        return None
+    if url is None:
+        from app.database import DATABASE_URL as url
+    bridge = PostgresBridge(url, broker)
+    bridge.start()
+    return bridge
+
+
+def stop_bridge():
+    """Stop the bridge, if one is running."""
+    global bridge
+    if bridge is not None:
+        current, bridge = bridge, None
+        current.stop()
+
+
+async def stream(subscription: Subscription, heartbeat: float = FEED_HEARTBEAT_SECONDS):
+    """Yield a subscription's frames as they arrive, with heartbeats while idle."""
+    try:
+        yield b"retry: 1000\n\n"
+        while True:
+            frames = await subscription.next_frames(heartbeat)
+            if subscription.evicted:
+                yield EVICTED
+                return
+            yield b"".join(frames) if frames else HEARTBEAT
+    finally:
+        subscription.broker.unsubscribe(subscription)
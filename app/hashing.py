@@ -0,0 +1,152 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+from app.metrics import password_hash_time
+from app.utils import pwd_context, verify_password
+
+# Worker processes for bcrypt; 0 runs hashing inline in the calling thread.
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a free worker before requests are rejected with 503.
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", "16"))
+# Startup calibration picks the bcrypt cost whose hash time is closest to this target.
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = int(os.getenv("BCRYPT_MIN_ROUNDS", "12"))
+BCRYPT_MAX_ROUNDS = int(os.getenv("BCRYPT_MAX_ROUNDS", "16"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_slots = threading.BoundedSemaphore(max(HASH_POOL_SIZE, 1) + HASH_QUEUE_DEPTH)
+_lock = threading.Lock()
+
+
+class HashingPoolSaturated(Exception):
+    """Raised when the hashing pool and its wait queue are full."""
+
+
+def _hash_in_worker(password: str, rounds: int) -> str:
+    """Hash a password with an explicit cost (runs in a worker process)."""
+    return pwd_context.handler("bcrypt").using(rounds=rounds).hash(password)
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    """Return the shared process pool, creating it on first use."""
+    global _executor
+    if HASH_POOL_SIZE <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_POOL_SIZE)
+        return _executor
+
+
+def _submit(kind: str, fn, *args) -> Future:
+    """Run fn on the pool, rejecting the job when no queue slot is free."""
+    if not _slots.acquire(blocking=False):
+        raise HashingPoolSaturated("Password hashing is busy, retry shortly")
+    start = time.perf_counter()
+
+    def _release(_):
+        _slots.release()
+        password_hash_time.observe(time.perf_counter() - start, kind)
+
+    executor = _get_executor()
+    if executor is None:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            _release(future)
+        return future
+
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+def submit_hash(password: str) -> Future:
+    """Schedule hashing a password at the current calibrated cost."""
+    return _submit("hash", _hash_in_worker, password, current_rounds())
+
+
+def submit_verify(plain_password: str, hashed_password: str) -> Future:
+    """Schedule verifying a password against its hash."""
+    return _submit("verify", verify_password, plain_password, hashed_password)
+
+
+def hash_password_offloaded(password: str) -> str:
+    """Hash a password on the pool, blocking the calling thread until done."""
+    return submit_hash(password).result()
+
+
+def verify_password_offloaded(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the pool, blocking the calling thread until done."""
+    return submit_verify(plain_password, hashed_password).result()
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the pool without blocking the event loop."""
+    return await asyncio.wrap_future(submit_hash(password))
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the pool without blocking the event loop."""
+    return await asyncio.wrap_future(submit_verify(plain_password, hashed_password))
+
+
+def current_rounds() -> int:
+    """Return the bcrypt cost new hashes are created with."""
+    return pwd_context.handler("bcrypt").default_rounds
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Check whether a stored hash uses an outdated cost or scheme."""
+    return pwd_context.needs_update(hashed_password)
+
+
+def calibrate_bcrypt(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """Pick the bcrypt cost closest to target_ms on this machine and apply it.
+
+    Each extra round doubles the hash time, so one cheap probe is enough to
+    extrapolate. The result is clamped to BCRYPT_MIN_ROUNDS..BCRYPT_MAX_ROUNDS
+    and also becomes the minimum accepted cost, so older, cheaper hashes are
+    flagged by needs_rehash.
+    """
+    probe_rounds = 8
+    start = time.perf_counter()
+    _hash_in_worker("calibration-probe", probe_rounds)
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.001)
+
+    rounds = probe_rounds + round(math.log2(target_ms / elapsed_ms))
+    rounds = max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, rounds))
+    pwd_context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+    return rounds
+
+
+def warm_up_pool():
+    """Start every worker process and run one bcrypt verify in each."""
+    dummy_hash = _hash_in_worker("warm-up", 4)
+    executor = _get_executor()
+    if executor is None:
+        verify_password("warm-up", dummy_hash)
+        return
+    futures = [executor.submit(verify_password, "warm-up", dummy_hash) for _ in range(HASH_POOL_SIZE)]
+    for future in futures:
+        future.result()
+
+
+def shutdown_pool():
+    """Stop the worker processes."""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,190 @@
+"""Replay of stored responses for requests sent with an ``Idempotency-Key`` header.
+
+The first request with a key stores its response in the idempotency_keys
+table in the same transaction as its write. A retry with the same key gets
+that response back without redoing the work. The primary key on
+(scope, key) makes concurrent duplicates safe: the request that loses the
+race rolls back its own write and replays the winner's response. When the
+write itself conflicts first, e.g. on a unique username,
+``replay_after_conflict`` finds the winner's response the same way.
+
+Recent responses are also kept in an in-process LRU front cache, so most
+retries skip the database. Rows expire after IDEMPOTENCY_TTL_SECONDS. Run
+``python -m app.idempotency purge`` to delete expired rows in bulk.
+"""
+import argparse
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+import orjson
+from fastapi import Response
+from sqlalchemy import and_, delete, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.cache import LRUCache
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_ENTRIES = int(os.getenv("IDEMPOTENCY_CACHE_ENTRIES", "10000"))
+IDEMPOTENCY_CACHE_SECONDS = float(os.getenv("IDEMPOTENCY_CACHE_SECONDS", "300"))
+MAX_KEY_LENGTH = 255
+
+front_cache = LRUCache(
+    max_entries=IDEMPOTENCY_CACHE_ENTRIES, ttl=min(IDEMPOTENCY_CACHE_SECONDS, IDEMPOTENCY_TTL_SECONDS)
+)
+
+
+class IdempotencyKeyMismatch(Exception):
+    """Raised when a key is reused with a different request."""
+
+
+class StoredResponse(NamedTuple):
+    """A response recorded under an idempotency key."""
+    fingerprint: str
+    status_code: int
+    body: bytes
+
+
+def fingerprint(*parts) -> str:
+    """Digest the request fields a key must be reused with."""
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _front_key(scope: str, key: str) -> str:
+    return f"{scope}:{key}"
+
+
+def _remember(scope: str, key: str, stored: StoredResponse):
+    front_cache.set(_front_key(scope, key), orjson.dumps(
+        {"fingerprint": stored.fingerprint, "status_code": stored.status_code, "body": stored.body.decode()}
+    ))
+
+
+def _checked(stored: StoredResponse, request_fingerprint: str) -> StoredResponse:
+    if stored.fingerprint != request_fingerprint:
+        raise IdempotencyKeyMismatch("Idempotency-Key was already used with a different request")
+    return stored
+
+
+def _load(connection: Connection, scope: str, key: str) -> Optional[StoredResponse]:
+    """Read a stored response from the table, deleting it if it has expired."""
+    row_filter = and_(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+    row = connection.execute(
+        select(
+            IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response,
+            IdempotencyKey.expires_at,
+        ).where(row_filter)
+    ).first()
+    if row is None:
+        return None
+    if row.expires_at < datetime.utcnow():
+        connection.execute(delete(IdempotencyKey).where(row_filter, IdempotencyKey.expires_at == row.expires_at))
+        return None
+    stored = StoredResponse(row.fingerprint, row.status_code, bytes(row.response))
+    _remember(scope, key, stored)
+    return stored
+
+
+def find_response(db: Session, scope: str, key: Optional[str], request_fingerprint: str) -> Optional[StoredResponse]:
+    """Return the response stored for key, checking the front cache before the table.
+
+    Raises IdempotencyKeyMismatch when the key belongs to a different request.
+    """
+    if key is None:
+        return None
+    cached = front_cache.get(_front_key(scope, key))
+    if cached is not None:
+        entry = orjson.loads(cached)
+        stored = StoredResponse(entry["fingerprint"], entry["status_code"], entry["body"].encode())
+        return _checked(stored, request_fingerprint)
+
+    stored = _load(db.connection(), scope, key)
+    return None if stored is None else _checked(stored, request_fingerprint)
+
+
+def commit_with_response(
+    db: Session, scope: str, key: Optional[str], request_fingerprint: str, status_code: int, body: bytes
+) -> Optional[StoredResponse]:
+    """Store the response under key and commit it together with the request's write.
+
+    The write must still be pending on ``db``; a row already committed
+    elsewhere, e.g. by the group-commit buffer, would survive a lost race.
+
+    Returns None when this request's response was stored. If a concurrent
+    request already claimed the key, this request's write is rolled back and
+    the other request's response is returned instead.
+    """
+    if key is None:
+        db.commit()
+        return None
+
+    stored = StoredResponse(request_fingerprint, status_code, body)
+    try:
+        db.execute(insert(IdempotencyKey).values(
+            scope=scope,
+            key=key,
+            fingerprint=request_fingerprint,
+            status_code=status_code,
+            response=body,
+            expires_at=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        winner = _load(db.connection(), scope, key)
+        db.commit()
+        if winner is None:
+            raise
+        return _checked(winner, request_fingerprint)
+
+    _remember(scope, key, stored)
+    return None
+
+
+def replay_after_conflict(
+    db: Session, scope: str, key: Optional[str], request_fingerprint: str
+) -> Optional[StoredResponse]:
+    """Return the response of a concurrent request with the same key whose write beat this one.
+
+    Call after rolling back a write that hit a unique constraint. Returns
+    None when there is no key or no stored response, so the conflict is a
+    genuine error.
+    """
+    if key is None:
+        return None
+    stored = _load(db.connection(), scope, key)
+    db.commit()
+    return None if stored is None else _checked(stored, request_fingerprint)
+
+
+def replay_response(stored: StoredResponse) -> Response:
+    """Build the response for a replayed request."""
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def purge_expired(connection: Connection) -> int:
+    """Delete every expired key with one statement and return how many were removed."""
+    return connection.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())).rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain stored idempotency keys.")
+    parser.add_argument("command", choices=["purge"])
+    parser.parse_args(argv)
+
+    from app.database import engine
+
+    with engine.begin() as connection:
+        removed = purge_expired(connection)
+    print(f"Removed {removed} expired idempotency keys")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Write-behind group commit for calculation inserts.
+
+With ``INGEST_MODE=group``, add_calculation hands its row to a bounded
+in-process buffer instead of committing on its own. A background thread
+collects rows until INGEST_BATCH_ROWS are waiting or INGEST_FLUSH_MS have
+passed since the first one, then inserts the whole group with one bulk
+``INSERT ... RETURNING`` and a single commit. Each waiting request resolves
+with its stored row once its group has committed, so the fsync cost is
+shared by the group.
+
+When the buffer is full, submitters wait up to INGEST_ENQUEUE_TIMEOUT
+seconds and are then rejected with IngestBufferFull (served as 503).
+Stopping the buffer flushes every row already accepted. Requests with an
+Idempotency-Key bypass the buffer, since their key must commit with the row.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+from sqlalchemy import insert, select
+from app.metrics import ingest_flush_time, ingest_group_size
+from app.models import Calculation, User
+from app.serialization import CALCULATION_COLUMNS
+from app.stats import record_inserted
+
+# direct (each request commits) or group (write-behind group commit)
+INGEST_MODE = os.getenv("INGEST_MODE", "direct").lower()
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "500"))
+INGEST_FLUSH_MS = float(os.getenv("INGEST_FLUSH_MS", "5"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_ENQUEUE_TIMEOUT = float(os.getenv("INGEST_ENQUEUE_TIMEOUT", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBufferFull(Exception):
+    """Raised when the buffer cannot accept a row in time or is shutting down."""
+
+
+class UnknownUser(Exception):
+    """Raised for a buffered row whose user does not exist."""
+
+
+class GroupCommitBuffer:
+    """Bounded queue of calculation rows flushed in groups by a background thread."""
+
+    def __init__(
+        self,
+        bind,
+        batch_rows: int = INGEST_BATCH_ROWS,
+        flush_ms: float = INGEST_FLUSH_MS,
+        max_pending: int = INGEST_QUEUE_SIZE,
+    ):
+        self.bind = bind
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_ms / 1000
+        self.flushes = 0
+        self._queue: "queue.Queue[Tuple[dict, Future]]" = queue.Queue(maxsize=max_pending)
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the flusher thread."""
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, row: dict, timeout: float = INGEST_ENQUEUE_TIMEOUT) -> Future:
+        """Queue a row; the future resolves with its stored row after the group commits.
+
+        Waits up to ``timeout`` seconds for room in the buffer (0 never waits).
+        """
+        if self._closed.is_set():
+            raise IngestBufferFull("Calculation ingestion is shutting down")
+        future = Future()
+        try:
+            if timeout > 0:
+                self._queue.put((row, future), timeout=timeout)
+            else:
+                self._queue.put_nowait((row, future))
+        except queue.Full:
+            raise IngestBufferFull("Calculation ingestion is busy, retry shortly")
+        return future
+
+    def close(self):
+        """Stop accepting rows and flush everything already queued."""
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Rows queued while the flusher was exiting, or without a running flusher
+        while True:
+            batch = self._collect(deadline=None)
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _collect(self, deadline: Optional[float]) -> List[Tuple[dict, Future]]:
+        """Take up to batch_rows queued rows, waiting for more until the deadline."""
+        batch = []
+        while len(batch) < self.batch_rows:
+            try:
+                if deadline is None:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first] + self._collect(time.monotonic() + self.flush_seconds)
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[dict, Future]]):
+        """Insert one group in a single transaction and resolve its futures."""
+        start = time.perf_counter()
+        try:
+            with self.bind.begin() as connection:
+                # Rows for unknown users are rejected up front so they cannot fail the group
+                user_ids = {row["user_id"] for row, _ in batch}
+                known = set(connection.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+                accepted = [(row, future) for row, future in batch if row["user_id"] in known]
+                stored = []
+                if accepted:
+                    rows = [row for row, _ in accepted]
+                    stmt = insert(Calculation).returning(*CALCULATION_COLUMNS, sort_by_parameter_order=True)
+                    stored = connection.execute(stmt, rows).all()
+                    record_inserted(connection, [row._asdict() for row in stored])
+        except Exception as e:
+            logger.exception("Flushing %d buffered calculations failed", len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.flushes += 1
+        ingest_group_size.observe(len(accepted))
+        ingest_flush_time.observe(time.perf_counter() - start)
+        for (_, future), row in zip(accepted, stored):
+            future.set_result(row)
+        for row, future in batch:
+            if row["user_id"] not in known:
+                future.set_exception(UnknownUser(row["user_id"]))
+
+
+buffer: Optional[GroupCommitBuffer] = None
+
+
+def start_buffer(bind=None) -> GroupCommitBuffer:
+    """Create and start the process-wide buffer used by add_calculation."""
+    global buffer
+    if bind is None:
+        from app.database import engine as bind
+    buffer = GroupCommitBuffer(bind)
+    buffer.start()
+    return buffer
+
+
+def stop_buffer():
+    """Flush and stop the process-wide buffer, if one is running."""
+    global buffer
+    if buffer is not None:
+        current, buffer = buffer, None
+        current.close()
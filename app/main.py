@@ -1,7 +1,70 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import init_db
-from app.routes import users, calculations
+from fastapi.responses import JSONResponse, PlainTextResponse
+import os
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import text
+from app import feed, ingest, rollups
+from app.admission import AdmissionMiddleware
+from app.cache import cache
+from app.database import ensure_schema, warm_pool, DATABASE_MODE, engine, pool_status
+import app.database as database
+from app.idempotency import IdempotencyKeyMismatch
+from app.ingest import IngestBufferFull
+from app.hashing import HashingPoolSaturated, calibrate_bcrypt, shutdown_pool, warm_up_pool
+from app.partitions import prepare_partitions
+from app.replicas import ReadYourWritesMiddleware, replica_set
+from app.metrics import MetricsMiddleware, render_metrics, render_pool_metrics, startup_time
+from app.routes import users, calculations, async_users, async_calculations
+from app.schemas import CalculationCreate, CalculationRead, UserCreate, UserRead
+
+
+def warm_validators():
+    """Run each request/response schema once so first requests skip lazy setup."""
+    UserCreate(username="warmup", email="warmup@example.com", password="warmup-password")
+    UserRead(id=1, username="warmup", email="warmup@example.com", created_at="2024-01-01T00:00:00")
+    CalculationCreate(operation="divide", operand1=1, operand2=2)
+    CalculationCreate(operation="a ** b", operand1=1, operand2=2)
+    CalculationRead(
+        id=1, operation="add", operand1=1, operand2=2, result=3, user_id=1,
+        created_at="2024-01-01T00:00:00", updated_at="2024-01-01T00:00:00",
+    ).model_dump_json()
+
+
+def run_startup():
+    """Prepare a worker for traffic, recording how long each phase takes."""
+    started = time.perf_counter()
+    for phase, step in (
+        ("schema", ensure_schema),
+        ("partitions", prepare_partitions),
+        ("pool", warm_pool),
+        ("bcrypt", lambda: (calibrate_bcrypt(), warm_up_pool())),
+        ("validators", warm_validators),
+    ):
+        phase_start = time.perf_counter()
+        step()
+        startup_time.set(time.perf_counter() - phase_start, phase)
+    startup_time.set(time.perf_counter() - started, "total")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Check the schema and warm up the worker on startup; stop background work and the hashing pool on shutdown."""
+    await run_in_threadpool(run_startup)
+    if ingest.INGEST_MODE == "group":
+        ingest.start_buffer()
+    rollups.start_compactor()
+    feed.start_bridge()
+    yield
+    await run_in_threadpool(feed.stop_bridge)
+    await run_in_threadpool(rollups.stop_compactor)
+    await run_in_threadpool(ingest.stop_buffer)
+    await database.dispose_async_engine()
+    shutdown_pool()
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -9,9 +72,13 @@ app = FastAPI(
     description="A RESTful API for user registration/login and calculation CRUD operations",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+# Per-class concurrency limits; added first so CORS headers wrap its 503s
+app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware configuration
 app.add_middleware(
     CORSMiddleware,
@@ -21,15 +88,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, in-flight and SQL metrics, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Pins a client's reads to the primary for a short while after its own writes
+app.add_middleware(ReadYourWritesMiddleware)
+
+
+def with_async_overrides(sync_router: APIRouter, async_router: APIRouter) -> APIRouter:
+    """Swap in the async handlers for every route the async router also defines.
+
+    Routes keep the order of the sync router, so endpoints without an async
+    twin are still served and path matching behaves the same in both modes.
+    """
+    overrides = {(route.path, frozenset(route.methods)): route for route in async_router.routes}
+    merged = APIRouter()
+    merged.routes = [
+        overrides.get((route.path, frozenset(route.methods)), route)
+        for route in sync_router.routes
+    ]
+    return merged
+
+
 # Include routers
-app.include_router(users.router)
-app.include_router(calculations.router)
+if DATABASE_MODE == "async":
+    app.include_router(with_async_overrides(users.router, async_users.router))
+    app.include_router(with_async_overrides(calculations.router, async_calculations.router))
+else:
+    app.include_router(users.router)
+    app.include_router(calculations.router)
 
 
-@app.on_event("startup")
-def on_startup():
-    """Initialize database on application startup."""
-    init_db()
+@app.exception_handler(HashingPoolSaturated)
+def hashing_pool_saturated_handler(request: Request, exc: HashingPoolSaturated):
+    """Shed auth requests quickly while the hashing pool is saturated."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(IngestBufferFull)
+def ingest_buffer_full_handler(request: Request, exc: IngestBufferFull):
+    """Push back on writers while the group-commit buffer is full."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(IdempotencyKeyMismatch)
+def idempotency_key_mismatch_handler(request: Request, exc: IdempotencyKeyMismatch):
+    """Reject a reused Idempotency-Key whose request differs from the original."""
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={"detail": str(exc)},
+    )
 
 
 @app.get("/", tags=["root"])
@@ -50,3 +166,78 @@ def root():
 def health_check():
     """Health check endpoint."""
     return {"status": "healthy"}
+
+
+# How long a measured DB round trip is reused by /health/ready
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "1"))
+_ready_probe = {"checked_at": 0.0, "latency_ms": None, "error": None}
+_ready_lock = threading.Lock()
+
+
+def probe_database() -> dict:
+    """Measure a SELECT 1 round trip, reusing the last result for READY_CACHE_SECONDS."""
+    with _ready_lock:
+        if time.monotonic() - _ready_probe["checked_at"] < READY_CACHE_SECONDS:
+            return dict(_ready_probe)
+        start = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            _ready_probe.update(latency_ms=round((time.perf_counter() - start) * 1000, 3), error=None)
+        except Exception as e:
+            _ready_probe.update(latency_ms=None, error=type(e).__name__)
+        _ready_probe["checked_at"] = time.monotonic()
+        return dict(_ready_probe)
+
+
+@app.get("/health/ready", tags=["health"])
+def readiness_check():
+    """
+    Readiness probe for load balancers.
+    
+    Reports connection pool usage and a cached DB round-trip latency. Returns
+    503 without touching the database when the pool is exhausted, so a
+    saturated instance is drained instead of queueing more requests.
+    """
+    pools = {"sync": pool_status(engine)}
+    if database.async_engine is not None:
+        pools["async"] = pool_status(database.async_engine.sync_engine)
+    
+    if any(pool.get("exhausted") for pool in pools.values()):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "saturated", "pool": pools},
+            headers={"Retry-After": "1"},
+        )
+    
+    probe = probe_database()
+    if probe["error"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "unavailable", "pool": pools, "error": probe["error"]},
+        )
+    
+    ready = {"status": "ready", "pool": pools, "db_latency_ms": probe["latency_ms"]}
+    if replica_set.replicas:
+        ready["replicas"] = replica_set.status()
+    return ready
+
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics():
+    """Prometheus metrics for this worker process."""
+    pools = {"sync": pool_status(engine)}
+    if database.async_engine is not None:
+        pools["async"] = pool_status(database.async_engine.sync_engine)
+    for replica in replica_set.replicas:
+        pools[replica.name] = pool_status(replica.engine)
+    return PlainTextResponse(
+        render_metrics([render_pool_metrics(pools)]),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.get("/health/cache", tags=["health"])
+def cache_stats():
+    """Read-through cache hit/miss/eviction counters."""
+    return cache.stats()
@@ -0,0 +1,223 @@
+"""In-process metrics exported in the Prometheus text format.
+
+Counters and histograms are plain Python objects guarded by a lock; each
+observation is a bisect plus a few additions, cheap enough to leave on in
+production. Every worker process keeps its own values.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    def dec(self, amount: float = 1.0, *label_values: str):
+        self.inc(-amount, *label_values)
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> str:
+        return super().render().replace(f"# TYPE {self.name} counter", f"# TYPE {self.name} gauge")
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per-bucket counts (+Inf last), then sum and count
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[-1] if series else 0
+
+    def total(self, *label_values: str) -> float:
+        series = self._series.get(label_values)
+        return series[-2] if series else 0.0
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += bucket_count
+                    le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return "\n".join(lines)
+
+
+http_requests = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+db_queries = Counter("db_queries_total", "SQL statements executed.")
+db_query_time = Counter("db_query_seconds_total", "Time spent executing SQL statements.")
+request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements per HTTP request.", ("method", "route"), buckets=COUNT_BUCKETS
+)
+request_db_time = Histogram("http_request_db_seconds", "SQL time per HTTP request.", ("method", "route"))
+password_hash_time = Histogram("password_hash_seconds", "Time from submitting a bcrypt job to its result.", ("kind",))
+admission_limit = Gauge("admission_limit", "Current adaptive concurrency limit per route class.", ("route_class",))
+admission_in_flight = Gauge("admission_in_flight", "Admitted requests in progress per route class.", ("route_class",))
+admission_shed = Counter("admission_shed_total", "Requests rejected with 503 by admission control.", ("route_class", "reason"))
+feed_subscribers = Gauge("feed_subscribers", "Open live calculation feed streams.")
+feed_evictions = Counter("feed_evictions_total", "Feed subscribers dropped for falling too far behind.")
+db_read_routing = Counter("db_read_routing_total", "Read-only sessions by where they were served.", ("target",))
+ingest_group_size = Histogram(
+    "ingest_group_rows", "Calculations inserted per group commit.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+ingest_flush_time = Histogram("ingest_flush_seconds", "Time to insert and commit one buffered group.")
+startup_time = Gauge("app_startup_seconds", "Time spent in each startup phase of this worker.", ("phase",))
+
+REGISTRY = [
+    http_requests, http_latency, http_in_flight, db_queries, db_query_time,
+    admission_limit, admission_in_flight, admission_shed, feed_subscribers, feed_evictions,
+    request_db_queries, request_db_time, password_hash_time, db_read_routing, ingest_group_size, ingest_flush_time, startup_time,
+]
+
+
+class RequestStats:
+    """SQL work attributed to the current request."""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def instrument_engine(engine):
+    """Count statements and their execution time on an engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        db_queries.inc()
+        db_query_time.inc(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL work per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+        http_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            http_requests.inc(1, method, route_path, str(status_code))
+            http_latency.observe(elapsed, method, route_path)
+            request_db_queries.observe(stats.queries, method, route_path)
+            request_db_time.observe(stats.db_seconds, method, route_path)
+
+
+def render_pool_metrics(pools: Dict[str, dict]) -> str:
+    """Render connection pool counters as gauges labelled by engine."""
+    fields = ("size", "checked_in", "checked_out", "overflow", "waiting", "waits", "timeouts", "wait_seconds")
+    lines = []
+    for field in fields:
+        name = f"db_pool_{field}"
+        samples = [
+            f'{name}{{engine="{engine}"}} {float(status[field])}'
+            for engine, status in sorted(pools.items()) if field in status
+        ]
+        if samples:
+            lines += [f"# HELP {name} Connection pool {field.replace('_', ' ')}.", f"# TYPE {name} gauge"] + samples
+    return "\n".join(lines)
+
+
+def render_metrics(extra: Sequence[str] = ()) -> str:
+    """Render every registered metric plus extra pre-rendered blocks."""
+    return "\n".join([metric.render() for metric in REGISTRY] + list(extra)) + "\n"
@@ -1,10 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import DDL, Column, Integer, String, Float, DateTime, ForeignKey, Index, LargeBinary, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+import os
 
 Base = declarative_base()
 
+# Bump whenever the models change so workers know the stored schema is outdated
+SCHEMA_VERSION = 5
+
+# On Postgres, create calculations as a table range-partitioned by month of created_at
+PARTITION_CALCULATIONS = os.getenv("PARTITION_CALCULATIONS", "false").lower() in ("1", "true", "yes")
+
 
 class User(Base):
     """User model for authentication and user management."""
@@ -24,14 +31,97 @@ class Calculation(Base):
     """Calculation model to store mathematical operations."""
     __tablename__ = "calculations"
 
-    id = Column(Integer, primary_key=True, index=True)
-    operation = Column(String, nullable=False)  # e.g., "add", "subtract", "multiply", "divide"
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    operation = Column(String, nullable=False)  # "add", "subtract", "multiply", "divide" or an expression like "(a + b) / 2"
     operand1 = Column(Float, nullable=False)
     operand2 = Column(Float, nullable=False)
     result = Column(Float, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Postgres requires the partition key in the primary key of a partitioned table
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=PARTITION_CALCULATIONS)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationship with user
     owner = relationship("User", back_populates="calculations")
+
+    __table_args__ = (
+        # Keyset pagination walks (user_id, id) in order
+        Index("ix_calculations_user_id_id", "user_id", "id"),
+        # Time-bounded browsing and archival by month
+        Index("ix_calculations_created_at", "created_at"),
+        # Browse filters and sorts: an equality column first, then the range or sort column, then id
+        Index("ix_calculations_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_calculations_user_id_result", "user_id", "result", "id"),
+        Index("ix_calculations_operation_created_at", "operation", "created_at", "id"),
+        Index("ix_calculations_operation_result", "operation", "result", "id"),
+        Index("ix_calculations_result", "result", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"} if PARTITION_CALCULATIONS else {},
+    )
+    # Rows are still identified by id alone
+    __mapper_args__ = {"primary_key": [id]}
+
+
+if PARTITION_CALCULATIONS:
+    # Catches rows outside the monthly partitions created by app.partitions
+    event.listen(
+        Calculation.__table__,
+        "after_create",
+        DDL("CREATE TABLE IF NOT EXISTS calculations_default PARTITION OF calculations DEFAULT").execute_if(
+            dialect="postgresql"
+        ),
+    )
+
+
+class CalculationStats(Base):
+    """Per-user, per-operation aggregates maintained alongside calculation writes."""
+    __tablename__ = "calculation_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    operation = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    min_result = Column(Float)
+    max_result = Column(Float)
+
+
+class CalculationRollup(Base):
+    """Calculation counts and result sums per user, operation and time bucket.
+
+    Writes add to minute buckets; compaction folds old minutes into hours and
+    old hours into days, so a bucket's rows may span several granularities.
+    """
+    __tablename__ = "calculation_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    granularity = Column(String, primary_key=True)  # "minute", "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    operation = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        # Compaction selects every user's expired buckets of one granularity
+        Index("ix_calculation_rollups_granularity_bucket_start", "granularity", "bucket_start"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Response stored under a client's Idempotency-Key, replayed when the request is retried."""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=False)
+    response = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class SchemaVersion(Base):
+    """Single-row table recording which SCHEMA_VERSION the database was created with."""
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,230 @@
+"""Monthly partitions of the calculations table and the cold archive.
+
+With ``PARTITION_CALCULATIONS=true`` on Postgres, calculations is created
+as a table range-partitioned by ``created_at``. Postgres routes each insert
+to its month's partition, and time-bounded reads only scan the partitions
+they overlap. ``ensure_partitions`` creates the partitions for the coming
+months. A default partition catches rows outside them. An existing
+calculations table created without partitioning is left as it is, with a
+warning, until it is migrated.
+
+``archive_before`` moves whole months older than the retention window into
+compressed columnar files in ARCHIVE_DIR: NumPy ``.npz`` archives named by
+month, with one array per column. It drops the month's partition, or
+deletes its rows when the table is not partitioned, and rebuilds the
+statistics of the affected users. ``read_archive`` streams the files back
+for the export endpoint.
+
+Run ``python -m app.partitions ensure`` and ``python -m app.partitions
+archive`` from a scheduler, e.g. daily.
+"""
+import argparse
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from app.models import PARTITION_CALCULATIONS, Calculation
+from app.stats import rebuild_stats
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_RETENTION_MONTHS = int(os.getenv("ARCHIVE_RETENTION_MONTHS", "12"))
+# Rows per archive file, which bounds memory use while archiving
+ARCHIVE_FILE_ROWS = int(os.getenv("ARCHIVE_FILE_ROWS", "500000"))
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+ARCHIVE_FILE_PATTERN = re.compile(r"calculations_(\d+)_(\d+)_(\d+)\.npz$")
+ARCHIVE_COLUMNS = ("id", "operation", "operand1", "operand2", "result", "user_id", "created_at", "updated_at")
+ARCHIVE_DTYPES = {
+    "id": np.int64,
+    "operand1": np.float64,
+    "operand2": np.float64,
+    "result": np.float64,
+    "user_id": np.int64,
+    "created_at": "datetime64[us]",
+    "updated_at": "datetime64[us]",
+}
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"calculations_p{month.year:04d}_{month.month:02d}"
+
+
+logger = logging.getLogger(__name__)
+
+
+def partitioning_requested(connection: Connection) -> bool:
+    return PARTITION_CALCULATIONS and connection.dialect.name == "postgresql"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    """Whether calculations really is a partitioned table, not just configured as one."""
+    if not partitioning_requested(connection):
+        return False
+    return bool(connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('calculations'))"
+    )).scalar())
+
+
+def ensure_partitions(connection: Connection, months_ahead: int = PARTITION_MONTHS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Create the partitions from last month through ``months_ahead`` months ahead.
+
+    Returns the partition names covered; a no-op when the table is not partitioned.
+    """
+    if not is_partitioned(connection):
+        if partitioning_requested(connection):
+            logger.warning(
+                "PARTITION_CALCULATIONS is set but the existing calculations table is not partitioned; "
+                "skipping partition maintenance until the table is migrated to a partitioned one"
+            )
+        return []
+    current = month_start(today or datetime.utcnow().date())
+    names = []
+    for offset in range(-1, months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF calculations "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        names.append(name)
+    return names
+
+
+def prepare_partitions(bind=None) -> List[str]:
+    """Ensure upcoming partitions exist (startup phase)."""
+    if bind is None:
+        from app.database import engine as bind
+    with bind.begin() as connection:
+        return ensure_partitions(connection)
+
+
+def _archive_path(month: date) -> str:
+    """Pick a new file for the month, so late rows never overwrite an earlier archive."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    part = 0
+    while True:
+        path = os.path.join(ARCHIVE_DIR, f"calculations_{month.year:04d}_{month.month:02d}_{part}.npz")
+        if not os.path.exists(path):
+            return path
+        part += 1
+
+
+def _write_archive(path: str, rows: list):
+    """Write rows as one compressed array per column, atomically."""
+    columns = list(zip(*rows))
+    arrays = {
+        name: np.array(values, dtype=ARCHIVE_DTYPES.get(name, str))
+        for name, values in zip(ARCHIVE_COLUMNS, columns)
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_month(connection: Connection, month: date) -> int:
+    """Move one month of calculations to the archive and return how many rows moved."""
+    start, end = month, add_months(month, 1)
+    in_month = (Calculation.created_at >= start, Calculation.created_at < end)
+    stmt = (
+        select(*(getattr(Calculation, column) for column in ARCHIVE_COLUMNS))
+        .where(*in_month)
+        .order_by(Calculation.user_id, Calculation.id)
+    )
+    # Files are written before the rows are removed: a failed run can leave
+    # duplicates in the archive but never loses rows
+    moved = 0
+    user_ids = set()
+    result = connection.execution_options(stream_results=True, yield_per=ARCHIVE_FILE_ROWS).execute(stmt)
+    for rows in result.partitions():
+        _write_archive(_archive_path(month), rows)
+        moved += len(rows)
+        user_ids.update(row.user_id for row in rows)
+
+    name = partition_name(month)
+    if is_partitioned(connection) and inspect(connection).has_table(name):
+        connection.execute(text(f"ALTER TABLE calculations DETACH PARTITION {name}"))
+        connection.execute(text(f"DROP TABLE {name}"))
+    # Rows outside a month partition (default partition or an unpartitioned table)
+    connection.execute(delete(Calculation).where(*in_month))
+
+    if user_ids:
+        rebuild_stats(connection, user_ids=user_ids)
+    return moved
+
+
+def archive_before(connection: Connection, cutoff: date) -> List[Tuple[date, int]]:
+    """Archive every whole month before ``cutoff``; returns (month, rows) per archived month."""
+    cutoff = month_start(cutoff)
+    oldest = connection.execute(
+        select(func.min(Calculation.created_at)).where(Calculation.created_at < cutoff)
+    ).scalar()
+    if oldest is None:
+        return []
+    archived = []
+    month = month_start(oldest)
+    while month < cutoff:
+        archived.append((month, archive_month(connection, month)))
+        month = add_months(month, 1)
+    return archived
+
+
+def archive_files() -> List[str]:
+    """Archive files in month order, then in the order they were written."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    files = []
+    for name in os.listdir(ARCHIVE_DIR):
+        match = ARCHIVE_FILE_PATTERN.match(name)
+        if match:
+            files.append((tuple(int(part) for part in match.groups()), name))
+    return [os.path.join(ARCHIVE_DIR, name) for _, name in sorted(files)]
+
+
+def read_archive(user_id: Optional[int] = None, chunk_rows: int = 1000) -> Iterator[list]:
+    """Yield archived rows, month by month, in chunks of tuples in ARCHIVE_COLUMNS order."""
+    for path in archive_files():
+        with np.load(path) as archive:
+            if user_id:
+                mask = archive["user_id"] == user_id
+                columns = [archive[name][mask] for name in ARCHIVE_COLUMNS]
+            else:
+                columns = [archive[name] for name in ARCHIVE_COLUMNS]
+        for offset in range(0, len(columns[0]), chunk_rows):
+            yield list(zip(*(column[offset:offset + chunk_rows].tolist() for column in columns)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain calculation partitions and the cold archive.")
+    parser.add_argument("command", choices=["ensure", "archive"])
+    parser.add_argument("--retention-months", type=int, default=ARCHIVE_RETENTION_MONTHS,
+                        help="Keep this many whole months in the database")
+    args = parser.parse_args(argv)
+
+    from app.database import engine
+
+    with engine.begin() as connection:
+        if args.command == "ensure":
+            print(f"Partitions ready: {', '.join(ensure_partitions(connection)) or 'table is not partitioned'}")
+            return
+        cutoff = add_months(month_start(datetime.utcnow().date()), -args.retention_months)
+        for month, count in archive_before(connection, cutoff):
+            print(f"Archived {count} calculations from {month:%Y-%m}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Routing of read-only requests to Postgres read replicas.
+
+Set DATABASE_REPLICA_URLS to a comma-separated list of replica URLs. Read
+endpoints depend on ``get_read_db`` (or ``get_async_read_db``), which
+round-robins across the replicas whose measured lag is within
+REPLICA_MAX_LAG_SECONDS. Mutations keep using ``get_db`` on the primary.
+
+A reader falls back to the primary when:
+- no replicas are configured;
+- every replica lags or is unreachable;
+- the client wrote something within the last READ_YOUR_WRITES_SECONDS, so
+  it always sees its own writes. ``ReadYourWritesMiddleware`` marks such
+  clients with a short-lived cookie on every successful mutation.
+
+Replica sessions are tagged in ``Session.info``. Rows read through them may
+lag behind a write that just invalidated the shared cache, so cached
+endpoints only fill the cache from the primary (``from_replica``).
+
+A background thread measures replica lag every REPLICA_LAG_CHECK_SECONDS.
+"""
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import engine_options, get_async_db, get_db, pool_status, to_async_url
+from app.metrics import db_read_routing, instrument_engine
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_COOKIE = "read_primary_until"
+
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# Zero when the replica has replayed everything it received, else the age of the last replayed commit
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def measure_lag(engine) -> float:
+    """Return a replica's replication lag in seconds (0 for non-Postgres databases)."""
+    if engine.dialect.name != "postgresql":
+        return 0.0
+    with engine.connect() as connection:
+        return float(connection.execute(POSTGRES_LAG_QUERY).scalar() or 0.0)
+
+
+class Replica:
+    """One replica: its pools and last measured lag."""
+
+    def __init__(self, name: str, url: str, lag_probe: Callable = measure_lag):
+        self.name = name
+        self.url = url
+        self.engine = create_engine(url, **engine_options(url))
+        instrument_engine(self.engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.lag_probe = lag_probe
+        # Unknown until first measured; an unmeasured replica is not used
+        self.lag = math.inf
+        self._async_session_factory = None
+
+    def check(self):
+        """Measure the lag; an unreachable replica counts as infinitely behind."""
+        try:
+            self.lag = self.lag_probe(self.engine)
+        except Exception as e:
+            logger.warning("Replica %s lag check failed: %s", self.name, e)
+            self.lag = math.inf
+
+    def async_session_factory(self):
+        if self._async_session_factory is None:
+            async_url = to_async_url(self.url)
+            async_engine = create_async_engine(async_url, **engine_options(async_url, is_async=True))
+            instrument_engine(async_engine.sync_engine)
+            self._async_session_factory = async_sessionmaker(
+                bind=async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+            )
+        return self._async_session_factory
+
+
+class ReplicaSet:
+    """Load balancer over replicas with lag-aware fallback to the primary."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_lag: float = REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = REPLICA_LAG_CHECK_SECONDS,
+        lag_probe: Callable = measure_lag,
+    ):
+        self.replicas = [Replica(f"replica{index}", url, lag_probe) for index, url in enumerate(urls)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._counter = itertools.count()
+        self._monitor: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def _ensure_monitor(self):
+        """Start the lag-checking thread on first use."""
+        if self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is None:
+                self.check()
+                self._monitor = threading.Thread(target=self._watch, name="replica-lag", daemon=True)
+                self._monitor.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.check()
+
+    def pick(self, request: Request) -> Optional[Replica]:
+        """Choose a replica for this request, or None to read from the primary."""
+        if not self.replicas:
+            db_read_routing.inc(1, "primary")
+            return None
+        if read_your_writes(request):
+            db_read_routing.inc(1, "primary_sticky")
+            return None
+        self._ensure_monitor()
+        healthy = [replica for replica in self.replicas if replica.lag <= self.max_lag]
+        if not healthy:
+            db_read_routing.inc(1, "primary_lag")
+            return None
+        db_read_routing.inc(1, "replica")
+        return healthy[next(self._counter) % len(healthy)]
+
+    def status(self) -> dict:
+        """Lag and pool counters per replica."""
+        return {
+            replica.name: {"lag_seconds": replica.lag if math.isfinite(replica.lag) else None, **pool_status(replica.engine)}
+            for replica in self.replicas
+        }
+
+
+replica_set = ReplicaSet(DATABASE_REPLICA_URLS)
+
+
+def read_your_writes(request: Request) -> bool:
+    """Check whether the client wrote recently enough that it must read from the primary."""
+    marker = request.cookies.get(READ_YOUR_WRITES_COOKIE)
+    if not marker:
+        return False
+    try:
+        return float(marker) > time.time()
+    except ValueError:
+        return False
+
+
+def from_replica(db) -> bool:
+    """Check whether a read session is on a replica, whose rows must not be cached."""
+    return db.info.get("replica") is not None
+
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    """Dependency to get a session for read-only work, on a replica when one is usable."""
+    replica = replica_set.pick(request)
+    if replica is None:
+        yield primary
+        return
+    db = replica.session_factory()
+    db.info["replica"] = replica.name
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request, primary: AsyncSession = Depends(get_async_db)):
+    """Dependency to get an async session for read-only work, on a replica when one is usable."""
+    replica = replica_set.pick(request)
+    if replica is None:
+        yield primary
+        return
+    async with replica.async_session_factory()() as db:
+        db.info["replica"] = replica.name
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware pinning a client's reads to the primary for a while after each write."""
+
+    def __init__(self, app, window: float = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window
+                cookie = f"{READ_YOUR_WRITES_COOKIE}={until:.3f}; Max-Age={math.ceil(self.window)}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,305 @@
+"""Calculation activity rolled up into minute, hour and day buckets.
+
+Every calculation write adds its change in count and result sum to the
+minute bucket of the calculation's created_at, in the same transaction,
+through the same hooks that maintain app.stats.
+Inserts, edits and deletes never rewrite a coarser bucket, so a change to
+an old calculation just leaves a small correcting row at minute
+granularity.
+
+Compaction folds minute buckets older than ROLLUP_MINUTE_HOURS into hours
+and hour buckets older than ROLLUP_HOUR_DAYS into days. It runs in a
+background thread every ROLLUP_COMPACT_SECONDS and via
+``python -m app.rollups compact``. Expired rows are removed with
+``DELETE ... RETURNING`` before their sums are merged upward, so concurrent
+compactions never count a bucket twice.
+
+A year of hourly rollups therefore reads a few hundred day rows plus the
+recent hour and minute rows. Rollups are kept when months are archived.
+``python -m app.rollups rebuild`` recomputes them from the calculations.
+"""
+import argparse
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, insert, select, update
+from sqlalchemy.engine import Connection
+from app.models import Calculation, CalculationRollup
+
+ROLLUP_MINUTE_HOURS = int(os.getenv("ROLLUP_MINUTE_HOURS", "24"))
+ROLLUP_HOUR_DAYS = int(os.getenv("ROLLUP_HOUR_DAYS", "30"))
+# 0 turns the background compaction thread off
+ROLLUP_COMPACT_SECONDS = float(os.getenv("ROLLUP_COMPACT_SECONDS", "300"))
+# Rows per multi-row upsert, well below SQLite's bound parameter limit
+MERGE_BATCH_ROWS = 1000
+# Calculations read per chunk when rebuilding rollups from the table
+REBUILD_CHUNK_ROWS = 10000
+
+GRANULARITIES = ("minute", "hour", "day")
+BUCKET_SPANS = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Range served when a rollup request gives no start
+DEFAULT_WINDOWS = {"minute": timedelta(hours=1), "hour": timedelta(days=1), "day": timedelta(days=365)}
+
+rollup_table = CalculationRollup.__table__
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[int, str, datetime]
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """``moment`` as the naive UTC datetime buckets are stored in."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    """Start of the bucket of ``granularity`` containing ``moment``."""
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RollupDeltas:
+    """Net count and result-sum changes per (user_id, operation, minute bucket)."""
+
+    def __init__(self):
+        self.buckets: Dict[BucketKey, List[float]] = defaultdict(lambda: [0, 0.0])
+
+    def add(self, user_id: int, operation: str, result: float, created_at: Optional[datetime], sign: int = 1):
+        bucket = self.buckets[(user_id, operation, truncate(created_at or datetime.utcnow(), "minute"))]
+        bucket[0] += sign
+        bucket[1] += sign * result
+
+    def remove(self, user_id: int, operation: str, result: float, created_at: Optional[datetime]):
+        self.add(user_id, operation, result, created_at, sign=-1)
+
+    def __bool__(self):
+        return bool(self.buckets)
+
+
+def _merge(connection: Connection, granularity: str, buckets: Dict[BucketKey, List[float]]):
+    """Add bucket counts and sums into rollup rows of one granularity, creating missing rows."""
+    rows = [
+        {
+            "user_id": user_id, "granularity": granularity, "bucket_start": bucket_start,
+            "operation": operation, "count": count, "total": total,
+        }
+        for (user_id, operation, bucket_start), (count, total) in buckets.items()
+        if count or total
+    ]
+    if not rows:
+        return
+
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        for start in range(0, len(rows), MERGE_BATCH_ROWS):
+            stmt = dialect_insert(rollup_table).values(rows[start:start + MERGE_BATCH_ROWS])
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=list(rollup_table.primary_key.columns),
+                set_={
+                    "count": rollup_table.c.count + stmt.excluded.count,
+                    "total": rollup_table.c.total + stmt.excluded.total,
+                },
+            ))
+        return
+
+    for row in rows:
+        key = and_(*(column == row[column.name] for column in rollup_table.primary_key.columns))
+        merged = {"count": rollup_table.c.count + row["count"], "total": rollup_table.c.total + row["total"]}
+        if connection.execute(update(rollup_table).where(key).values(**merged)).rowcount == 0:
+            connection.execute(insert(rollup_table).values(**row))
+
+
+def apply_rollup_deltas(connection: Connection, deltas: RollupDeltas):
+    """Apply minute-bucket deltas inside the caller's transaction."""
+    _merge(connection, "minute", deltas.buckets)
+
+
+def record_rollups(connection: Connection, added: Iterable = (), removed: Iterable = ()):
+    """Update rollups for calculation rows written without the ORM unit of work.
+
+    Rows are mappings or row objects with user_id, operation, result and,
+    optionally, created_at; rows without one count as created now.
+    """
+    deltas = RollupDeltas()
+    for rows, change in ((added, deltas.add), (removed, deltas.remove)):
+        for row in rows:
+            row = row if isinstance(row, dict) else row._mapping
+            change(row["user_id"], row["operation"], row["result"], row.get("created_at"))
+    apply_rollup_deltas(connection, deltas)
+
+
+def compact(connection: Connection, now: Optional[datetime] = None) -> Dict[str, int]:
+    """Fold expired minute buckets into hours and expired hours into days.
+
+    Cutoffs are aligned to the coarser bucket, so a bucket is only compacted
+    once all of it has expired. Returns how many rows each granularity lost.
+    """
+    now = now or datetime.utcnow()
+    compacted = {}
+    for fine, coarse, cutoff in (
+        ("minute", "hour", truncate(now - timedelta(hours=ROLLUP_MINUTE_HOURS), "hour")),
+        ("hour", "day", truncate(now - timedelta(days=ROLLUP_HOUR_DAYS), "day")),
+    ):
+        expired = connection.execute(
+            delete(rollup_table)
+            .where(rollup_table.c.granularity == fine, rollup_table.c.bucket_start < cutoff)
+            .returning(
+                rollup_table.c.user_id, rollup_table.c.operation, rollup_table.c.bucket_start,
+                rollup_table.c.count, rollup_table.c.total,
+            )
+        ).all()
+        buckets: Dict[BucketKey, List[float]] = defaultdict(lambda: [0, 0.0])
+        for user_id, operation, bucket_start, count, total in expired:
+            bucket = buckets[(user_id, operation, truncate(bucket_start, coarse))]
+            bucket[0] += count
+            bucket[1] += total
+        _merge(connection, coarse, buckets)
+        compacted[fine] = len(expired)
+    return compacted
+
+
+def rebuild_rollups(connection: Connection, now: Optional[datetime] = None) -> int:
+    """Recompute rollups from the calculations table and compact them.
+
+    Calculations are streamed in chunks of REBUILD_CHUNK_ROWS, so memory
+    stays bounded. Months already archived out of the table are not
+    counted. Returns how many calculations were read.
+    """
+    connection.execute(delete(rollup_table))
+    rows = connection.execution_options(stream_results=True).execute(
+        select(Calculation.user_id, Calculation.operation, Calculation.result, Calculation.created_at)
+    )
+    counted = 0
+    for chunk in rows.partitions(REBUILD_CHUNK_ROWS):
+        record_rollups(connection, added=chunk)
+        counted += len(chunk)
+    compact(connection, now)
+    return counted
+
+
+def rollup_series(
+    connection: Connection,
+    user_id: int,
+    bucket: str,
+    start: datetime,
+    end: datetime,
+    operation: Optional[str] = None,
+) -> List[dict]:
+    """Per-operation counts and result sums per ``bucket`` between ``start`` and ``end``.
+
+    Buckets older than their granularity's retention are only available
+    coarser, so they are reported at the granularity they were compacted to.
+    """
+    level = GRANULARITIES.index(bucket)
+    start, end = naive_utc(start), naive_utc(end)
+    stmt = select(
+        rollup_table.c.granularity, rollup_table.c.bucket_start, rollup_table.c.operation,
+        rollup_table.c.count, rollup_table.c.total,
+    ).where(
+        rollup_table.c.user_id == user_id,
+        # Earliest start of any bucket that can overlap the range
+        rollup_table.c.bucket_start >= truncate(start, "day"),
+        rollup_table.c.bucket_start < end,
+    )
+    if operation is not None:
+        stmt = stmt.where(rollup_table.c.operation == operation)
+
+    points: Dict[Tuple[datetime, str, str], List[float]] = defaultdict(lambda: [0, 0.0])
+    for granularity, bucket_start, row_operation, count, total in connection.execute(stmt):
+        reported = GRANULARITIES[max(level, GRANULARITIES.index(granularity))]
+        point_start = truncate(bucket_start, reported)
+        if point_start + BUCKET_SPANS[reported] <= start:
+            continue
+        point = points[(point_start, reported, row_operation)]
+        point[0] += count
+        point[1] += total
+
+    return [
+        {"bucket_start": point_start, "bucket": reported, "operation": row_operation, "count": count, "total": total}
+        for (point_start, reported, row_operation), (count, total) in sorted(points.items())
+        if count
+    ]
+
+
+class RollupCompactor:
+    """Background thread compacting rollups every ``interval`` seconds."""
+
+    def __init__(self, bind, interval: float = ROLLUP_COMPACT_SECONDS):
+        self.bind = bind
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the compaction thread."""
+        self._thread = threading.Thread(target=self._run, name="rollup-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the compaction thread, waiting for a running pass to finish."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.bind.begin() as connection:
+                    compact(connection)
+            except Exception:
+                logger.exception("Rollup compaction failed")
+
+
+compactor: Optional[RollupCompactor] = None
+
+
+def start_compactor(bind=None) -> Optional[RollupCompactor]:
+    """Start the process-wide compaction thread unless ROLLUP_COMPACT_SECONDS is 0."""
+    global compactor
+    if ROLLUP_COMPACT_SECONDS <= 0:
+        return None
+    if bind is None:
+        from app.database import engine as bind
+    compactor = RollupCompactor(bind)
+    compactor.start()
+    return compactor
+
+
+def stop_compactor():
+    """Stop the process-wide compaction thread, if one is running."""
+    global compactor
+    if compactor is not None:
+        current, compactor = compactor, None
+        current.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain calculation activity rollups.")
+    parser.add_argument("command", choices=["compact", "rebuild"])
+    args = parser.parse_args(argv)
+
+    from app.database import engine
+
+    with engine.begin() as connection:
+        if args.command == "rebuild":
+            counted = rebuild_rollups(connection)
+            print(f"Rebuilt rollups from {counted} calculations")
+            return
+        compacted = compact(connection)
+    print(f"Compacted {compacted['minute']} minute and {compacted['hour']} hour buckets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import asyncio
+import orjson
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status, Query
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app import feed, ingest
+from app.cache import cache, calculation_key
+from app.serialization import CALCULATION_COLUMNS, dump_calculation, dump_calculations, json_response
+from app.database import get_async_db
+from app.etags import etag_matches, not_modified, page_etag, row_etag, rows_page_etag
+from app.tokens import resolve_user_id, token_user_id, unauthorized
+from app.replicas import from_replica, get_async_read_db, read_your_writes
+from app.idempotency import MAX_KEY_LENGTH, commit_with_response, find_response, fingerprint, replay_response
+from app.models import Calculation
+from app.schemas import (
+    CalculationCreate, CalculationRead, CalculationUpdate, MessageResponse,
+    CalculationFilter, CalculationBulkUpdate, CalculationBulkResult, CalculationRollupPoint,
+)
+from app.rollups import rollup_series
+from app.stats import record_inserted
+from app.utils import calculate
+from app.routes.calculations import (
+    BROWSE_SORT_PATTERN, browse_statement, bulk_delete, bulk_update, cached_etag, default_sort,
+    next_cursor, page_metadata_statement, rollup_range,
+)
+
+router = APIRouter(prefix="/calculations", tags=["calculations"])
+
+
+@router.get("", response_model=List[CalculationRead])
+async def browse_calculations(
+    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
+    user_id: int = Query(None, description="Filter by user ID"),
+    token_user: Optional[int] = Depends(token_user_id),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    created_after: Optional[datetime] = Query(None, description="Only calculations created at or after this time"),
+    created_before: Optional[datetime] = Query(None, description="Only calculations created before this time"),
+    operation: Optional[str] = Query(None, description="Only calculations with this operation"),
+    result_min: Optional[float] = Query(None, description="Only results greater than or equal to this"),
+    result_max: Optional[float] = Query(None, description="Only results less than or equal to this"),
+    sort: Optional[str] = Query(None, pattern=BROWSE_SORT_PATTERN, description="user_id, created_at or result; prefix - for descending"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Browse all calculations with optional pagination and filtering.
+
+    - **skip**: Number of records to skip (default: 0)
+    - **limit**: Maximum number of records to return (default: 100)
+    - **user_id**: Optional filter by user ID; with a bearer token, the token's user is browsed
+    - **cursor**: Resume after the previous page instead of skipping rows
+    - **created_after** / **created_before**: Optional created_at range; on a
+      partitioned table only the overlapping months are scanned
+    - **operation**: Optional exact operation, e.g. divide
+    - **result_min** / **result_max**: Optional inclusive result range
+    - **sort**: user_id, created_at or result, with - for descending; defaults to
+      the ranged column when a result or created_at range is given, to created_at
+      for an operation across all users, else user_id
+
+    Results are ordered by (sort key, id). When more rows may follow, the
+    cursor for the next page is returned in the X-Next-Cursor header; pass
+    it back with the same filters and sort.
+    Pages carry an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    if cursor and skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either skip or cursor, not both"
+        )
+
+    user_id = resolve_user_id(user_id, token_user)
+    sort = sort or default_sort(result_min, result_max, created_after, created_before, user_id, operation)
+    try:
+        stmt = browse_statement(
+            user_id, cursor, created_after, created_before,
+            operation=operation, result_min=result_min, result_max=result_max, sort=sort,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    page = stmt.offset(skip).limit(limit)
+    if if_none_match:
+        # Revalidation only needs the page's aggregates, not its rows
+        etag = page_etag(*(await db.execute(page_metadata_statement(page))).one())
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+    # Plain column rows encoded straight to JSON, no ORM or response-model pass per row
+    result = await db.execute(page.with_only_columns(*CALCULATION_COLUMNS))
+    calculations = result.all()
+
+    headers = {"ETag": rows_page_etag(calculations)}
+    token = next_cursor(calculations, limit, sort)
+    if token:
+        headers["X-Next-Cursor"] = token
+    return json_response(dump_calculations(calculations), headers=headers)
+
+
+@router.patch("/bulk", response_model=CalculationBulkResult)
+async def bulk_edit_calculations(bulk: CalculationBulkUpdate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Update every calculation matching an ID list and/or filter.
+
+    - **filter**: ids, user_id, operation, created_after and/or created_before
+    - **changes**: New operation, operand1 and/or operand2 (optional)
+
+    Rows are updated in one statement without being loaded, and results are
+    recomputed in SQL. Fails as a whole if any new result is undefined.
+    Each updated row is published to its owner's feed.
+    """
+    try:
+        updated = await db.run_sync(lambda session: bulk_update(session.connection(), bulk.filter, bulk.changes))
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except (DataError, IntegrityError):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Result is undefined for at least one matched calculation"
+        )
+
+    if updated:
+        cache.delete(*(calculation_key(row.id) for row in updated))
+    for row in updated:
+        feed.publish_calculation("updated", row)
+    return {"affected": len(updated)}
+
+
+@router.delete("/bulk", response_model=CalculationBulkResult)
+async def bulk_delete_calculations(selection: CalculationFilter, db: AsyncSession = Depends(get_async_db)):
+    """
+    Delete every calculation matching an ID list and/or filter.
+
+    - **ids**: Calculation IDs to delete
+    - **user_id**, **operation**, **created_after**, **created_before**: Filters
+
+    Rows are deleted in one statement without being loaded. Each deleted
+    row is published to its owner's feed.
+    """
+    try:
+        deleted = await db.run_sync(lambda session: bulk_delete(session.connection(), selection))
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    if deleted:
+        cache.delete(*(calculation_key(row.id) for row in deleted))
+    for row in deleted:
+        feed.publish_deleted(row.user_id, row.id)
+    return {"affected": len(deleted)}
+
+
+@router.get("/rollup", response_model=List[CalculationRollupPoint])
+async def calculation_rollup(
+    bucket: str = Query("hour", pattern="^(minute|hour|day)$", description="minute, hour or day"),
+    user_id: Optional[int] = Query(None, description="User whose activity to chart, when no bearer token is sent"),
+    token_user: Optional[int] = Depends(token_user_id),
+    operation: Optional[str] = Query(None, description="Only this operation"),
+    start: Optional[datetime] = Query(None, description="Range start (UTC); defaults to one bucket window before end"),
+    end: Optional[datetime] = Query(None, description="Range end (UTC, exclusive); defaults to now"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Calculation counts and result sums per time bucket and operation.
+
+    - **bucket**: minute, hour (default) or day
+    - **user_id**: User to report on; not needed with a bearer token
+    - **operation**: Optional operation filter
+    - **start** / **end**: Time range; defaults to the last hour, day or year
+
+    Served from the calculation_rollups table, not the calculations. Ranges
+    older than a granularity's retention come back in coarser buckets.
+    """
+    user_id, start, end = rollup_range(resolve_user_id(user_id, token_user), bucket, start, end)
+    points = await db.run_sync(
+        lambda session: rollup_series(session.connection(), user_id, bucket, start, end, operation)
+    )
+    return json_response(orjson.dumps(points))
+
+
+@router.get("/{calculation_id}", response_model=CalculationRead)
+async def read_calculation(
+    calculation_id: int,
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Read a specific calculation by ID.
+
+    - **calculation_id**: The ID of the calculation to retrieve
+
+    The response carries an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    key = calculation_key(calculation_id)
+    # A client that just wrote reads the primary, not a copy cached before its write
+    cached = None if read_your_writes(request) else cache.get(key)
+    if cached is not None:
+        etag = cached_etag(calculation_id, cached)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return json_response(cached, headers={"ETag": etag})
+
+    if if_none_match:
+        updated_at = (await db.execute(select(Calculation.updated_at).where(Calculation.id == calculation_id))).first()
+        if updated_at is not None:
+            etag = row_etag(calculation_id, updated_at[0])
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+
+    result = await db.execute(select(*CALCULATION_COLUMNS).where(Calculation.id == calculation_id))
+    calculation = result.first()
+
+    if not calculation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Calculation not found"
+        )
+
+    payload = dump_calculation(calculation)
+    if not from_replica(db):
+        cache.set(key, payload)
+    return json_response(payload, headers={"ETag": row_etag(calculation.id, calculation.updated_at)})
+
+
+@router.post("", response_model=CalculationRead, status_code=status.HTTP_201_CREATED)
+async def add_calculation(
+    calc_data: CalculationCreate,
+    user_id: Optional[int] = Query(None, description="User ID performing the calculation, when no bearer token is sent"),
+    token_user: Optional[int] = Depends(token_user_id),
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Add a new calculation.
+
+    - **operation**: Type of operation (add, subtract, multiply, divide)
+    - **operand1**: First operand
+    - **operand2**: Second operand
+    - **user_id**: ID of the user creating the calculation; not needed with a bearer token
+    - **Idempotency-Key**: Optional header; a retry with the same key returns the original response
+    """
+    user_id = resolve_user_id(user_id, token_user)
+    if user_id is None:
+        raise unauthorized("Send a bearer access token or a user_id")
+    request_fingerprint = fingerprint(user_id, calc_data.model_dump())
+    if idempotency_key is not None:
+        stored = await db.run_sync(find_response, "calculations", idempotency_key, request_fingerprint)
+        if stored is not None:
+            return replay_response(stored)
+
+    # Perform calculation
+    try:
+        result = calculate(calc_data.operation, calc_data.operand1, calc_data.operand2)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    # The users foreign key rejects unknown user IDs, so no lookup is needed first
+    row = {
+        "operation": calc_data.operation,
+        "operand1": calc_data.operand1,
+        "operand2": calc_data.operand2,
+        "result": result,
+        "user_id": user_id,
+    }
+    try:
+        if ingest.buffer is not None and idempotency_key is None:
+            # Group commit; a full buffer is shed at once rather than blocking the event loop.
+            # Keyed requests skip it so the row commits with its idempotency key.
+            new_calculation = await asyncio.wrap_future(ingest.buffer.submit(row, timeout=0))
+        else:
+            new_calculation = (await db.execute(insert(Calculation).values(**row).returning(*CALCULATION_COLUMNS))).one()
+            # The stored created_at, so later edits and deletes hit the same rollup bucket
+            stored = new_calculation._asdict()
+            await db.run_sync(lambda session: record_inserted(session.connection(), [stored]))
+    except (IntegrityError, ingest.UnknownUser):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    payload = dump_calculation(new_calculation)
+    stored = await db.run_sync(
+        commit_with_response, "calculations", idempotency_key, request_fingerprint, status.HTTP_201_CREATED, payload
+    )
+    if stored is not None:
+        return replay_response(stored)
+    feed.publish(user_id, "created", payload)
+    return json_response(payload, status_code=status.HTTP_201_CREATED)
+
+
+@router.patch("/{calculation_id}", response_model=CalculationRead)
+async def edit_calculation(
+    calculation_id: int,
+    calc_update: CalculationUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Edit an existing calculation.
+
+    - **calculation_id**: The ID of the calculation to update
+    - **operation**: New operation (optional)
+    - **operand1**: New first operand (optional)
+    - **operand2**: New second operand (optional)
+    """
+    # Find calculation
+    calculation = await db.get(Calculation, calculation_id)
+
+    if not calculation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Calculation not found"
+        )
+
+    # Update fields if provided
+    if calc_update.operation is not None:
+        calculation.operation = calc_update.operation
+    if calc_update.operand1 is not None:
+        calculation.operand1 = calc_update.operand1
+    if calc_update.operand2 is not None:
+        calculation.operand2 = calc_update.operand2
+
+    # Recalculate result
+    try:
+        calculation.result = calculate(
+            calculation.operation,
+            calculation.operand1,
+            calculation.operand2
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    await db.commit()
+    cache.delete(calculation_key(calculation_id))
+    await db.refresh(calculation)
+    feed.publish_calculation("updated", calculation)
+
+    return calculation
+
+
+@router.delete("/{calculation_id}", response_model=MessageResponse)
+async def delete_calculation(calculation_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Delete a calculation by ID.
+
+    - **calculation_id**: The ID of the calculation to delete
+    """
+    calculation = await db.get(Calculation, calculation_id)
+
+    if not calculation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Calculation not found"
+        )
+
+    user_id = calculation.user_id
+    await db.delete(calculation)
+    await db.commit()
+    cache.delete(calculation_key(calculation_id))
+    feed.publish_deleted(user_id, calculation_id)
+
+    return {"message": f"Calculation {calculation_id} deleted successfully"}
@@ -0,0 +1,145 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from typing import Optional
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import cache, user_key
+from app.database import get_async_db
+from app.replicas import from_replica, get_async_read_db, read_your_writes
+from app.models import User
+from app.schemas import UserCreate, UserLogin, UserRead, TokenResponse, RefreshRequest
+from app.idempotency import MAX_KEY_LENGTH, commit_with_response, find_response, fingerprint, replay_after_conflict, replay_response
+from app.hashing import hash_password_async, verify_password_async, needs_rehash
+from app.routes.users import duplicate_user_detail, refreshed_user_id
+from app.tokens import issue_tokens, unauthorized
+
+router = APIRouter(prefix="/users", tags=["users"])
+
+
+@router.post("/register", response_model=UserRead, status_code=status.HTTP_201_CREATED)
+async def register_user(
+    user_data: UserCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Register a new user with username, email, and password.
+
+    - **username**: Unique username (3-50 characters)
+    - **email**: Valid email address
+    - **password**: Password (min 6 characters)
+    - **Idempotency-Key**: Optional header; a retry with the same key returns the original response
+    """
+    # The password is left out so its digest is never stored
+    request_fingerprint = fingerprint(user_data.username, user_data.email)
+    if idempotency_key is not None:
+        stored = await db.run_sync(find_response, "register", idempotency_key, request_fingerprint)
+        if stored is not None:
+            return replay_response(stored)
+
+    # The unique constraints on username and email reject duplicates, so the
+    # user is created with a single INSERT ... RETURNING and no lookups
+    hashed_pwd = await hash_password_async(user_data.password)
+    stmt = insert(User).values(
+        username=user_data.username,
+        email=user_data.email,
+        hashed_password=hashed_pwd
+    ).returning(User.id, User.username, User.email, User.created_at)
+
+    try:
+        new_user = (await db.execute(stmt)).one()
+    except IntegrityError as e:
+        await db.rollback()
+        # A concurrent retry with the same key may have created this user
+        stored = await db.run_sync(replay_after_conflict, "register", idempotency_key, request_fingerprint)
+        if stored is not None:
+            return replay_response(stored)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=duplicate_user_detail(e)
+        )
+
+    payload = UserRead.model_validate(new_user).model_dump_json().encode()
+    stored = await db.run_sync(
+        commit_with_response, "register", idempotency_key, request_fingerprint, status.HTTP_201_CREATED, payload
+    )
+    if stored is not None:
+        return replay_response(stored)
+    return Response(content=payload, media_type="application/json", status_code=status.HTTP_201_CREATED)
+
+
+@router.post("/login", response_model=TokenResponse)
+async def login_user(login_data: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    """
+    Login with username and password.
+
+    - **username**: Your username
+    - **password**: Your password
+
+    Returns a short-lived access token to send as `Authorization: Bearer ...`
+    and a refresh token for POST /users/refresh.
+    """
+    # Find user by username
+    user = await db.scalar(select(User).where(User.username == login_data.username))
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid username or password"
+        )
+
+    # Verify password
+    if not await verify_password_async(login_data.password, user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid username or password"
+        )
+
+    # Upgrade hashes created with an outdated bcrypt cost
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password_async(login_data.password)
+        await db.commit()
+        cache.delete(user_key(user.id))
+
+    return {"message": f"Login successful! Welcome {user.username}", **issue_tokens(user.id)}
+
+
+@router.post("/refresh", response_model=TokenResponse)
+async def refresh_tokens(refresh: RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Exchange a refresh token for a new access and refresh token pair.
+
+    - **refresh_token**: Refresh token from login or a previous refresh
+    """
+    user_id = refreshed_user_id(refresh.refresh_token)
+    username = await db.scalar(select(User.username).where(User.id == user_id))
+    if username is None:
+        raise unauthorized("User no longer exists")
+    return {"message": f"Token refreshed for {username}", **issue_tokens(user_id)}
+
+
+@router.get("/{user_id}", response_model=UserRead)
+async def get_user(user_id: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    """
+    Get user information by ID.
+
+    - **user_id**: The ID of the user to retrieve
+    """
+    key = user_key(user_id)
+    # A client that just wrote reads the primary, not a copy cached before its write
+    cached = None if read_your_writes(request) else cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    user = await db.get(User, user_id)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    payload = UserRead.model_validate(user).model_dump_json().encode()
+    if not from_replica(db):
+        cache.set(key, payload)
+    return Response(content=payload, media_type="application/json")
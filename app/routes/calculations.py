@@ -1,45 +1,521 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import csv
+import io
+import itertools
+import json
+import orjson
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request, status, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Float, case, delete, func, insert, literal, null, select, tuple_, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from app import feed, ingest
+from app.cache import cache, calculation_key
+from app.serialization import CALCULATION_COLUMNS, dump_calculation, dump_calculations, json_response
 from app.database import get_db
+from app.etags import etag_matches, not_modified, page_etag, row_etag, rows_page_etag
+from app.tokens import resolve_user_id, token_user_id, unauthorized
+from app.replicas import from_replica, get_read_db, read_your_writes
+from app.idempotency import MAX_KEY_LENGTH, commit_with_response, find_response, fingerprint, replay_response
 from app.models import Calculation, User
-from app.schemas import CalculationCreate, CalculationRead, CalculationUpdate, MessageResponse
-from app.utils import calculate
+from app.partitions import read_archive
+from app.schemas import (
+    CalculationCreate, CalculationRead, CalculationUpdate, MessageResponse,
+    CalculationBatchItem, CalculationBatchResult, CalculationFilter, CalculationBulkUpdate, CalculationBulkResult,
+    CalculationRollupPoint,
+)
+from app.rollups import DEFAULT_WINDOWS, naive_utc, record_rollups, rollup_series
+from app.stats import rebuild_stats, record_inserted
+from app.utils import calculate, calculate_batch, calculate_sql, decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/calculations", tags=["calculations"])
 
+MAX_BATCH_SIZE = 10000
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_COLUMNS = ("id", "operation", "operand1", "operand2", "result", "user_id", "created_at", "updated_at")
+
+
+# Sort orders accepted by browse; "-" sorts descending. Each walks (key, id) with a keyset cursor.
+BROWSE_SORTS = ("user_id", "created_at", "-created_at", "result", "-result")
+BROWSE_SORT_PATTERN = "^(" + "|".join(BROWSE_SORTS) + ")$"
+EPOCH = datetime(1970, 1, 1)
+
+
+def sort_key(sort: str):
+    """Column a non-default browse sort orders by, and whether it is descending."""
+    return getattr(Calculation, sort.lstrip("-")), sort.startswith("-")
+
+
+def default_sort(result_min, result_max, created_after, created_before, user_id=None, operation=None) -> str:
+    """Sort by the ranged column when browsing a range, so the range scan also yields the order.
+
+    Browsing one operation across users sorts by created_at, which its
+    (operation, created_at, id) index returns in order.
+    """
+    if result_min is not None or result_max is not None:
+        return "result"
+    if created_after is not None or created_before is not None:
+        return "created_at"
+    if operation is not None and not user_id:
+        return "created_at"
+    return "user_id"
+
+
+def cursor_value(value):
+    """Keyset value as a cursor number; timestamps become integer microseconds."""
+    if isinstance(value, datetime):
+        return (value - EPOCH) // timedelta(microseconds=1)
+    return value
+
+
+def browse_statement(
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    operation: Optional[str] = None,
+    result_min: Optional[float] = None,
+    result_max: Optional[float] = None,
+    sort: str = "user_id",
+):
+    """Build the browse query in a stable keyset order.
+
+    The default order is (user_id, id); other sorts order by (column, id).
+    Every filter combination has a matching index, see Calculation.__table_args__.
+    A created_at range lets Postgres prune the monthly partitions outside it.
+    Raises ValueError when the cursor token cannot be decoded.
+    """
+    stmt = select(Calculation)
+
+    if user_id:
+        stmt = stmt.where(Calculation.user_id == user_id)
+    if operation is not None:
+        stmt = stmt.where(Calculation.operation == operation)
+    if result_min is not None:
+        stmt = stmt.where(Calculation.result >= result_min)
+    if result_max is not None:
+        stmt = stmt.where(Calculation.result <= result_max)
+    if created_after is not None:
+        stmt = stmt.where(Calculation.created_at >= created_after)
+    if created_before is not None:
+        stmt = stmt.where(Calculation.created_at < created_before)
+
+    if sort == "user_id":
+        if cursor:
+            last_user_id, last_id = decode_cursor(cursor, 2)
+            if user_id:
+                stmt = stmt.where(Calculation.id > last_id)
+            else:
+                stmt = stmt.where(tuple_(Calculation.user_id, Calculation.id) > tuple_(last_user_id, last_id))
+        return stmt.order_by(Calculation.user_id, Calculation.id)
+
+    column, descending = sort_key(sort)
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, 2)
+        if column is Calculation.created_at:
+            last_value = EPOCH + timedelta(microseconds=last_value)
+        position = tuple_(column, Calculation.id)
+        last = tuple_(last_value, last_id)
+        stmt = stmt.where(position < last if descending else position > last)
+    if descending:
+        return stmt.order_by(column.desc(), Calculation.id.desc())
+    return stmt.order_by(column, Calculation.id)
+
+
+def page_metadata_statement(page):
+    """Aggregate a page query down to the values its ETag is derived from."""
+    rows = page.with_only_columns(Calculation.id, Calculation.updated_at).subquery()
+    return select(func.count(), func.max(rows.c.updated_at), func.min(rows.c.id), func.max(rows.c.id))
+
+
+def cached_etag(calculation_id: int, payload: bytes) -> str:
+    """ETag of a cached CalculationRead payload."""
+    return row_etag(calculation_id, orjson.loads(payload)["updated_at"])
+
+
+def next_cursor(calculations, limit: int, sort: str = "user_id") -> Optional[str]:
+    """Return the cursor for the page after ``calculations``, or None on the last page."""
+    if len(calculations) < limit:
+        return None
+    last = calculations[-1]
+    return encode_cursor(cursor_value(getattr(last, sort.lstrip("-"))), last.id)
+
 
 @router.get("", response_model=List[CalculationRead])
 def browse_calculations(
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
     user_id: int = Query(None, description="Filter by user ID"),
-    db: Session = Depends(get_db)
+    token_user: Optional[int] = Depends(token_user_id),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    created_after: Optional[datetime] = Query(None, description="Only calculations created at or after this time"),
+    created_before: Optional[datetime] = Query(None, description="Only calculations created before this time"),
+    operation: Optional[str] = Query(None, description="Only calculations with this operation"),
+    result_min: Optional[float] = Query(None, description="Only results greater than or equal to this"),
+    result_max: Optional[float] = Query(None, description="Only results less than or equal to this"),
+    sort: Optional[str] = Query(None, pattern=BROWSE_SORT_PATTERN, description="user_id, created_at or result; prefix - for descending"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
 ):
     """
     Browse all calculations with optional pagination and filtering.
     
     - **skip**: Number of records to skip (default: 0)
     - **limit**: Maximum number of records to return (default: 100)
-    - **user_id**: Optional filter by user ID
+    - **user_id**: Optional filter by user ID; with a bearer token, the token's user is browsed
+    - **cursor**: Resume after the previous page instead of skipping rows
+    - **created_after** / **created_before**: Optional created_at range; on a
+      partitioned table only the overlapping months are scanned
+    - **operation**: Optional exact operation, e.g. divide
+    - **result_min** / **result_max**: Optional inclusive result range
+    - **sort**: user_id, created_at or result, with - for descending; defaults to
+      the ranged column when a result or created_at range is given, to created_at
+      for an operation across all users, else user_id
+    
+    Results are ordered by (sort key, id). When more rows may follow, the
+    cursor for the next page is returned in the X-Next-Cursor header; pass
+    it back with the same filters and sort.
+    Pages carry an ETag; a matching If-None-Match gets 304 Not Modified.
     """
-    query = db.query(Calculation)
+    if cursor and skip:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either skip or cursor, not both"
+        )
+    
+    user_id = resolve_user_id(user_id, token_user)
+    sort = sort or default_sort(result_min, result_max, created_after, created_before, user_id, operation)
+    try:
+        stmt = browse_statement(
+            user_id, cursor, created_after, created_before,
+            operation=operation, result_min=result_min, result_max=result_max, sort=sort,
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    page = stmt.offset(skip).limit(limit)
+    if if_none_match:
+        # Revalidation only needs the page's aggregates, not its rows
+        etag = page_etag(*db.execute(page_metadata_statement(page)).one())
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    # Plain column rows encoded straight to JSON, no ORM or response-model pass per row
+    calculations = db.execute(page.with_only_columns(*CALCULATION_COLUMNS)).all()
     
+    headers = {"ETag": rows_page_etag(calculations)}
+    token = next_cursor(calculations, limit, sort)
+    if token:
+        headers["X-Next-Cursor"] = token
+    return json_response(dump_calculations(calculations), headers=headers)
+
+
+def export_rows(db: Session, user_id: Optional[int], export_format: str, include_archived: bool = False):
+    """Yield the export body chunk by chunk from a server-side cursor.
+
+    Rows are fetched as plain tuples in partitions of EXPORT_CHUNK_ROWS, so
+    memory use does not grow with the size of the export. Archived months,
+    when included, are read from the cold store first.
+    """
+    stmt = select(*(getattr(Calculation, column) for column in EXPORT_COLUMNS))
     if user_id:
-        query = query.filter(Calculation.user_id == user_id)
+        stmt = stmt.where(Calculation.user_id == user_id)
+    stmt = stmt.order_by(Calculation.user_id, Calculation.id).execution_options(
+        stream_results=True, yield_per=EXPORT_CHUNK_ROWS
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if export_format == "csv":
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    chunks = db.execute(stmt).partitions()
+    if include_archived:
+        chunks = itertools.chain(read_archive(user_id, EXPORT_CHUNK_ROWS), chunks)
+
+    for partition in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in partition:
+            values = [value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+            if export_format == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                buffer.write("\n")
+        yield buffer.getvalue()
+
+
+@router.get("/export")
+def export_calculations(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    user_id: int = Query(None, description="Filter by user ID"),
+    include_archived: bool = Query(False, description="Also export months moved to the cold archive"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Export calculations as a stream of NDJSON lines or CSV rows.
+    
+    - **format**: Output format, ndjson (default) or csv
+    - **user_id**: Optional filter by user ID
+    - **include_archived**: Prepend archived months, oldest first
+    
+    Rows are streamed from a server-side cursor in (user_id, id) order, so
+    the first bytes are sent before the query has finished.
+    """
+    # The session from get_read_db stays open until the streamed response has finished.
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_rows(db, user_id, export_format, include_archived),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=calculations.{export_format}"},
+    )
+
+
+@router.get("/rollup", response_model=List[CalculationRollupPoint])
+def calculation_rollup(
+    bucket: str = Query("hour", pattern="^(minute|hour|day)$", description="minute, hour or day"),
+    user_id: Optional[int] = Query(None, description="User whose activity to chart, when no bearer token is sent"),
+    token_user: Optional[int] = Depends(token_user_id),
+    operation: Optional[str] = Query(None, description="Only this operation"),
+    start: Optional[datetime] = Query(None, description="Range start (UTC); defaults to one bucket window before end"),
+    end: Optional[datetime] = Query(None, description="Range end (UTC, exclusive); defaults to now"),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Calculation counts and result sums per time bucket and operation.
+    
+    - **bucket**: minute, hour (default) or day
+    - **user_id**: User to report on; not needed with a bearer token
+    - **operation**: Optional operation filter
+    - **start** / **end**: Time range; defaults to the last hour, day or year
+    
+    Served from the calculation_rollups table, not the calculations. Ranges
+    older than a granularity's retention come back in coarser buckets.
+    """
+    user_id, start, end = rollup_range(resolve_user_id(user_id, token_user), bucket, start, end)
+    points = rollup_series(db.connection(), user_id, bucket, start, end, operation)
+    return json_response(orjson.dumps(points))
+
+
+@router.get("/feed")
+async def calculation_feed(
+    user_id: Optional[int] = Query(None, description="User whose changes to follow, when no bearer token is sent"),
+    token_user: Optional[int] = Depends(token_user_id),
+):
+    """
+    Stream a user's new, edited and deleted calculations as Server-Sent Events.
+    
+    - **user_id**: User to follow; not needed with a bearer token
+    
+    Events are `created` and `updated` with the calculation as data, and
+    `deleted` with its ID. Idle streams get a comment every
+    FEED_HEARTBEAT_SECONDS. A client that falls too far behind receives an
+    `evicted` event and the stream ends; re-sync with a browse, then reconnect.
+    """
+    user_id = resolve_user_id(user_id, token_user)
+    if user_id is None:
+        raise unauthorized("Send a bearer access token or a user_id")
+    return StreamingResponse(
+        feed.stream(feed.broker.subscribe(user_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def rollup_range(user_id: Optional[int], bucket: str, start: Optional[datetime], end: Optional[datetime]):
+    """Validate a rollup request and fill in its default time range."""
+    if user_id is None:
+        raise unauthorized("Send a bearer access token or a user_id")
+    # Offsets are converted, since buckets are stored as naive UTC
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - DEFAULT_WINDOWS[bucket]
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    return user_id, start, end
+
+
+ROLLUP_COLUMNS = (Calculation.user_id, Calculation.operation, Calculation.result, Calculation.created_at)
+
+
+def bulk_criteria(selection: CalculationFilter) -> list:
+    """Translate a bulk filter into WHERE clauses.
+
+    Raises ValueError when no criterion is given, so a bulk change never
+    silently applies to the whole table.
+    """
+    criteria = []
+    if selection.ids is not None:
+        criteria.append(Calculation.id.in_(selection.ids))
+    if selection.user_id is not None:
+        criteria.append(Calculation.user_id == selection.user_id)
+    if selection.operation is not None:
+        criteria.append(Calculation.operation == selection.operation)
+    if selection.created_after is not None:
+        criteria.append(Calculation.created_at >= selection.created_after)
+    if selection.created_before is not None:
+        criteria.append(Calculation.created_at < selection.created_before)
+    if not criteria:
+        raise ValueError("Give an ID list or at least one filter")
+    return criteria
+
+
+def bulk_update(connection: Connection, selection: CalculationFilter, changes: CalculationUpdate) -> list:
+    """Apply changes to every matching calculation with set-based statements.
+
+    Results are recomputed in SQL from the new operands; when the operation
+    is not replaced, a CASE over the matched operations picks each row's
+    formula. Returns the updated rows as CALCULATION_COLUMNS.
+    """
+    criteria = bulk_criteria(selection)
+    groups = connection.execute(
+        select(Calculation.user_id, Calculation.operation).where(*criteria).distinct()
+    ).all()
+    if not groups:
+        return []
+
+    operand1 = Calculation.operand1 if changes.operand1 is None else literal(changes.operand1, Float)
+    operand2 = Calculation.operand2 if changes.operand2 is None else literal(changes.operand2, Float)
+    if changes.operation is not None:
+        result = calculate_sql(changes.operation, operand1, operand2)
+    else:
+        operations = sorted({operation for _, operation in groups})
+        result = case(
+            {operation: calculate_sql(operation, operand1, operand2) for operation in operations},
+            value=Calculation.operation,
+            else_=null(),
+        )
+
+    values = changes.model_dump(exclude_none=True)
+    values["result"] = result
+    # Rollups move each row's count and result between minute buckets by value
+    before = connection.execute(select(*ROLLUP_COLUMNS).where(*criteria)).all()
+    after = connection.execute(
+        update(Calculation).where(*criteria).values(**values).returning(*CALCULATION_COLUMNS)
+    ).all()
+    rebuild_stats(connection, user_ids={user_id for user_id, _ in groups})
+    record_rollups(connection, added=after, removed=before)
+    return after
+
+
+def bulk_delete(connection: Connection, selection: CalculationFilter) -> list:
+    """Delete every matching calculation with set-based statements and return their IDs and owners."""
+    criteria = bulk_criteria(selection)
+    user_ids = connection.execute(select(Calculation.user_id).where(*criteria).distinct()).scalars().all()
+    if not user_ids:
+        return []
+
+    deleted = connection.execute(
+        delete(Calculation).where(*criteria).returning(Calculation.id, *ROLLUP_COLUMNS)
+    ).all()
+    rebuild_stats(connection, user_ids=user_ids)
+    record_rollups(connection, removed=deleted)
+    return deleted
+
+
+@router.patch("/bulk", response_model=CalculationBulkResult)
+def bulk_edit_calculations(bulk: CalculationBulkUpdate, db: Session = Depends(get_db)):
+    """
+    Update every calculation matching an ID list and/or filter.
+    
+    - **filter**: ids, user_id, operation, created_after and/or created_before
+    - **changes**: New operation, operand1 and/or operand2 (optional)
+    
+    Rows are updated in one statement without being loaded, and results are
+    recomputed in SQL. Fails as a whole if any new result is undefined.
+    Each updated row is published to its owner's feed.
+    """
+    try:
+        updated = bulk_update(db.connection(), bulk.filter, bulk.changes)
+        db.commit()
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except (DataError, IntegrityError):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Result is undefined for at least one matched calculation"
+        )
     
-    calculations = query.offset(skip).limit(limit).all()
-    return calculations
+    if updated:
+        cache.delete(*(calculation_key(row.id) for row in updated))
+    for row in updated:
+        feed.publish_calculation("updated", row)
+    return {"affected": len(updated)}
+
+
+@router.delete("/bulk", response_model=CalculationBulkResult)
+def bulk_delete_calculations(selection: CalculationFilter, db: Session = Depends(get_db)):
+    """
+    Delete every calculation matching an ID list and/or filter.
+    
+    - **ids**: Calculation IDs to delete
+    - **user_id**, **operation**, **created_after**, **created_before**: Filters
+    
+    Rows are deleted in one statement without being loaded. Each deleted
+    row is published to its owner's feed.
+    """
+    try:
+        deleted = bulk_delete(db.connection(), selection)
+        db.commit()
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if deleted:
+        cache.delete(*(calculation_key(row.id) for row in deleted))
+    for row in deleted:
+        feed.publish_deleted(row.user_id, row.id)
+    return {"affected": len(deleted)}
 
 
 @router.get("/{calculation_id}", response_model=CalculationRead)
-def read_calculation(calculation_id: int, db: Session = Depends(get_db)):
+def read_calculation(
+    calculation_id: int,
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
+):
     """
     Read a specific calculation by ID.
     
     - **calculation_id**: The ID of the calculation to retrieve
+    
+    The response carries an ETag; a matching If-None-Match gets 304 Not Modified.
     """
-    calculation = db.query(Calculation).filter(Calculation.id == calculation_id).first()
+    key = calculation_key(calculation_id)
+    # A client that just wrote reads the primary, not a copy cached before its write
+    cached = None if read_your_writes(request) else cache.get(key)
+    if cached is not None:
+        etag = cached_etag(calculation_id, cached)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return json_response(cached, headers={"ETag": etag})
+    
+    if if_none_match:
+        updated_at = db.execute(select(Calculation.updated_at).where(Calculation.id == calculation_id)).first()
+        if updated_at is not None:
+            etag = row_etag(calculation_id, updated_at[0])
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+    
+    calculation = db.execute(select(*CALCULATION_COLUMNS).where(Calculation.id == calculation_id)).first()
     
     if not calculation:
         raise HTTPException(
@@ -47,13 +523,18 @@ def read_calculation(calculation_id: int, db: Session = Depends(get_db)):
             detail="Calculation not found"
         )
     
-    return calculation
+    payload = dump_calculation(calculation)
+    if not from_replica(db):
+        cache.set(key, payload)
+    return json_response(payload, headers={"ETag": row_etag(calculation.id, calculation.updated_at)})
 
 
 @router.post("", response_model=CalculationRead, status_code=status.HTTP_201_CREATED)
 def add_calculation(
     calc_data: CalculationCreate,
-    user_id: int = Query(..., description="User ID performing the calculation"),
+    user_id: Optional[int] = Query(None, description="User ID performing the calculation, when no bearer token is sent"),
+    token_user: Optional[int] = Depends(token_user_id),
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
     db: Session = Depends(get_db)
 ):
     """
@@ -62,15 +543,16 @@ def add_calculation(
     - **operation**: Type of operation (add, subtract, multiply, divide)
     - **operand1**: First operand
     - **operand2**: Second operand
-    - **user_id**: ID of the user creating the calculation
+    - **user_id**: ID of the user creating the calculation; not needed with a bearer token
+    - **Idempotency-Key**: Optional header; a retry with the same key returns the original response
     """
-    # Verify user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+    user_id = resolve_user_id(user_id, token_user)
+    if user_id is None:
+        raise unauthorized("Send a bearer access token or a user_id")
+    request_fingerprint = fingerprint(user_id, calc_data.model_dump())
+    stored = find_response(db, "calculations", idempotency_key, request_fingerprint)
+    if stored is not None:
+        return replay_response(stored)
     
     # Perform calculation
     try:
@@ -81,20 +563,98 @@ def add_calculation(
             detail=str(e)
         )
     
-    # Create new calculation
-    new_calculation = Calculation(
-        operation=calc_data.operation,
-        operand1=calc_data.operand1,
-        operand2=calc_data.operand2,
-        result=result,
-        user_id=user_id
-    )
-    
-    db.add(new_calculation)
-    db.commit()
-    db.refresh(new_calculation)
+    # The users foreign key rejects unknown user IDs, so no lookup is needed first
+    row = {
+        "operation": calc_data.operation,
+        "operand1": calc_data.operand1,
+        "operand2": calc_data.operand2,
+        "result": result,
+        "user_id": user_id,
+    }
+    try:
+        if ingest.buffer is not None and idempotency_key is None:
+            # Group commit: wait for the background flusher to store this row with others.
+            # Keyed requests skip it so the row commits with its idempotency key.
+            new_calculation = ingest.buffer.submit(row).result()
+        else:
+            new_calculation = db.execute(insert(Calculation).values(**row).returning(*CALCULATION_COLUMNS)).one()
+            # The stored created_at, so later edits and deletes hit the same rollup bucket
+            record_inserted(db.connection(), [new_calculation._asdict()])
+    except (IntegrityError, ingest.UnknownUser):
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
     
-    return new_calculation
+    payload = dump_calculation(new_calculation)
+    stored = commit_with_response(
+        db, "calculations", idempotency_key, request_fingerprint, status.HTTP_201_CREATED, payload
+    )
+    if stored is not None:
+        return replay_response(stored)
+    feed.publish(user_id, "created", payload)
+    return json_response(payload, status_code=status.HTTP_201_CREATED)
+
+
+@router.post("/batch", response_model=CalculationBatchResult, status_code=status.HTTP_201_CREATED)
+def add_calculations_batch(
+    items: List[CalculationBatchItem] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+    user_id: int = Query(..., description="User ID performing the calculations"),
+    db: Session = Depends(get_db)
+):
+    """
+    Add many calculations in one request.
+
+    - **items**: List of operations (operation, operand1, operand2)
+    - **user_id**: ID of the user creating the calculations
+
+    All items are evaluated in one vectorized pass and stored with a single
+    bulk INSERT and one commit. Items that cannot be evaluated (e.g. division
+    by zero) are reported with an error and are not stored.
+    """
+    # Verify user exists
+    user = db.query(User.id).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    values, errors = calculate_batch(
+        [item.operation for item in items],
+        [item.operand1 for item in items],
+        [item.operand2 for item in items],
+    )
+
+    rows = []
+    row_indexes = []
+    for index, item in enumerate(items):
+        if errors[index] is None:
+            rows.append({
+                "operation": item.operation,
+                "operand1": item.operand1,
+                "operand2": item.operand2,
+                "result": float(values[index]),
+                "user_id": user_id,
+            })
+            row_indexes.append(index)
+
+    results = [{"index": index, "error": errors[index]} for index in range(len(items))]
+    if rows:
+        stmt = insert(Calculation).returning(
+            Calculation.id, Calculation.created_at, Calculation.updated_at,
+            sort_by_parameter_order=True,
+        )
+        inserted = db.execute(stmt, rows).all()
+        rows = [{**row, **stored._mapping} for row, stored in zip(rows, inserted)]
+        record_inserted(db.connection(), rows)
+        db.commit()
+        for index, row in zip(row_indexes, rows):
+            results[index]["calculation"] = row
+            feed.publish(user_id, "created", orjson.dumps(row))
+
+    return {"created": len(rows), "failed": len(items) - len(rows), "results": results}
 
 
 @router.patch("/{calculation_id}", response_model=CalculationRead)
@@ -142,7 +702,9 @@ def edit_calculation(
         )
     
     db.commit()
+    cache.delete(calculation_key(calculation_id))
     db.refresh(calculation)
+    feed.publish_calculation("updated", calculation)
     
     return calculation
 
@@ -162,7 +724,10 @@ def delete_calculation(calculation_id: int, db: Session = Depends(get_db)):
             detail="Calculation not found"
         )
     
+    user_id = calculation.user_id
     db.delete(calculation)
     db.commit()
+    cache.delete(calculation_key(calculation_id))
+    feed.publish_deleted(user_id, calculation_id)
     
     return {"message": f"Calculation {calculation_id} deleted successfully"}
@@ -1,60 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from typing import Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User
-from app.schemas import UserCreate, UserLogin, UserRead, MessageResponse
-from app.utils import hash_password, verify_password
+from app.cache import cache, user_key
+from app.database import get_db, violated_constraint
+from app.replicas import from_replica, get_read_db, read_your_writes
+from app.models import User, CalculationStats
+from app.schemas import UserCreate, UserLogin, UserRead, UserStats, TokenResponse, RefreshRequest
+from app.idempotency import MAX_KEY_LENGTH, commit_with_response, find_response, fingerprint, replay_after_conflict, replay_response
+from app.hashing import hash_password_offloaded, verify_password_offloaded, needs_rehash
+from app.tokens import REFRESH, InvalidToken, decode_token, issue_tokens, unauthorized
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
+def duplicate_user_detail(error: IntegrityError) -> str:
+    """Name the field whose unique constraint a registration violated."""
+    if "email" in violated_constraint(error):
+        return "Email already registered"
+    return "Username already registered"
+
+
 @router.post("/register", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+def register_user(
+    user_data: UserCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
+    db: Session = Depends(get_db)
+):
     """
     Register a new user with username, email, and password.
     
     - **username**: Unique username (3-50 characters)
     - **email**: Valid email address
     - **password**: Password (min 6 characters)
+    - **Idempotency-Key**: Optional header; a retry with the same key returns the original response
     """
-    # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
+    # The password is left out so its digest is never stored
+    request_fingerprint = fingerprint(user_data.username, user_data.email)
+    stored = find_response(db, "register", idempotency_key, request_fingerprint)
+    if stored is not None:
+        return replay_response(stored)
     
-    # Check if email already exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
-    if existing_email:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Create new user with hashed password
-    hashed_pwd = hash_password(user_data.password)
-    new_user = User(
+    # The unique constraints on username and email reject duplicates, so the
+    # user is created with a single INSERT ... RETURNING and no lookups
+    hashed_pwd = hash_password_offloaded(user_data.password)
+    stmt = insert(User).values(
         username=user_data.username,
         email=user_data.email,
         hashed_password=hashed_pwd
-    )
+    ).returning(User.id, User.username, User.email, User.created_at)
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        new_user = db.execute(stmt).one()
+    except IntegrityError as e:
+        db.rollback()
+        # A concurrent retry with the same key may have created this user
+        stored = replay_after_conflict(db, "register", idempotency_key, request_fingerprint)
+        if stored is not None:
+            return replay_response(stored)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=duplicate_user_detail(e)
+        )
     
-    return new_user
+    payload = UserRead.model_validate(new_user).model_dump_json().encode()
+    stored = commit_with_response(
+        db, "register", idempotency_key, request_fingerprint, status.HTTP_201_CREATED, payload
+    )
+    if stored is not None:
+        return replay_response(stored)
+    return Response(content=payload, media_type="application/json", status_code=status.HTTP_201_CREATED)
 
 
-@router.post("/login", response_model=MessageResponse)
+@router.post("/login", response_model=TokenResponse)
 def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
     """
     Login with username and password.
     
     - **username**: Your username
     - **password**: Your password
+    
+    Returns a short-lived access token to send as `Authorization: Bearer ...`
+    and a refresh token for POST /users/refresh.
     """
     # Find user by username
     user = db.query(User).filter(User.username == login_data.username).first()
@@ -66,22 +94,57 @@ def login_user(login_data: UserLogin, db: Session = Depends(get_db)):
         )
     
     # Verify password
-    if not verify_password(login_data.password, user.hashed_password):
+    if not verify_password_offloaded(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
     
-    return {"message": f"Login successful! Welcome {user.username}"}
+    # Upgrade hashes created with an outdated bcrypt cost
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = hash_password_offloaded(login_data.password)
+        db.commit()
+        cache.delete(user_key(user.id))
+    
+    return {"message": f"Login successful! Welcome {user.username}", **issue_tokens(user.id)}
+
+
+def refreshed_user_id(refresh_token: str) -> int:
+    """User ID of a valid refresh token; raises 401 otherwise."""
+    try:
+        return decode_token(refresh_token, REFRESH)["sub"]
+    except InvalidToken as e:
+        raise unauthorized(str(e))
+
+
+@router.post("/refresh", response_model=TokenResponse)
+def refresh_tokens(refresh: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access and refresh token pair.
+    
+    - **refresh_token**: Refresh token from login or a previous refresh
+    """
+    user_id = refreshed_user_id(refresh.refresh_token)
+    # One primary key lookup so deleted users cannot keep refreshing
+    user = db.query(User.username).filter(User.id == user_id).first()
+    if not user:
+        raise unauthorized("User no longer exists")
+    return {"message": f"Token refreshed for {user.username}", **issue_tokens(user_id)}
 
 
 @router.get("/{user_id}", response_model=UserRead)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+def get_user(user_id: int, request: Request, db: Session = Depends(get_read_db)):
     """
     Get user information by ID.
     
     - **user_id**: The ID of the user to retrieve
     """
+    key = user_key(user_id)
+    # A client that just wrote reads the primary, not a copy cached before its write
+    cached = None if read_your_writes(request) else cache.get(key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
     user = db.query(User).filter(User.id == user_id).first()
     
     if not user:
@@ -90,4 +153,43 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
             detail="User not found"
         )
     
-    return user
+    payload = UserRead.model_validate(user).model_dump_json().encode()
+    if not from_replica(db):
+        cache.set(key, payload)
+    return Response(content=payload, media_type="application/json")
+
+
+@router.get("/{user_id}/stats", response_model=UserStats)
+def get_user_stats(user_id: int, db: Session = Depends(get_read_db)):
+    """
+    Get calculation statistics for a user.
+    
+    - **user_id**: The ID of the user
+    
+    Counts, sums, minimum and maximum results per operation are read from
+    the calculation_stats summary table, not computed from the calculations.
+    """
+    if not db.query(User.id).filter(User.id == user_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    rows = (
+        db.query(CalculationStats)
+        .filter(CalculationStats.user_id == user_id)
+        .order_by(CalculationStats.operation)
+        .all()
+    )
+    operations = [
+        {
+            "operation": row.operation,
+            "count": row.count,
+            "total": row.total,
+            "min_result": row.min_result,
+            "max_result": row.max_result,
+            "average": row.total / row.count if row.count else None,
+        }
+        for row in rows
+    ]
+    return {"user_id": user_id, "count": sum(row.count for row in rows), "operations": operations}
@@ -1,6 +1,10 @@
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from app.expressions import MAX_EXPRESSION_LENGTH, validate_operation
+
+# Largest ID list accepted by the bulk update and delete endpoints
+MAX_BULK_IDS = 10000
 
 
 # User Schemas
@@ -30,13 +34,39 @@ class UserRead(UserBase):
         from_attributes = True
 
 
+class OperationStats(BaseModel):
+    """Aggregates for one operation of a user."""
+    operation: str
+    count: int
+    total: float
+    min_result: Optional[float] = None
+    max_result: Optional[float] = None
+    average: Optional[float] = None
+
+
+class UserStats(BaseModel):
+    """Schema for a user's calculation statistics."""
+    user_id: int
+    count: int
+    operations: List[OperationStats]
+
+
 # Calculation Schemas
 class CalculationBase(BaseModel):
-    """Base calculation schema with common attributes."""
-    operation: str = Field(..., pattern="^(add|subtract|multiply|divide)$")
+    """Base calculation schema with common attributes.
+
+    ``operation`` is add, subtract, multiply, divide or an arithmetic
+    expression in ``a`` (operand1) and ``b`` (operand2), e.g. "sqrt(a) + b ** 2".
+    """
+    operation: str = Field(..., min_length=1, max_length=MAX_EXPRESSION_LENGTH)
     operand1: float
     operand2: float
 
+    @validator('operation')
+    def check_operation(cls, v):
+        """Validate a named operation or an expression in a and b."""
+        return validate_operation(v)
+
     @validator('operand2')
     def check_division_by_zero(cls, v, values):
         """Validate that division by zero is not allowed."""
@@ -52,10 +82,15 @@ class CalculationCreate(CalculationBase):
 
 class CalculationUpdate(BaseModel):
     """Schema for updating an existing calculation."""
-    operation: Optional[str] = Field(None, pattern="^(add|subtract|multiply|divide)$")
+    operation: Optional[str] = Field(None, min_length=1, max_length=MAX_EXPRESSION_LENGTH)
     operand1: Optional[float] = None
     operand2: Optional[float] = None
 
+    @validator('operation')
+    def check_operation(cls, v):
+        """Validate a named operation or an expression in a and b."""
+        return v if v is None else validate_operation(v)
+
     @validator('operand2')
     def check_division_by_zero(cls, v, values):
         """Validate that division by zero is not allowed."""
@@ -76,12 +111,89 @@ class CalculationRead(CalculationBase):
         from_attributes = True
 
 
+class CalculationBatchItem(BaseModel):
+    """Schema for one operation in a batch request.
+
+    Division by zero is reported per item in the batch result instead of
+    rejecting the whole request.
+    """
+    operation: str = Field(..., min_length=1, max_length=MAX_EXPRESSION_LENGTH)
+    operand1: float
+    operand2: float
+
+    @validator('operation')
+    def check_operation(cls, v):
+        """Validate a named operation or an expression in a and b."""
+        return validate_operation(v)
+
+
+class CalculationBatchItemResult(BaseModel):
+    """Outcome of one batch item: the stored calculation or an error."""
+    index: int
+    calculation: Optional[CalculationRead] = None
+    error: Optional[str] = None
+
+
+class CalculationBatchResult(BaseModel):
+    """Schema for the batch calculation response."""
+    created: int
+    failed: int
+    results: List[CalculationBatchItemResult]
+
+
+class CalculationFilter(BaseModel):
+    """Selects calculations for bulk changes.
+
+    Give an ID list, attribute filters, or both; every given criterion must
+    match. At least one criterion is required.
+    """
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=MAX_BULK_IDS)
+    user_id: Optional[int] = None
+    operation: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+
+class CalculationBulkUpdate(BaseModel):
+    """Schema for a bulk update: which calculations to change and how."""
+    filter: CalculationFilter
+    changes: CalculationUpdate
+
+
+class CalculationBulkResult(BaseModel):
+    """Number of calculations a bulk update or delete changed."""
+    affected: int
+
+
+class CalculationRollupPoint(BaseModel):
+    """Calculation count and result sum of one operation in one time bucket."""
+    bucket_start: datetime
+    bucket: str
+    operation: str
+    count: int
+    total: float
+
+
 # Response schemas
 class MessageResponse(BaseModel):
     """Generic message response."""
     message: str
 
 
+class TokenResponse(BaseModel):
+    """Login or refresh response carrying a new access/refresh token pair."""
+    message: str
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+
+class RefreshRequest(BaseModel):
+    """Schema for exchanging a refresh token for a new token pair."""
+    refresh_token: str
+
+
 class ErrorResponse(BaseModel):
     """Error response schema."""
     detail: str
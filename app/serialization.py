@@ -0,0 +1,33 @@
+"""Fast JSON encoding for calculation rows read from the database.
+
+Rows coming out of the calculations table already satisfy CalculationRead,
+so the list and detail endpoints encode them directly with orjson instead of
+re-validating every row through the response model.
+"""
+from typing import Iterable
+import orjson
+from fastapi import Response
+from app.models import Calculation
+
+CALCULATION_FIELDS = ("id", "operation", "operand1", "operand2", "result", "user_id", "created_at", "updated_at")
+CALCULATION_COLUMNS = tuple(getattr(Calculation, field) for field in CALCULATION_FIELDS)
+
+
+def calculation_dict(row) -> dict:
+    """Map a Calculation instance or a row of CALCULATION_COLUMNS to its JSON fields."""
+    return {field: getattr(row, field) for field in CALCULATION_FIELDS}
+
+
+def dump_calculation(row) -> bytes:
+    """Encode one calculation as JSON bytes."""
+    return orjson.dumps(calculation_dict(row))
+
+
+def dump_calculations(rows: Iterable) -> bytes:
+    """Encode a list of calculations as JSON bytes."""
+    return orjson.dumps([calculation_dict(row) for row in rows])
+
+
+def json_response(content: bytes, **kwargs) -> Response:
+    """Wrap pre-encoded JSON bytes in a response."""
+    return Response(content=content, media_type="application/json", **kwargs)
@@ -0,0 +1,203 @@
+"""Per-user calculation statistics kept in the calculation_stats summary table.
+
+ORM writes are picked up by an ``after_flush`` listener, so add, edit and
+delete update the summaries in the same transaction as the calculation rows.
+Core bulk statements call ``record_inserted`` (or ``rebuild_stats``) directly.
+The same hooks keep the time-bucket rollups in app.rollups up to date.
+
+Run ``python -m app.stats rebuild [--user-id N]`` to recompute the summaries
+in bulk from the calculations table.
+"""
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app.models import Calculation, CalculationStats
+from app.rollups import RollupDeltas, apply_rollup_deltas, record_rollups
+
+stats_table = CalculationStats.__table__
+
+
+class StatsDelta:
+    """Net change to one (user_id, operation) summary row."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.added = []
+        self.removed = []
+
+    def add(self, result: float):
+        self.count += 1
+        self.total += result
+        self.added.append(result)
+
+    def remove(self, result: float):
+        self.count -= 1
+        self.total -= result
+        self.removed.append(result)
+
+
+def _original(obj, attr: str):
+    """Return the value an attribute had before the pending change."""
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+def _upsert(connection: Connection, user_id: int, operation: str, delta: StatsDelta):
+    """Merge a delta's counts, sum and new extremes into the summary row."""
+    values = {
+        "user_id": user_id,
+        "operation": operation,
+        "count": delta.count,
+        "total": delta.total,
+        "min_result": min(delta.added) if delta.added else None,
+        "max_result": max(delta.added) if delta.added else None,
+    }
+    merged = {
+        "count": stats_table.c.count + delta.count,
+        "total": stats_table.c.total + delta.total,
+    }
+    if delta.added:
+        merged["min_result"] = case(
+            (stats_table.c.min_result.is_(None), values["min_result"]),
+            (stats_table.c.min_result > values["min_result"], values["min_result"]),
+            else_=stats_table.c.min_result,
+        )
+        merged["max_result"] = case(
+            (stats_table.c.max_result.is_(None), values["max_result"]),
+            (stats_table.c.max_result < values["max_result"], values["max_result"]),
+            else_=stats_table.c.max_result,
+        )
+
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(stats_table).values(**values).on_conflict_do_update(
+            index_elements=[stats_table.c.user_id, stats_table.c.operation], set_=merged
+        )
+        connection.execute(stmt)
+        return
+
+    row = and_(stats_table.c.user_id == user_id, stats_table.c.operation == operation)
+    if connection.execute(update(stats_table).where(row).values(**merged)).rowcount == 0:
+        connection.execute(insert(stats_table).values(**values))
+
+
+def apply_deltas(connection: Connection, deltas: Dict[Tuple[int, str], StatsDelta]):
+    """Apply summary deltas inside the caller's transaction."""
+    for (user_id, operation), delta in deltas.items():
+        _upsert(connection, user_id, operation, delta)
+        if not delta.removed:
+            continue
+
+        row = and_(stats_table.c.user_id == user_id, stats_table.c.operation == operation)
+        connection.execute(delete(stats_table).where(row, stats_table.c.count <= 0))
+
+        # Removing the current minimum or maximum needs a rescan of this group only
+        group = and_(Calculation.user_id == user_id, Calculation.operation == operation)
+        connection.execute(
+            update(stats_table)
+            .where(row, or_(
+                stats_table.c.min_result >= min(delta.removed),
+                stats_table.c.max_result <= max(delta.removed),
+            ))
+            .values(
+                min_result=select(func.min(Calculation.result)).where(group).scalar_subquery(),
+                max_result=select(func.max(Calculation.result)).where(group).scalar_subquery(),
+            )
+        )
+
+
+def record_inserted(connection: Connection, rows: Iterable[dict]):
+    """Update summaries and rollups for calculation rows inserted without the ORM unit of work."""
+    rows = list(rows)
+    deltas = defaultdict(StatsDelta)
+    for row in rows:
+        deltas[(row["user_id"], row["operation"])].add(row["result"])
+    apply_deltas(connection, deltas)
+    record_rollups(connection, added=rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _update_stats_after_flush(session: Session, flush_context):
+    """Fold the calculation inserts, updates and deletes of this flush into the summaries and rollups."""
+    deltas = defaultdict(StatsDelta)
+    rollups = RollupDeltas()
+
+    for obj in session.new:
+        if isinstance(obj, Calculation):
+            deltas[(obj.user_id, obj.operation)].add(obj.result)
+            rollups.add(obj.user_id, obj.operation, obj.result, obj.created_at)
+
+    for obj in session.deleted:
+        if isinstance(obj, Calculation):
+            original = (_original(obj, "user_id"), _original(obj, "operation"))
+            deltas[original].remove(_original(obj, "result"))
+            rollups.remove(*original, _original(obj, "result"), obj.created_at)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Calculation):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[attr].history.has_changes() for attr in ("user_id", "operation", "result")):
+            continue
+        original = (_original(obj, "user_id"), _original(obj, "operation"))
+        deltas[original].remove(_original(obj, "result"))
+        deltas[(obj.user_id, obj.operation)].add(obj.result)
+        rollups.remove(*original, _original(obj, "result"), obj.created_at)
+        rollups.add(obj.user_id, obj.operation, obj.result, obj.created_at)
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+    if rollups:
+        apply_rollup_deltas(session.connection(), rollups)
+
+
+def rebuild_stats(connection: Connection, user_id: Optional[int] = None, user_ids: Optional[Iterable[int]] = None):
+    """Recompute summaries from the calculations table with one set-based INSERT ... SELECT.
+
+    Pass ``user_id`` or ``user_ids`` to rebuild only those users' summaries.
+    """
+    if user_id is not None:
+        user_ids = [user_id]
+    clear = delete(stats_table)
+    aggregate = select(
+        Calculation.user_id,
+        Calculation.operation,
+        func.count(),
+        func.sum(Calculation.result),
+        func.min(Calculation.result),
+        func.max(Calculation.result),
+    ).group_by(Calculation.user_id, Calculation.operation)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        clear = clear.where(stats_table.c.user_id.in_(user_ids))
+        aggregate = aggregate.where(Calculation.user_id.in_(user_ids))
+
+    connection.execute(clear)
+    connection.execute(insert(stats_table).from_select(
+        ["user_id", "operation", "count", "total", "min_result", "max_result"], aggregate
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain per-user calculation statistics.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--user-id", type=int, default=None, help="Only rebuild this user's summaries")
+    args = parser.parse_args(argv)
+
+    from app.database import engine
+
+    with engine.begin() as connection:
+        rebuild_stats(connection, args.user_id)
+    print("Calculation statistics rebuilt")
+
+
+if __name__ == "__main__":
+    main()
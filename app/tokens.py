@@ -0,0 +1,124 @@
+"""Signed access and refresh tokens so authenticated requests skip bcrypt and the database.
+
+Tokens are compact HMAC-SHA256 JWTs (header.payload.signature, base64url).
+Login issues a short-lived access token and a longer-lived refresh token.
+Access tokens are checked with one HMAC and a JSON decode; nothing is looked
+up, so a token stays valid until it expires.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+import orjson
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# Every worker must share TOKEN_SECRET; the random fallback only suits a single process
+TOKEN_SECRET = os.getenv("TOKEN_SECRET") or secrets.token_urlsafe(32)
+ACCESS_TOKEN_SECONDS = int(os.getenv("ACCESS_TOKEN_SECONDS", "900"))
+REFRESH_TOKEN_SECONDS = int(os.getenv("REFRESH_TOKEN_SECONDS", str(14 * 24 * 3600)))
+
+ACCESS = "access"
+REFRESH = "refresh"
+
+
+class InvalidToken(ValueError):
+    """Raised when a token is malformed, forged, expired or of the wrong type."""
+
+
+def _b64encode(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+
+def _b64decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+
+HEADER = _b64encode(orjson.dumps({"alg": "HS256", "typ": "JWT"}))
+_secret = TOKEN_SECRET.encode()
+
+
+def _sign(signing_input: bytes) -> bytes:
+    return _b64encode(hmac.new(_secret, signing_input, hashlib.sha256).digest())
+
+
+def encode_token(user_id: int, token_type: str, lifetime: int, now: Optional[float] = None) -> str:
+    """Sign a token for ``user_id`` that expires ``lifetime`` seconds from now."""
+    issued = int(now if now is not None else time.time())
+    claims = {"sub": str(user_id), "typ": token_type, "iat": issued, "exp": issued + lifetime}
+    if token_type == REFRESH:
+        claims["jti"] = secrets.token_urlsafe(12)
+    signing_input = HEADER + b"." + _b64encode(orjson.dumps(claims))
+    return (signing_input + b"." + _sign(signing_input)).decode()
+
+
+def decode_token(token: str, token_type: str) -> dict:
+    """Verify a token's signature, type and expiry and return its claims."""
+    try:
+        signing_input, signature = token.encode().rsplit(b".", 1)
+        header, payload = signing_input.split(b".")
+    except (ValueError, UnicodeEncodeError):
+        raise InvalidToken("Malformed token")
+    if header != HEADER or not hmac.compare_digest(signature, _sign(signing_input)):
+        raise InvalidToken("Invalid token signature")
+    try:
+        claims = orjson.loads(_b64decode(payload))
+        user_id = int(claims["sub"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken("Malformed token")
+    if claims.get("typ") != token_type:
+        raise InvalidToken("Wrong token type")
+    if claims.get("exp", 0) <= time.time():
+        raise InvalidToken("Token has expired")
+    claims["sub"] = user_id
+    return claims
+
+
+def issue_tokens(user_id: int) -> dict:
+    """Access and refresh token pair returned by login and refresh."""
+    return {
+        "access_token": encode_token(user_id, ACCESS, ACCESS_TOKEN_SECONDS),
+        "refresh_token": encode_token(user_id, REFRESH, REFRESH_TOKEN_SECONDS),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_SECONDS,
+    }
+
+
+def unauthorized(detail: str) -> HTTPException:
+    """401 asking the client to authenticate with a bearer token."""
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+bearer = HTTPBearer(auto_error=False)
+
+
+async def token_user_id(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Optional[int]:
+    """Dependency returning the user ID of a valid bearer access token, or None without one.
+
+    Declared async so it runs inline on the event loop instead of the threadpool.
+    """
+    if credentials is None:
+        return None
+    try:
+        return decode_token(credentials.credentials, ACCESS)["sub"]
+    except InvalidToken as e:
+        raise unauthorized(str(e))
+
+
+def resolve_user_id(query_user_id: Optional[int], token_user: Optional[int]) -> Optional[int]:
+    """Pick the acting user: the token's when one was sent, else the user_id query parameter."""
+    if token_user is None:
+        return query_user_id
+    if query_user_id is not None and query_user_id != token_user:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="user_id does not match the access token"
+        )
+    return token_user
@@ -1,7 +1,14 @@
+import base64
+import sys
+import numpy as np
 from passlib.context import CryptContext
+from sqlalchemy import case, func, null
+from app.expressions import compile_expression
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context; hashes below min_rounds are flagged for rehash on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=12, bcrypt__min_rounds=12
+)
 
 
 def hash_password(password: str) -> str:
@@ -14,8 +21,38 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def encode_cursor(*values: float) -> str:
+    """Encode a keyset position as an opaque URL-safe cursor token."""
+    raw = ":".join(str(value) for value in values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _cursor_number(part: str) -> float:
+    # IDs and timestamps are stored as integers, result positions as exact float reprs
+    try:
+        return int(part)
+    except ValueError:
+        return float(part)
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """Decode a cursor token back into its keyset position of ``size`` numbers."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = tuple(_cursor_number(part) for part in base64.urlsafe_b64decode(padded).decode().split(":"))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
 def calculate(operation: str, operand1: float, operand2: float) -> float:
-    """Perform a mathematical calculation based on the operation."""
+    """Perform a mathematical calculation based on the operation.
+
+    The four named operations are computed directly; anything else is
+    treated as an expression in ``a`` (operand1) and ``b`` (operand2).
+    """
     if operation == "add":
         return operand1 + operand2
     elif operation == "subtract":
@@ -27,4 +64,63 @@ def calculate(operation: str, operand1: float, operand2: float) -> float:
             raise ValueError("Division by zero is not allowed")
         return operand1 / operand2
     else:
-        raise ValueError(f"Invalid operation: {operation}")
+        return compile_expression(operation).evaluate(operand1, operand2)
+
+
+def calculate_sql(operation: str, operand1, operand2):
+    """Build the SQL expression computing a calculation's result from operand columns.
+
+    Mirrors ``calculate`` for set-based updates; non-finite results become
+    NULL so the NOT NULL result column rejects them.
+    """
+    if operation == "add":
+        result = operand1 + operand2
+    elif operation == "subtract":
+        result = operand1 - operand2
+    elif operation == "multiply":
+        result = operand1 * operand2
+    elif operation == "divide":
+        result = operand1 / operand2
+    else:
+        result = compile_expression(operation).to_sql(operand1, operand2)
+    return case((func.abs(result) <= sys.float_info.max, result), else_=null())
+
+
+def calculate_batch(operations, operands1, operands2):
+    """Evaluate many calculations in one vectorized pass.
+
+    Rows are grouped by operation and each group is computed with a single
+    NumPy array operation; expressions are compiled once per group. Returns the results array and a list holding an
+    error message (or None) per row; rows with an error have a NaN result.
+    """
+    ops = np.asarray(operations, dtype=object)
+    a = np.asarray(operands1, dtype=np.float64)
+    b = np.asarray(operands2, dtype=np.float64)
+    results = np.full(len(ops), np.nan)
+    errors = [None] * len(ops)
+
+    for operation in set(ops.tolist()):
+        mask = ops == operation
+        if operation == "add":
+            results[mask] = a[mask] + b[mask]
+        elif operation == "subtract":
+            results[mask] = a[mask] - b[mask]
+        elif operation == "multiply":
+            results[mask] = a[mask] * b[mask]
+        elif operation == "divide":
+            zero = mask & (b == 0)
+            ok = mask & ~zero
+            results[ok] = a[ok] / b[ok]
+            for i in np.flatnonzero(zero):
+                errors[i] = "Division by zero is not allowed"
+        else:
+            rows = np.flatnonzero(mask)
+            try:
+                values, row_errors = compile_expression(operation).evaluate_many([a[mask], b[mask]])
+            except ValueError as e:
+                values, row_errors = np.full(len(rows), np.nan), [str(e)] * len(rows)
+            results[mask] = values
+            for i, error in zip(rows, row_errors):
+                errors[i] = error
+
+    return results, errors
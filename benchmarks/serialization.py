@@ -0,0 +1,69 @@
+"""Per-page CPU cost of encoding calculations: response-model path vs fast path.
+
+    python -m benchmarks.serialization [--rows 1000] [--repeat 50]
+
+"before" reproduces what FastAPI does for ``response_model=List[CalculationRead]``
+with ORM rows: validate every row (running its validators), convert with
+jsonable_encoder and encode with the stdlib json module. "after" is the path
+browse_calculations uses now: plain column rows encoded directly by orjson.
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from datetime import datetime
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from app.models import Calculation
+from app.schemas import CalculationRead
+from app.serialization import CALCULATION_FIELDS, dump_calculations
+
+CalculationRow = namedtuple("CalculationRow", CALCULATION_FIELDS)
+
+
+def make_rows(count: int):
+    """Build the same page as ORM instances and as plain column rows."""
+    now = datetime.utcnow()
+    values = [
+        dict(id=i, operation="divide", operand1=float(i), operand2=2.0, result=i / 2,
+             user_id=1, created_at=now, updated_at=now)
+        for i in range(1, count + 1)
+    ]
+    return [Calculation(**v) for v in values], [CalculationRow(**v) for v in values]
+
+
+def response_model_path(adapter: TypeAdapter, objects) -> bytes:
+    validated = adapter.validate_python(objects, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def cpu_ms(fn, repeat: int) -> float:
+    """Average CPU milliseconds per call."""
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare calculation page serialization cost.")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per page")
+    parser.add_argument("--repeat", type=int, default=50, help="Pages encoded per measurement")
+    args = parser.parse_args(argv)
+
+    objects, rows = make_rows(args.rows)
+    adapter = TypeAdapter(List[CalculationRead])
+    assert json.loads(response_model_path(adapter, objects)) == json.loads(dump_calculations(rows))
+
+    before = cpu_ms(lambda: response_model_path(adapter, objects), args.repeat)
+    after = cpu_ms(lambda: dump_calculations(rows), args.repeat)
+    print(f"rows per page:          {args.rows}")
+    print(f"before (response model): {before:8.3f} ms CPU per page")
+    print(f"after  (orjson rows):    {after:8.3f} ms CPU per page")
+    print(f"speedup:                 {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app
+from app.cache import cache
+from app.idempotency import front_cache
 from app.database import get_db
 from app.models import Base
 import os
@@ -37,8 +39,10 @@ def setup_database():
     # Create tables
     Base.metadata.create_all(bind=engine)
     yield
-    # Drop tables after test
+    # Drop tables and cached payloads after test
     Base.metadata.drop_all(bind=engine)
+    cache.clear()
+    front_cache.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,207 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI
+from app.admission import AUTH_TARGET_MS, AdaptiveLimiter, AdmissionMiddleware, Shed, default_limiters, route_class
+from app.hashing import HASH_POOL_SIZE, HASH_QUEUE_DEPTH
+from tests.conftest import client
+
+
+def limited_app(limiters):
+    """A tiny app whose /slow endpoint holds its admission slot for a while."""
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow(seconds: float = 0):
+        await asyncio.sleep(seconds)
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, limiters=limiters, enabled=True)
+    return app
+
+
+class TestRouteClass:
+    """Test suite for mapping requests to admission budgets."""
+
+    def test_classes(self):
+        """Test auth, read and write requests get separate budgets."""
+        assert route_class("POST", "/users/login") == "auth"
+        assert route_class("POST", "/users/register") == "auth"
+        assert route_class("GET", "/calculations") == "reads"
+        assert route_class("GET", "/users/1/stats") == "reads"
+        assert route_class("GET", "/calculations/export") == "exports"
+        assert route_class("POST", "/calculations") == "writes"
+        assert route_class("DELETE", "/calculations/1") == "writes"
+
+    def test_exempt(self):
+        """Test probes, metrics, docs, feed streams and preflight requests are never limited."""
+        for path in ("/", "/health", "/health/ready", "/metrics", "/docs", "/openapi.json", "/calculations/feed"):
+            assert route_class("GET", path) is None
+        assert route_class("OPTIONS", "/calculations") is None
+
+
+    def test_slow_classes_queue_past_their_target(self):
+        """Test auth and export waiters are not shed before one request can finish."""
+        limiters = default_limiters()
+        auth = limiters["auth"]
+        assert auth.queue_timeout * 1000 >= AUTH_TARGET_MS
+        assert auth.queue_size == HASH_QUEUE_DEPTH
+        assert auth.min_limit == max(HASH_POOL_SIZE, 1)
+        assert limiters["exports"].queue_timeout >= limiters["exports"].target
+        assert limiters["reads"].queue_timeout < auth.queue_timeout
+
+
+class TestAdaptiveLimiter:
+    """Test suite for the AIMD concurrency limiter."""
+
+    def test_queue_full_is_shed(self):
+        """Test requests beyond the limit and the queue are rejected at once."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=1, target_ms=100, queue_size=1, queue_timeout_ms=1000)
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(Shed) as shed:
+                await limiter.acquire()
+            assert shed.value.reason == "queue_full"
+            limiter.release(0.001)
+            await waiter
+            assert limiter.in_flight == 1
+
+        asyncio.run(scenario())
+
+    def test_queue_deadline(self):
+        """Test a queued request is shed when no slot frees up before its deadline."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=1, target_ms=100, queue_size=4, queue_timeout_ms=20)
+            await limiter.acquire()
+            with pytest.raises(Shed) as shed:
+                await limiter.acquire()
+            assert shed.value.reason == "timeout"
+            assert limiter.in_flight == 1
+            assert not limiter._waiters
+
+        asyncio.run(scenario())
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        """Test a queued request cancelled by a disconnect never takes or leaks a slot."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=1, target_ms=100, queue_size=4, queue_timeout_ms=1000)
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            assert len(limiter._waiters) == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert not limiter._waiters
+
+            limiter.release(0.001)
+            assert limiter.in_flight == 0
+            await limiter.acquire()
+            assert limiter.in_flight == 1
+
+        asyncio.run(scenario())
+
+    def test_cancelled_after_grant_returns_the_slot(self):
+        """Test a waiter cancelled after its slot was handed over gives the slot back."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=1, target_ms=100, queue_size=4, queue_timeout_ms=1000)
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            # Cancelled while the slot is handed over, before it can wake up
+            waiter.cancel()
+            limiter.release(0.001)
+            assert limiter.in_flight == 1
+            limit = limiter.limit
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert limiter.in_flight == 0
+            assert limiter.limit == limit
+
+        asyncio.run(scenario())
+
+    def test_additive_increase_when_saturated(self):
+        """Test fast responses grow a saturated limit, but not an idle one."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=2, target_ms=100, max_limit=3)
+            await limiter.acquire()
+            limiter.release(0.001)
+            assert limiter.limit == 2
+
+            for _ in range(20):
+                await limiter.acquire()
+                await limiter.acquire()
+                limiter.release(0.001)
+                limiter.release(0.001)
+            assert limiter.limit == 3
+
+        asyncio.run(scenario())
+
+    def test_multiplicative_decrease_on_slow_responses(self):
+        """Test slow responses shrink the limit, at most once per target interval, down to the minimum."""
+        async def scenario():
+            limiter = AdaptiveLimiter("test", initial=10, target_ms=0.001, backoff=0.5)
+            await limiter.acquire()
+            limiter.release(1.0)
+            assert limiter.limit == 5
+            for _ in range(10):
+                await limiter.acquire()
+                await asyncio.sleep(0.001)
+                limiter.release(1.0)
+            assert limiter.limit == 1
+
+        asyncio.run(scenario())
+
+
+class TestAdmissionMiddleware:
+    """Test suite for shedding load through the middleware."""
+
+    def test_excess_requests_get_503(self):
+        """Test concurrent requests over the budget are shed with Retry-After."""
+        limiters = {
+            name: AdaptiveLimiter(name, initial=1, target_ms=10000, queue_size=0, queue_timeout_ms=0)
+            for name in ("auth", "reads", "writes")
+        }
+        app = limited_app(limiters)
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await asyncio.gather(
+                    http.get("/slow?seconds=0.2"),
+                    http.get("/slow?seconds=0"),
+                )
+
+        held, shed = asyncio.run(scenario())
+        assert held.status_code == 200
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == "1"
+        assert limiters["reads"].in_flight == 0
+
+    def test_budgets_are_separate(self):
+        """Test a saturated read budget does not shed writes."""
+        limiters = {
+            name: AdaptiveLimiter(name, initial=1, target_ms=10000, queue_size=0, queue_timeout_ms=0)
+            for name in ("auth", "reads", "writes")
+        }
+        app = limited_app(limiters)
+
+        @app.post("/write")
+        def write():
+            return {"ok": True}
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await asyncio.gather(http.get("/slow?seconds=0.2"), http.post("/write"))
+
+        read, write = asyncio.run(scenario())
+        assert read.status_code == 200
+        assert write.status_code == 200
+
+    def test_app_requests_are_admitted(self):
+        """Test normal traffic through the real app passes admission control."""
+        assert client.get("/calculations").status_code == 200
+        assert "admission_limit" in client.get("/metrics").text
@@ -0,0 +1,201 @@
+import orjson
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from app import feed
+from app.database import get_async_db, to_async_url
+from app.idempotency import front_cache
+from app.main import with_async_overrides
+from app.routes import users, calculations, async_users, async_calculations
+from tests.conftest import TEST_DATABASE_URL
+
+# TestClient runs each request on a fresh event loop, so connections must not be pooled
+async_engine = create_async_engine(to_async_url(TEST_DATABASE_URL), poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+async def override_get_async_db():
+    """Override async database dependency for testing."""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+async_app = FastAPI()
+async_app.include_router(with_async_overrides(users.router, async_users.router))
+async_app.include_router(with_async_overrides(calculations.router, async_calculations.router))
+async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+async_client = TestClient(async_app)
+
+
+@pytest.fixture
+def async_user():
+    """Create a sample user through the async register route."""
+    user_data = {
+        "username": "asyncuser",
+        "email": "async@example.com",
+        "password": "asyncpassword123"
+    }
+    response = async_client.post("/users/register", json=user_data)
+    return response.json()
+
+
+class TestAsyncRouteSelection:
+    """Test suite for merging async handlers into the sync routers."""
+
+    def test_async_handlers_replace_sync_handlers(self):
+        """Test that every async route replaces its sync twin in place."""
+        merged = with_async_overrides(calculations.router, async_calculations.router)
+
+        assert [route.path for route in merged.routes] == [
+            route.path for route in calculations.router.routes
+        ]
+        async_endpoints = {route.endpoint for route in async_calculations.router.routes}
+        assert async_endpoints <= {route.endpoint for route in merged.routes}
+
+
+class TestAsyncUsers:
+    """Test suite for the async user routes."""
+
+    def test_register_and_login(self, async_user):
+        """Test registration and login through the async handlers."""
+        assert async_user["username"] == "asyncuser"
+
+        response = async_client.post(
+            "/users/login",
+            json={"username": "asyncuser", "password": "asyncpassword123"}
+        )
+
+        assert response.status_code == 200
+        assert "Login successful" in response.json()["message"]
+
+    def test_token_sessions(self, async_user):
+        """Test async login tokens work for adding, browsing and refreshing."""
+        tokens = async_client.post(
+            "/users/login",
+            json={"username": "asyncuser", "password": "asyncpassword123"}
+        ).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        created = async_client.post(
+            "/calculations", json={"operation": "add", "operand1": 1, "operand2": 2}, headers=headers
+        )
+        assert created.status_code == 201
+        assert created.json()["user_id"] == async_user["id"]
+        assert [row["id"] for row in async_client.get("/calculations", headers=headers).json()] == [created.json()["id"]]
+
+        refreshed = async_client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert refreshed.status_code == 200
+        assert refreshed.json()["access_token"]
+
+    def test_register_duplicate_username(self, async_user):
+        """Test duplicate username is rejected by the async handler."""
+        user_data = {
+            "username": "asyncuser",
+            "email": "other@example.com",
+            "password": "password123"
+        }
+        response = async_client.post("/users/register", json=user_data)
+
+        assert response.status_code == 400
+        assert "Username already registered" in response.json()["detail"]
+
+    def test_concurrent_idempotent_register(self, monkeypatch):
+        """Test a registration losing the username race replays the winner's response."""
+        user_data = {"username": "asyncracer", "email": "asyncracer@example.com", "password": "password123"}
+        headers = {"Idempotency-Key": "async-register-race"}
+        first = async_client.post("/users/register", json=user_data, headers=headers)
+
+        # Simulate a duplicate that passed the lookup before the first one committed
+        monkeypatch.setattr("app.routes.async_users.find_response", lambda *args: None)
+        front_cache.clear()
+        duplicate = async_client.post("/users/register", json=user_data, headers=headers)
+
+        assert duplicate.status_code == 201
+        assert duplicate.json() == first.json()
+
+    def test_get_user_not_found(self):
+        """Test reading a missing user through the async handler."""
+        response = async_client.get("/users/99999")
+
+        assert response.status_code == 404
+
+
+class TestAsyncCalculations:
+    """Test suite for the async calculation routes."""
+
+    def test_calculation_lifecycle(self, async_user):
+        """Test add, read, browse, edit and delete through the async handlers."""
+        calc = {"operation": "add", "operand1": 4, "operand2": 6}
+        created = async_client.post(f"/calculations?user_id={async_user['id']}", json=calc)
+        assert created.status_code == 201
+        calc_id = created.json()["id"]
+        assert created.json()["result"] == 10
+
+        assert async_client.get(f"/calculations/{calc_id}").json()["result"] == 10
+        assert len(async_client.get(f"/calculations?user_id={async_user['id']}").json()) == 1
+
+        edited = async_client.patch(f"/calculations/{calc_id}", json={"operation": "multiply"})
+        assert edited.status_code == 200
+        assert edited.json()["result"] == 24
+
+        rollup = async_client.get(f"/calculations/rollup?user_id={async_user['id']}").json()
+        assert [(point["operation"], point["count"]) for point in rollup] == [("multiply", 1)]
+
+        deleted = async_client.delete(f"/calculations/{calc_id}")
+        assert deleted.status_code == 200
+        assert async_client.get(f"/calculations/{calc_id}").status_code == 404
+
+    def test_add_calculation_nonexistent_user(self):
+        """Test adding a calculation for a missing user through the async handler."""
+        calc = {"operation": "add", "operand1": 5, "operand2": 3}
+        response = async_client.post("/calculations?user_id=99999", json=calc)
+
+        assert response.status_code == 404
+        assert "User not found" in response.json()["detail"]
+
+    def test_bulk_update_and_delete(self, async_user, monkeypatch):
+        """Test the bulk routes through the async handlers, publishing every affected row."""
+        ids = [
+            async_client.post(
+                f"/calculations?user_id={async_user['id']}",
+                json={"operation": "add", "operand1": operand, "operand2": 1},
+            ).json()["id"]
+            for operand in (1, 2)
+        ]
+        published = []
+        monkeypatch.setattr(
+            feed, "publish", lambda user_id, event, data: published.append((event, orjson.loads(data)["id"]))
+        )
+
+        updated = async_client.patch("/calculations/bulk", json={
+            "filter": {"user_id": async_user["id"]}, "changes": {"operation": "b ** a"},
+        })
+        assert updated.json() == {"affected": 2}
+        assert sorted(c["result"] for c in async_client.get("/calculations").json()) == [1, 1]
+
+        deleted = async_client.request("DELETE", "/calculations/bulk", json={"operation": "b ** a"})
+        assert deleted.json() == {"affected": 2}
+        assert sorted(published) == [("deleted", ids[0]), ("deleted", ids[1]), ("updated", ids[0]), ("updated", ids[1])]
+
+    def test_idempotent_add(self, async_user):
+        """Test a retried add replays the stored response through the async handler."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        headers = {"Idempotency-Key": "async-1"}
+        first = async_client.post(f"/calculations?user_id={async_user['id']}", json=calc, headers=headers)
+        retry = async_client.post(f"/calculations?user_id={async_user['id']}", json=calc, headers=headers)
+
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert len(async_client.get("/calculations").json()) == 1
+
+    def test_conditional_reads(self, async_user):
+        """Test ETags and 304 responses through the async handlers."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        calc_id = async_client.post(f"/calculations?user_id={async_user['id']}", json=calc).json()["id"]
+
+        for url in (f"/calculations/{calc_id}", "/calculations"):
+            etag = async_client.get(url).headers["ETag"]
+            assert async_client.get(url, headers={"If-None-Match": etag}).status_code == 304
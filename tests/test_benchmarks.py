@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from app.main import app
+from benchmarks.run import compare, median_results, percentile, run_benchmarks
+
+
+class TestBenchmarkHarness:
+    """Test suite for the in-process benchmark harness."""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        samples = list(range(1, 101))
+
+        assert percentile(samples, 50) == 50
+        assert percentile(samples, 99) == 99
+        assert percentile([7], 99) == 7
+
+    def test_compare_flags_regressions(self):
+        """Test throughput drops, p99 increases and errors are reported."""
+        baseline = {"read_calculation": {"rps": 1000, "p99_ms": 10}}
+        ok = {"read_calculation": {"rps": 900, "p99_ms": 11, "errors": 0}}
+        slow = {"read_calculation": {"rps": 500, "p99_ms": 30, "errors": 2}}
+
+        assert compare(ok, baseline, tolerance=0.25) == []
+        assert len(compare(slow, baseline, tolerance=0.25)) == 3
+        assert compare({"new_endpoint": slow["read_calculation"]}, baseline, 0.25) == []
+
+    def test_median_of_runs(self):
+        """Test several passes combine into median timings and total errors."""
+        runs = [
+            {"read_calculation": {"requests": 5, "rps": rps, "p50_ms": 1, "p95_ms": 2, "p99_ms": p99, "errors": errors}}
+            for rps, p99, errors in ((900, 10, 0), (100, 1500, 1), (1000, 12, 0))
+        ]
+
+        combined = median_results(runs)["read_calculation"]
+
+        assert (combined["rps"], combined["p99_ms"], combined["errors"]) == (900, 12, 1)
+        assert combined["requests"] == 5
+
+    def test_run_benchmarks_in_process(self):
+        """Test a short run reports every metric for the selected endpoints."""
+        results = asyncio.run(run_benchmarks(
+            app, requests=5, concurrency=2,
+            endpoints=["read_calculation", "browse_calculations"], seed_calculations=5,
+        ))
+
+        assert set(results) == {"read_calculation", "browse_calculations"}
+        for result in results.values():
+            assert result["errors"] == 0
+            assert result["rps"] > 0
+            assert result["p50_ms"] <= result["p99_ms"]
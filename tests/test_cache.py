@@ -0,0 +1,104 @@
+import time
+import pytest
+from app.cache import LRUCache, cache
+from tests.conftest import client
+
+
+class TestLRUCache:
+    """Test suite for the in-process LRU cache."""
+
+    def test_get_and_set(self):
+        """Test a stored value is returned and counted as a hit."""
+        lru = LRUCache(max_entries=2, ttl=60)
+        lru.set("a", b"1")
+
+        assert lru.get("a") == b"1"
+        assert lru.get("missing") is None
+        assert lru.stats()["hits"] == 1
+        assert lru.stats()["misses"] == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """Test the oldest untouched entry is evicted when full."""
+        lru = LRUCache(max_entries=2, ttl=60)
+        lru.set("a", b"1")
+        lru.set("b", b"2")
+        lru.get("a")
+        lru.set("c", b"3")
+
+        assert lru.get("b") is None
+        assert lru.get("a") == b"1"
+        assert lru.stats()["evictions"] == 1
+
+    def test_expired_entry_is_a_miss(self):
+        """Test entries are dropped after their TTL."""
+        lru = LRUCache(max_entries=2, ttl=0.01)
+        lru.set("a", b"1")
+        time.sleep(0.02)
+
+        assert lru.get("a") is None
+        assert lru.stats()["evictions"] == 1
+
+    def test_disabled_cache_stores_nothing(self):
+        """Test a zero-size cache never stores entries."""
+        lru = LRUCache(max_entries=0, ttl=60)
+        lru.set("a", b"1")
+
+        assert lru.get("a") is None
+
+
+class TestReadThroughCache:
+    """Test suite for cached read endpoints."""
+
+    def test_read_calculation_is_cached(self, sample_user):
+        """Test the second read of a calculation is served from the cache."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        calc_id = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()["id"]
+        # A client that just wrote bypasses the cache; read as another client
+        client.cookies.clear()
+        hits = cache.stats()["hits"]
+
+        first = client.get(f"/calculations/{calc_id}")
+        second = client.get(f"/calculations/{calc_id}")
+
+        assert first.json() == second.json()
+        assert cache.stats()["hits"] == hits + 1
+
+    def test_edit_invalidates_calculation(self, sample_user):
+        """Test editing a calculation drops its cached payload."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        calc_id = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()["id"]
+        client.get(f"/calculations/{calc_id}")
+
+        client.patch(f"/calculations/{calc_id}", json={"operation": "multiply"})
+        response = client.get(f"/calculations/{calc_id}")
+
+        assert response.json()["result"] == 2
+
+    def test_delete_invalidates_calculation(self, sample_user):
+        """Test deleting a calculation drops its cached payload."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        calc_id = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()["id"]
+        client.get(f"/calculations/{calc_id}")
+
+        client.delete(f"/calculations/{calc_id}")
+
+        assert client.get(f"/calculations/{calc_id}").status_code == 404
+
+    def test_get_user_is_cached(self, sample_user):
+        """Test the second read of a user is served from the cache."""
+        client.cookies.clear()
+        hits = cache.stats()["hits"]
+
+        client.get(f"/users/{sample_user['id']}")
+        response = client.get(f"/users/{sample_user['id']}")
+
+        assert response.status_code == 200
+        assert response.json()["username"] == "testuser"
+        assert cache.stats()["hits"] == hits + 1
+
+    def test_cache_stats_endpoint(self):
+        """Test the cache counters are exposed."""
+        response = client.get("/health/cache")
+
+        assert response.status_code == 200
+        assert {"hits", "misses", "evictions"} <= set(response.json())
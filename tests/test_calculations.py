@@ -1,5 +1,12 @@
+import csv
+import io
+import json
 import pytest
-from tests.conftest import client
+from datetime import datetime
+from sqlalchemy import event, text
+from app.partitions import is_partitioned
+from app.routes.calculations import browse_statement, default_sort
+from tests.conftest import client, engine
 
 
 class TestCalculationBrowse:
@@ -64,6 +71,191 @@ class TestCalculationBrowse:
         assert len(data) == 1
         assert data[0]["user_id"] == sample_user["id"]
 
+    
+    def test_browse_calculations_cursor_pagination(self, sample_user):
+        """Test walking all pages with the keyset cursor."""
+        for i in range(5):
+            calc = {"operation": "add", "operand1": i, "operand2": 1}
+            client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        
+        seen = []
+        cursor = None
+        for _ in range(5):
+            url = "/calculations?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            assert response.status_code == 200
+            seen.extend(calc["id"] for calc in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        
+        assert len(seen) == 5
+        assert seen == sorted(seen)
+    
+    def test_browse_calculations_cursor_with_user_filter(self, sample_user):
+        """Test the cursor stays within the filtered user."""
+        user2_data = {
+            "username": "user2",
+            "email": "user2@example.com",
+            "password": "password123"
+        }
+        user2 = client.post("/users/register", json=user2_data).json()
+        for owner in (sample_user, user2, sample_user, user2, sample_user):
+            calc = {"operation": "add", "operand1": 1, "operand2": 1}
+            client.post(f"/calculations?user_id={owner['id']}", json=calc)
+        
+        first = client.get(f"/calculations?user_id={sample_user['id']}&limit=2")
+        cursor = first.headers["X-Next-Cursor"]
+        second = client.get(f"/calculations?user_id={sample_user['id']}&limit=2&cursor={cursor}")
+        
+        assert len(second.json()) == 1
+        assert second.json()[0]["user_id"] == sample_user["id"]
+        assert "X-Next-Cursor" not in second.headers
+    
+    def test_browse_calculations_invalid_cursor(self):
+        """Test browsing with a malformed cursor."""
+        response = client.get("/calculations?cursor=not-a-cursor")
+        
+        assert response.status_code == 400
+        assert "Invalid cursor" in response.json()["detail"]
+    
+    def test_browse_calculations_skip_and_cursor(self):
+        """Test that skip and cursor cannot be combined."""
+        response = client.get("/calculations?skip=1&cursor=MTox")
+        
+        assert response.status_code == 400
+
+
+class TestCalculationBrowseFilters:
+    """Test suite for browse filters and sort orders."""
+
+    @pytest.fixture
+    def mixed(self, sample_user):
+        """Create calculations with a spread of operations and results."""
+        for operation, operand1, operand2 in (
+            ("add", 1, 1), ("divide", 10, 2), ("divide", 9, 3), ("multiply", 3, 3), ("divide", 1, 4), ("subtract", 0, 7),
+        ):
+            calc = {"operation": operation, "operand1": operand1, "operand2": operand2}
+            client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        return sample_user
+
+    def test_filter_by_operation(self, mixed):
+        """Test only calculations with the requested operation are returned."""
+        response = client.get("/calculations?operation=divide")
+
+        assert response.status_code == 200
+        assert [row["result"] for row in response.json()] == [5, 3, 0.25]
+
+    def test_filter_by_result_range(self, mixed):
+        """Test an inclusive result range, sorted by result by default."""
+        response = client.get("/calculations?result_min=2&result_max=5")
+
+        assert [row["result"] for row in response.json()] == [2, 3, 5]
+
+    def test_filter_combination(self, mixed):
+        """Test operation, result and created_at filters combine."""
+        response = client.get(
+            f"/calculations?user_id={mixed['id']}&operation=divide&result_min=1"
+            "&created_after=2000-01-01T00:00:00&sort=-result"
+        )
+
+        assert [row["result"] for row in response.json()] == [5, 3]
+
+    def test_sort_descending_result_with_cursor(self, mixed):
+        """Test walking result-sorted pages with the keyset cursor."""
+        results, cursor = [], None
+        while True:
+            url = "/calculations?sort=-result&limit=4" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            results += [row["result"] for row in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        assert results == [9, 5, 3, 2, 0.25, -7]
+
+    def test_sort_created_at_with_cursor(self, mixed):
+        """Test walking created_at-sorted pages visits every row once."""
+        first = client.get("/calculations?sort=created_at&limit=3")
+        second = client.get(f"/calculations?sort=created_at&limit=3&cursor={first.headers['X-Next-Cursor']}")
+
+        ids = [row["id"] for row in first.json() + second.json()]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == 6
+
+    def test_invalid_sort(self):
+        """Test an unsupported sort is rejected."""
+        response = client.get("/calculations?sort=operand1")
+
+        assert response.status_code == 422
+
+
+class TestCalculationBrowsePlans:
+    """Test that every supported browse filter combination is served by an index range scan."""
+
+    CASES = (
+        ({"user_id": 1}, "ix_calculations_user_id_id"),
+        ({"user_id": 1, "operation": "add"}, "ix_calculations_user_id_id"),
+        ({"user_id": 1, "result_min": 1.0}, "ix_calculations_user_id_result"),
+        ({"user_id": 1, "created_after": "2024-01-01", "sort": "-created_at"}, "ix_calculations_user_id_created_at"),
+        ({"operation": "divide"}, "ix_calculations_operation_created_at"),
+        ({"operation": "divide", "sort": "created_at"}, "ix_calculations_operation_created_at"),
+        ({"operation": "divide", "created_after": "2024-01-01"}, "ix_calculations_operation_created_at"),
+        ({"operation": "divide", "result_min": 1.0, "result_max": 5.0}, "ix_calculations_operation_result"),
+        ({"result_min": 3.0}, "ix_calculations_result"),
+        ({"created_after": "2024-01-01", "created_before": "2024-02-01"}, "ix_calculations_created_at"),
+    )
+
+    @staticmethod
+    def browse_sql(params):
+        params = {
+            key: datetime.fromisoformat(value) if key.startswith("created_") else value
+            for key, value in params.items()
+        }
+        params.setdefault("sort", default_sort(
+            params.get("result_min"), params.get("result_max"), params.get("created_after"), params.get("created_before"),
+            params.get("user_id"), params.get("operation"),
+        ))
+        stmt = browse_statement(**params).limit(100)
+        return str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+
+    @pytest.mark.parametrize("params,index", CASES)
+    def test_query_plan_uses_index(self, params, index):
+        """Test the browse query plan searches the expected index and needs no extra sort."""
+        if engine.dialect.name != "sqlite":
+            pytest.skip("SQLite EXPLAIN QUERY PLAN")
+        with engine.connect() as connection:
+            plan = [row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + self.browse_sql(params)))]
+
+        assert plan[0].startswith(f"SEARCH calculations USING INDEX {index} (")
+        assert not any("TEMP B-TREE" in step for step in plan)
+
+    @pytest.mark.parametrize("params,index", CASES)
+    def test_postgres_plan_uses_index(self, params, index):
+        """Test Postgres can serve each browse from the expected index without a sort step.
+
+        Sequential scans, bitmap scans and sorts are priced out, so a test
+        table of any size still gets the plan a large table would.
+        """
+        if engine.dialect.name != "postgresql":
+            pytest.skip("Postgres EXPLAIN")
+        with engine.begin() as connection:
+            for setting in ("enable_seqscan", "enable_bitmapscan", "enable_sort"):
+                connection.execute(text(f"SET LOCAL {setting} = off"))
+            plan = connection.execute(text("EXPLAIN (FORMAT JSON) " + self.browse_sql(params))).scalar()
+            partitioned = is_partitioned(connection)
+
+        nodes, pending = [], [plan[0]["Plan"]]
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(node.get("Plans", ()))
+        assert not any(node["Node Type"] in ("Sort", "Incremental Sort") for node in nodes)
+        scans = [node for node in nodes if node["Node Type"] in ("Index Scan", "Index Only Scan")]
+        assert scans
+        if not partitioned:
+            assert {node["Index Name"] for node in scans} == {index}
+
 
 class TestCalculationRead:
     """Test suite for reading individual calculations."""
@@ -97,6 +289,50 @@ class TestCalculationRead:
         assert "Calculation not found" in response.json()["detail"]
 
 
+class TestCalculationExport:
+    """Test suite for streaming calculation export."""
+    
+    def test_export_ndjson(self, sample_user):
+        """Test exporting calculations as NDJSON."""
+        for i in range(3):
+            calc = {"operation": "multiply", "operand1": i, "operand2": 2}
+            client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        
+        response = client.get(f"/calculations/export?user_id={sample_user['id']}")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["result"] for row in rows] == [0, 2, 4]
+        assert all(row["user_id"] == sample_user["id"] for row in rows)
+    
+    def test_export_csv(self, sample_user):
+        """Test exporting calculations as CSV."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        
+        response = client.get("/calculations/export?format=csv")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 1
+        assert rows[0]["operation"] == "add"
+        assert float(rows[0]["result"]) == 3
+    
+    def test_export_empty(self):
+        """Test exporting when no calculations exist."""
+        response = client.get("/calculations/export")
+        
+        assert response.status_code == 200
+        assert response.text == ""
+    
+    def test_export_invalid_format(self):
+        """Test exporting with an unsupported format."""
+        response = client.get("/calculations/export?format=xml")
+        
+        assert response.status_code == 422
+
 class TestCalculationAdd:
     """Test suite for adding calculations."""
     
@@ -180,6 +416,26 @@ class TestCalculationAdd:
         assert response.status_code == 404
         assert "User not found" in response.json()["detail"]
 
+    
+    def test_add_calculation_without_user_lookup(self, sample_user):
+        """Test adding a calculation skips the user SELECT and the refresh."""
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.post(
+                f"/calculations?user_id={sample_user['id']}",
+                json={"operation": "multiply", "operand1": 4, "operand2": 2.5}
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert response.status_code == 201
+        assert response.json()["result"] == 10
+        assert response.json()["user_id"] == sample_user["id"]
+        assert not any(statement.startswith("SELECT") for statement in statements)
+        assert statements[0].startswith("INSERT INTO calculations")
+
 
 class TestCalculationEdit:
     """Test suite for editing calculations."""
@@ -340,3 +596,174 @@ class TestCalculationIntegration:
         # 6. Verify deletion
         verify_response = client.get(f"/calculations/{calc_id}")
         assert verify_response.status_code == 404
+
+
+class TestCalculationBatch:
+    """Test suite for the batch calculation endpoint."""
+    
+    def test_batch_all_operations(self, sample_user):
+        """Test a batch mixing every operation."""
+        items = [
+            {"operation": "add", "operand1": 1, "operand2": 2},
+            {"operation": "subtract", "operand1": 10, "operand2": 4},
+            {"operation": "multiply", "operand1": 3, "operand2": 5},
+            {"operation": "divide", "operand1": 9, "operand2": 3},
+        ]
+        response = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=items)
+        
+        assert response.status_code == 201
+        data = response.json()
+        assert data["created"] == 4
+        assert data["failed"] == 0
+        assert [r["calculation"]["result"] for r in data["results"]] == [3, 6, 15, 3]
+        assert [r["index"] for r in data["results"]] == [0, 1, 2, 3]
+        
+        browse_response = client.get(f"/calculations?user_id={sample_user['id']}")
+        assert len(browse_response.json()) == 4
+    
+    def test_batch_division_by_zero_is_per_item(self, sample_user):
+        """Test that division by zero fails only the affected item."""
+        items = [
+            {"operation": "divide", "operand1": 1, "operand2": 0},
+            {"operation": "add", "operand1": 2, "operand2": 2},
+        ]
+        response = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=items)
+        
+        assert response.status_code == 201
+        data = response.json()
+        assert data["created"] == 1
+        assert data["failed"] == 1
+        assert data["results"][0]["calculation"] is None
+        assert "Division by zero" in data["results"][0]["error"]
+        assert data["results"][1]["calculation"]["result"] == 4
+        assert data["results"][1]["calculation"]["user_id"] == sample_user["id"]
+    
+    def test_batch_invalid_operation_rejects_request(self, sample_user):
+        """Test that schema errors reject the whole batch."""
+        items = [
+            {"operation": "add", "operand1": 1, "operand2": 2},
+            {"operation": "power", "operand1": 2, "operand2": 3},
+        ]
+        response = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=items)
+        
+        assert response.status_code == 422
+    
+    def test_batch_empty_list(self, sample_user):
+        """Test that an empty batch is rejected."""
+        response = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=[])
+        
+        assert response.status_code == 422
+    
+    def test_batch_nonexistent_user(self):
+        """Test batch for a non-existent user."""
+        items = [{"operation": "add", "operand1": 1, "operand2": 2}]
+        response = client.post("/calculations/batch?user_id=99999", json=items)
+        
+        assert response.status_code == 404
+        assert "User not found" in response.json()["detail"]
+
+
+class TestCalculationBulk:
+    """Test suite for bulk update and bulk delete."""
+    
+    def _add(self, user_id, operation, operand1, operand2):
+        calc = {"operation": operation, "operand1": operand1, "operand2": operand2}
+        return client.post(f"/calculations?user_id={user_id}", json=calc).json()
+    
+    def test_bulk_update_by_ids_recomputes_results(self, sample_user):
+        """Test operand changes recompute each row with its own operation."""
+        added = self._add(sample_user["id"], "add", 1, 2)
+        divided = self._add(sample_user["id"], "divide", 9, 3)
+        expression = self._add(sample_user["id"], "a % b + sqrt(b)", 7, 4)
+        untouched = self._add(sample_user["id"], "add", 5, 5)
+        
+        response = client.patch("/calculations/bulk", json={
+            "filter": {"ids": [added["id"], divided["id"], expression["id"]]},
+            "changes": {"operand1": -7},
+        })
+        
+        assert response.status_code == 200
+        assert response.json() == {"affected": 3}
+        results = {calc["id"]: calc["result"] for calc in client.get("/calculations").json()}
+        assert results[added["id"]] == -5
+        assert results[divided["id"]] == pytest.approx(-7 / 3)
+        assert results[expression["id"]] == pytest.approx(-7 % 4 + 2)
+        assert results[untouched["id"]] == 10
+    
+    def test_bulk_update_operation_by_filter(self, sample_user):
+        """Test replacing the operation for a filtered set updates the statistics."""
+        for operand in (1, 2, 3):
+            self._add(sample_user["id"], "add", operand, 10)
+        self._add(sample_user["id"], "subtract", 1, 1)
+        
+        response = client.patch("/calculations/bulk", json={
+            "filter": {"user_id": sample_user["id"], "operation": "add"},
+            "changes": {"operation": "multiply"},
+        })
+        
+        assert response.json() == {"affected": 3}
+        stats = client.get(f"/users/{sample_user['id']}/stats").json()
+        operations = {row["operation"]: row for row in stats["operations"]}
+        assert set(operations) == {"multiply", "subtract"}
+        assert operations["multiply"]["total"] == 60
+        assert operations["multiply"]["max_result"] == 30
+    
+    def test_bulk_update_undefined_result_changes_nothing(self, sample_user):
+        """Test the whole update is rejected when one new result is undefined."""
+        kept = self._add(sample_user["id"], "divide", 8, 2)
+        self._add(sample_user["id"], "add", 1, 1)
+        
+        response = client.patch("/calculations/bulk", json={
+            "filter": {"user_id": sample_user["id"]},
+            "changes": {"operand2": 0},
+        })
+        
+        assert response.status_code == 400
+        assert client.get(f"/calculations/{kept['id']}").json()["result"] == 4
+    
+    def test_bulk_update_invalidates_cache(self, sample_user):
+        """Test cached detail responses do not outlive a bulk update."""
+        calc = self._add(sample_user["id"], "add", 1, 1)
+        client.get(f"/calculations/{calc['id']}")
+        
+        client.patch("/calculations/bulk", json={"filter": {"ids": [calc["id"]]}, "changes": {"operand2": 9}})
+        
+        assert client.get(f"/calculations/{calc['id']}").json()["result"] == 10
+    
+    def test_bulk_requires_criteria(self):
+        """Test an empty filter is refused instead of touching every row."""
+        response = client.request("DELETE", "/calculations/bulk", json={})
+        
+        assert response.status_code == 400
+        assert "filter" in response.json()["detail"]
+    
+    def test_bulk_delete_by_created_range(self, sample_user):
+        """Test deleting by user and creation time, with a constant statement count."""
+        for operand in range(20):
+            self._add(sample_user["id"], "add", operand, 1)
+        created = [calc["created_at"] for calc in client.get("/calculations").json()]
+        
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.request("DELETE", "/calculations/bulk", json={
+                "user_id": sample_user["id"],
+                "created_after": min(created),
+                "created_before": "2999-01-01T00:00:00",
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert response.json() == {"affected": 20}
+        assert client.get("/calculations").json() == []
+        assert client.get(f"/users/{sample_user['id']}/stats").json()["count"] == 0
+        # Select users, delete, two stats rebuild statements and one rollup upsert
+        assert len(statements) <= 5
+    
+    def test_bulk_delete_nothing_matched(self, sample_user):
+        """Test a filter matching no rows reports zero."""
+        response = client.request("DELETE", "/calculations/bulk", json={"ids": [12345]})
+        
+        assert response.status_code == 200
+        assert response.json() == {"affected": 0}
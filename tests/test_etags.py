@@ -0,0 +1,97 @@
+from sqlalchemy import event
+from app.cache import cache
+from app.etags import etag_matches
+from tests.conftest import client, engine
+
+
+def add(user_id, operand1=1, operand2=2):
+    calc = {"operation": "add", "operand1": operand1, "operand2": operand2}
+    return client.post(f"/calculations?user_id={user_id}", json=calc).json()
+
+
+class TestEtagMatching:
+    """Test suite for If-None-Match parsing."""
+
+    def test_matches_lists_weak_tags_and_wildcard(self):
+        """Test a tag matches in a list, with a weak prefix, or via *."""
+        assert etag_matches('"a", "b"', '"b"')
+        assert etag_matches('W/"b"', '"b"')
+        assert etag_matches("*", '"b"')
+        assert not etag_matches('"a"', '"b"')
+        assert not etag_matches(None, '"b"')
+
+
+class TestCalculationEtags:
+    """Test suite for conditional reads of a single calculation."""
+
+    def test_read_revalidates_until_edited(self, sample_user):
+        """Test a matching tag gets 304 until the calculation changes."""
+        calc = add(sample_user["id"])
+        first = client.get(f"/calculations/{calc['id']}")
+        etag = first.headers["ETag"]
+
+        unchanged = client.get(f"/calculations/{calc['id']}", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.content == b""
+        assert unchanged.headers["ETag"] == etag
+
+        client.patch(f"/calculations/{calc['id']}", json={"operand1": 5})
+        changed = client.get(f"/calculations/{calc['id']}", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert changed.json()["result"] == 7
+
+    def test_uncached_revalidation_reads_only_metadata(self, sample_user):
+        """Test a 304 without a cached payload only selects updated_at."""
+        calc = add(sample_user["id"])
+        etag = client.get(f"/calculations/{calc['id']}").headers["ETag"]
+        cache.clear()
+
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.get(f"/calculations/{calc['id']}", headers={"If-None-Match": etag})
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        assert response.status_code == 304
+        assert len(statements) == 1
+        assert "operand1" not in statements[0]
+
+
+class TestPageEtags:
+    """Test suite for conditional browsing."""
+
+    def test_page_revalidates_until_rows_change(self, sample_user):
+        """Test a page tag survives reads and changes with inserts, edits and deletes."""
+        first = add(sample_user["id"])
+        add(sample_user["id"])
+        url = f"/calculations?user_id={sample_user['id']}"
+        etag = client.get(url).headers["ETag"]
+
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.get(url, headers={"If-None-Match": etag})
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert response.status_code == 304
+        assert len(statements) == 1
+        assert "operand1" not in statements[0]
+
+        tags = {etag}
+        add(sample_user["id"])
+        tags.add(client.get(url).headers["ETag"])
+        client.patch(f"/calculations/{first['id']}", json={"operand2": 10})
+        tags.add(client.get(url).headers["ETag"])
+        client.delete(f"/calculations/{first['id']}")
+        tags.add(client.get(url).headers["ETag"])
+        assert len(tags) == 4
+
+    def test_empty_page_has_tag(self):
+        """Test an empty result can be revalidated too."""
+        etag = client.get("/calculations").headers["ETag"]
+
+        assert client.get("/calculations", headers={"If-None-Match": etag}).status_code == 304
@@ -0,0 +1,120 @@
+import pytest
+from app.expressions import compile_expression, validate_operation
+from app.utils import calculate, calculate_batch
+from tests.conftest import client
+
+
+class TestExpressionEngine:
+    """Test suite for compiled expressions."""
+
+    def test_evaluate_chained_operands(self):
+        """Test an expression over more than two operands."""
+        expression = compile_expression("(a + b) * c / d")
+
+        assert expression.arity == 4
+        assert expression.evaluate(1, 2, 3, 4) == 2.25
+
+    def test_power_modulo_and_sqrt(self):
+        """Test the extended operators and functions."""
+        assert compile_expression("sqrt(a) + b ** 2 % 5").evaluate(16, 3) == 8
+        assert compile_expression("-a + abs(b)").evaluate(1, -4) == 3
+
+    def test_compiled_form_is_cached(self):
+        """Test repeated expression text reuses the compiled evaluator."""
+        assert compile_expression("a * b + 1") is compile_expression("a * b + 1")
+
+    def test_evaluation_errors(self):
+        """Test math errors surface as ValueError."""
+        with pytest.raises(ValueError, match="Division by zero"):
+            compile_expression("a / b").evaluate(1, 0)
+        with pytest.raises(ValueError, match="undefined"):
+            compile_expression("sqrt(a)").evaluate(-1)
+        with pytest.raises(ValueError, match="out of range"):
+            compile_expression("a ** 9 ** 9").evaluate(10)
+        with pytest.raises(ValueError, match="needs 3 operands"):
+            compile_expression("a + b + c").evaluate(1, 2)
+
+    @pytest.mark.parametrize("text", [
+        "power", "__import__('os')", "a.real", "sqrt", "1 if a else 2", "a < b", "lambda: 1", "a" * 300,
+    ])
+    def test_rejects_unsupported_syntax(self, text):
+        """Test anything beyond arithmetic is refused at compile time."""
+        with pytest.raises(ValueError):
+            compile_expression(text)
+
+    def test_evaluate_many(self):
+        """Test one compiled expression over many operand sets."""
+        results, errors = compile_expression("a / b + 1").evaluate_many([[1, 4, 3], [1, 2, 0]])
+
+        assert results[:2].tolist() == [2, 3]
+        assert errors == [None, None, "Expression is undefined for these operands"]
+
+    def test_named_operations_stay_valid(self):
+        """Test the four named operations remain accepted."""
+        for operation in ("add", "subtract", "multiply", "divide"):
+            assert validate_operation(operation) == operation
+        assert calculate("multiply", 3, 4) == 12
+
+    def test_operations_only_read_stored_operands(self):
+        """Test an expression reading more than a and b is rejected as an operation."""
+        assert validate_operation("a * b + 1") == "a * b + 1"
+        with pytest.raises(ValueError, match="only use a and b"):
+            validate_operation("a + b + c")
+
+    def test_calculate_batch_with_expressions(self):
+        """Test batches mix named operations and expressions."""
+        results, errors = calculate_batch(["add", "a ** b", "a % b"], [1, 2, 7], [2, 3, 0])
+
+        assert results[:2].tolist() == [3, 8]
+        assert errors[2] is not None
+
+
+class TestExpressionCalculations:
+    """Test suite for expression calculations through the API."""
+
+    def test_add_expression_calculation(self, sample_user):
+        """Test storing a calculation defined by an expression."""
+        calc = {"operation": "(a + b) / 2", "operand1": 3, "operand2": 5}
+        response = client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+
+        assert response.status_code == 201
+        assert response.json()["result"] == 4
+        assert response.json()["operation"] == "(a + b) / 2"
+
+    def test_expression_evaluation_error(self, sample_user):
+        """Test an expression failing for its operands returns 400."""
+        calc = {"operation": "a % b", "operand1": 3, "operand2": 0}
+        response = client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+
+        assert response.status_code == 400
+        assert "Division by zero" in response.json()["detail"]
+
+    def test_edit_to_expression(self, sample_user):
+        """Test switching a calculation to an expression recomputes it."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+        calc_id = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()["id"]
+
+        response = client.patch(f"/calculations/{calc_id}", json={"operation": "a ** b"})
+
+        assert response.status_code == 200
+        assert response.json()["result"] == 8
+
+    def test_invalid_expression_rejected(self, sample_user):
+        """Test a malformed expression is a validation error."""
+        calc = {"operation": "a +* b", "operand1": 1, "operand2": 2}
+        response = client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+
+        assert response.status_code == 422
+
+    def test_expression_with_extra_operands_rejected(self, sample_user):
+        """Test an expression reading c or later is a validation error on every write path."""
+        calc = {"operation": "a + b + c", "operand1": 1, "operand2": 2}
+        response = client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        assert response.status_code == 422
+
+        batch = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=[calc])
+        assert batch.status_code == 422
+
+        added = client.post(f"/calculations?user_id={sample_user['id']}", json={**calc, "operation": "add"})
+        calc_id = added.json()["id"]
+        assert client.patch(f"/calculations/{calc_id}", json={"operation": "z"}).status_code == 422
@@ -0,0 +1,182 @@
+import asyncio
+import orjson
+from app import feed
+from app.feed import EVICTED, FeedBroker, PostgresBridge, sse_frame
+from app.main import app
+from tests.conftest import client
+
+
+def events(frames) -> list:
+    """Parse SSE frames into (event, data) pairs."""
+    parsed = []
+    for frame in b"".join(frames).split(b"\n\n"):
+        fields = dict(line.split(b": ", 1) for line in frame.split(b"\n") if line and not line.startswith(b":"))
+        if b"event" in fields:
+            parsed.append((fields[b"event"].decode(), orjson.loads(fields[b"data"])))
+    return parsed
+
+
+class TestFeedBroker:
+    """Test suite for in-process fan-out."""
+
+    def test_fan_out_per_user(self):
+        """Test frames reach every subscriber of their user and no one else."""
+        async def scenario():
+            broker = FeedBroker(max_queued=10)
+            first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+            assert broker.deliver(1, sse_frame("created", b'{"id":1}')) == 2
+            assert await first.next_frames(1) == await second.next_frames(1) == [b'event: created\ndata: {"id":1}\n\n']
+            assert await other.next_frames(0.01) == []
+            broker.unsubscribe(first)
+            broker.unsubscribe(first)
+            assert broker.subscriber_count() == 2
+
+        asyncio.run(scenario())
+
+    def test_slow_consumer_is_evicted(self):
+        """Test a subscriber past its queue bound is dropped and told so, without affecting others."""
+        async def scenario():
+            broker = FeedBroker(max_queued=2)
+            slow, fast = broker.subscribe(1), broker.subscribe(1)
+            for index in range(3):
+                broker.deliver(1, sse_frame("created", b'{"id":%d}' % index))
+                if index < 2:
+                    await fast.next_frames(1)
+
+            assert slow.evicted and not fast.evicted
+            assert broker.subscriber_count() == 1
+            assert [frame async for frame in feed.stream(slow)][-1] == EVICTED
+
+        asyncio.run(scenario())
+
+    def test_bridge_payload_round_trip(self):
+        """Test a NOTIFY payload is delivered as the same frame a local publish would send."""
+        async def scenario():
+            broker = FeedBroker()
+            subscription = broker.subscribe(5)
+            bridge = PostgresBridge("postgresql://unused", broker)
+            bridge.publish(5, "updated", b'{"id":3,"result":1.5}')
+            bridge.dispatch(bridge._outbox.get_nowait().decode())
+            return await subscription.next_frames(1)
+
+        assert asyncio.run(scenario()) == [sse_frame("updated", b'{"id":3,"result":1.5}')]
+
+
+class TestFeedPublishing:
+    """Test suite for publishing from the calculation routes."""
+
+    def test_writes_are_published(self, sample_user):
+        """Test add, edit and delete each publish one event to the owner's subscribers."""
+        async def scenario():
+            subscription = feed.broker.subscribe(sample_user["id"])
+            try:
+                calc = {"operation": "add", "operand1": 1, "operand2": 2}
+                created = (await asyncio.to_thread(
+                    client.post, f"/calculations?user_id={sample_user['id']}", json=calc
+                )).json()
+                await asyncio.to_thread(client.patch, f"/calculations/{created['id']}", json={"operand2": 5})
+                await asyncio.to_thread(client.delete, f"/calculations/{created['id']}")
+                frames = []
+                while len(events(frames)) < 3:
+                    frames += await subscription.next_frames(5)
+                return created, events(frames)
+            finally:
+                feed.broker.unsubscribe(subscription)
+
+        created, published = asyncio.run(scenario())
+        assert [event for event, _ in published] == ["created", "updated", "deleted"]
+        assert published[0][1]["id"] == created["id"]
+        assert published[1][1]["result"] == 6
+        assert published[2][1] == {"id": created["id"]}
+
+    def test_batch_rows_are_published(self, sample_user):
+        """Test every row stored by a batch add publishes its own created event."""
+        async def scenario():
+            subscription = feed.broker.subscribe(sample_user["id"])
+            try:
+                calc = {"operation": "add", "operand1": 1, "operand2": 2}
+                batch = (await asyncio.to_thread(
+                    client.post, f"/calculations/batch?user_id={sample_user['id']}",
+                    json=[calc, {"operation": "divide", "operand1": 1, "operand2": 0}, calc],
+                )).json()
+                frames = []
+                for _ in range(5):
+                    if len(events(frames)) >= 2:
+                        break
+                    frames += await subscription.next_frames(1)
+                return batch, events(frames)
+            finally:
+                feed.broker.unsubscribe(subscription)
+
+        batch, published = asyncio.run(scenario())
+        stored = [item["calculation"]["id"] for item in batch["results"] if item["calculation"]]
+        assert len(stored) == 2
+        assert [event for event, _ in published] == ["created", "created"]
+        assert [data["id"] for _, data in published] == stored
+
+    def test_bulk_changes_are_published(self, sample_user):
+        """Test bulk edits and deletes publish an event for every affected row."""
+        async def scenario():
+            calc = {"operation": "add", "operand1": 1, "operand2": 2}
+            url = f"/calculations?user_id={sample_user['id']}"
+            ids = [(await asyncio.to_thread(client.post, url, json=calc)).json()["id"] for _ in range(3)]
+            subscription = feed.broker.subscribe(sample_user["id"])
+            try:
+                await asyncio.to_thread(client.patch, "/calculations/bulk", json={
+                    "filter": {"ids": ids[:2]}, "changes": {"operand2": 5},
+                })
+                await asyncio.to_thread(client.request, "DELETE", "/calculations/bulk", json={"ids": ids[1:]})
+                frames = []
+                for _ in range(5):
+                    if len(events(frames)) >= 4:
+                        break
+                    frames += await subscription.next_frames(1)
+                return ids, events(frames)
+            finally:
+                feed.broker.unsubscribe(subscription)
+
+        ids, published = asyncio.run(scenario())
+        assert [(event, data["id"]) for event, data in published] == [
+            ("updated", ids[0]), ("updated", ids[1]), ("deleted", ids[1]), ("deleted", ids[2]),
+        ]
+        assert [data["result"] for _, data in published[:2]] == [6, 6]
+
+    def test_stream_endpoint(self, sample_user):
+        """Test the SSE endpoint streams published events and unsubscribes on disconnect."""
+        async def scenario():
+            disconnected = asyncio.Event()
+            body = []
+
+            async def receive():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    body.append(dict(message["headers"])[b"content-type"])
+                elif message.get("body"):
+                    body.append(message["body"])
+                    if len(events(body[1:])) == 1:
+                        disconnected.set()
+
+            scope = {
+                "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+                "path": "/calculations/feed", "raw_path": b"/calculations/feed",
+                "query_string": f"user_id={sample_user['id']}".encode(), "root_path": "",
+                "headers": [], "client": ("test", 1), "server": ("test", 80),
+            }
+            task = asyncio.create_task(app(scope, receive, send))
+            while feed.broker.subscriber_count() == 0:
+                await asyncio.sleep(0.01)
+            feed.publish(sample_user["id"], "created", b'{"id":7}')
+            await asyncio.wait_for(task, 5)
+            return body
+
+        body = asyncio.run(scenario())
+        assert body[0].startswith(b"text/event-stream")
+        assert events(body[1:]) == [("created", {"id": 7})]
+        assert feed.broker.subscriber_count() == 0
+
+    def test_stream_requires_user(self):
+        """Test subscribing without a token or user_id is unauthorized."""
+        assert client.get("/calculations/feed").status_code == 401
@@ -0,0 +1,165 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, exc, insert, inspect, text, update
+from app import database, main
+from app.models import SCHEMA_VERSION, Calculation, CalculationRollup, CalculationStats, SchemaVersion
+from app.database import DB_POOL_SIZE, InstrumentedQueuePool, engine_options, pool_status, to_async_url
+from tests.conftest import client, engine, TEST_DATABASE_URL
+
+# Indexes calculations had at schema version 3, before the browse indexes
+OLDER_CALCULATION_INDEXES = {"ix_calculations_id", "ix_calculations_user_id_id", "ix_calculations_created_at"}
+
+
+class TestHealth:
+    """Test suite for health and readiness endpoints."""
+
+    def test_health(self):
+        """Test the liveness endpoint."""
+        response = client.get("/health")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "healthy"}
+
+    def test_ready_reports_pool_and_latency(self):
+        """Test readiness reports pool counters and DB latency."""
+        response = client.get("/health/ready")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["db_latency_ms"] >= 0
+        assert "checked_out" in data["pool"]["sync"]
+
+    def test_ready_fails_fast_when_pool_exhausted(self, monkeypatch):
+        """Test readiness returns 503 when every pooled connection is in use."""
+        monkeypatch.setattr(main, "pool_status", lambda engine: {"exhausted": True})
+
+        response = client.get("/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "saturated"
+
+
+class TestConnectionPool:
+    """Test suite for the instrumented connection pool."""
+
+    def test_pool_counts_waits_and_timeouts(self):
+        """Test a checkout beyond pool capacity is counted as a wait and a timeout."""
+        options = engine_options(TEST_DATABASE_URL)
+        options.update(pool_size=1, max_overflow=0, pool_timeout=0.05)
+        test_engine = create_engine(TEST_DATABASE_URL, **options)
+        assert isinstance(test_engine.pool, InstrumentedQueuePool)
+
+        with test_engine.connect():
+            assert pool_status(test_engine)["exhausted"]
+            with pytest.raises(Exception):
+                test_engine.connect()
+
+        status = pool_status(test_engine)
+        assert status["waits"] == 1
+        assert status["timeouts"] == 1
+        assert status["checked_out"] == 0
+        test_engine.dispose()
+
+    def test_async_engine_factory_pools_connections(self, monkeypatch):
+        """Test get_async_engine builds a queue-pooled engine for the configured URL."""
+        monkeypatch.setattr(database, "ASYNC_DATABASE_URL", to_async_url(TEST_DATABASE_URL))
+        monkeypatch.setattr(database, "async_engine", None)
+        monkeypatch.setattr(database, "AsyncSessionLocal", None)
+
+        async def scenario():
+            async_engine = database.get_async_engine()
+            try:
+                async with database.AsyncSessionLocal() as db:
+                    assert (await db.execute(text("SELECT 1"))).scalar() == 1
+                return pool_status(async_engine)
+            finally:
+                await database.dispose_async_engine()
+
+        status = asyncio.run(scenario())
+        assert status["size"] == DB_POOL_SIZE
+        assert status["checked_out"] == 0
+
+
+class TestStartup:
+    """Test suite for the startup lifespan."""
+
+    def test_schema_version_is_recorded_once(self):
+        """Test the first check creates the schema and later checks only read the version."""
+        assert database.ensure_schema() == "created"
+        assert database.stored_schema_version() == SCHEMA_VERSION
+        assert database.ensure_schema() == "current"
+
+    def test_upgrade_creates_missing_indexes(self):
+        """Test upgrading an older schema adds indexes to existing tables before recording the version."""
+        table = Calculation.__table__
+        added = [index for index in table.indexes if index.name not in OLDER_CALCULATION_INDEXES]
+        with engine.begin() as connection:
+            for index in added:
+                index.drop(connection, checkfirst=True)
+            connection.execute(update(SchemaVersion).values(version=3))
+
+        assert database.ensure_schema() == "created"
+        assert database.stored_schema_version() == SCHEMA_VERSION
+        present = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= present
+
+    def test_upgrade_backfills_new_summary_tables(self, sample_user):
+        """Test summary tables created by an upgrade are filled from the existing calculations."""
+        for operand in (1, 2, 3):
+            calc = {"operation": "add", "operand1": operand, "operand2": 1}
+            client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        with engine.begin() as connection:
+            CalculationStats.__table__.drop(connection)
+            CalculationRollup.__table__.drop(connection)
+            connection.execute(insert(SchemaVersion).values(id=1, version=4))
+
+        assert database.ensure_schema() == "created"
+
+        stats = client.get(f"/users/{sample_user['id']}/stats").json()
+        assert stats["count"] == 3
+        rollup = client.get(f"/calculations/rollup?bucket=day&user_id={sample_user['id']}").json()
+        assert [(point["operation"], point["count"], point["total"]) for point in rollup] == [("add", 3, 9)]
+
+    def test_waiting_worker_sees_finished_upgrade(self, monkeypatch):
+        """Test a worker that reaches the upgrade after another one finished it changes nothing."""
+        upgrade = database._upgrade
+
+        def upgraded_meanwhile(connection):
+            with engine.begin() as other:
+                other.execute(insert(SchemaVersion).values(id=1, version=SCHEMA_VERSION))
+            return upgrade(connection)
+
+        monkeypatch.setattr(database, "_upgrade", upgraded_meanwhile)
+
+        assert database.ensure_schema() == "current"
+
+    def test_lost_version_stamp_race_is_tolerated(self, monkeypatch):
+        """Test a conflict on the version row counts as current once the other worker recorded it."""
+        def lost_race(connection):
+            with engine.begin() as other:
+                other.execute(insert(SchemaVersion).values(id=1, version=SCHEMA_VERSION))
+            raise exc.IntegrityError("INSERT INTO schema_version", {}, Exception("UNIQUE constraint failed"))
+
+        monkeypatch.setattr(database, "_upgrade", lost_race)
+
+        assert database.ensure_schema() == "current"
+
+    def test_newer_schema_is_rejected(self, monkeypatch):
+        """Test a database ahead of the code refuses to start."""
+        monkeypatch.setattr(database, "stored_schema_version", lambda: SCHEMA_VERSION + 1)
+
+        with pytest.raises(RuntimeError):
+            database.ensure_schema()
+
+    def test_lifespan_warms_up_and_reports_startup_time(self, monkeypatch):
+        """Test startup runs every phase and exports the timings."""
+        monkeypatch.setattr(main, "warm_up_pool", lambda: None)
+        monkeypatch.setattr(main, "calibrate_bcrypt", lambda: 12)
+
+        with TestClient(main.app) as started_client:
+            response = started_client.get("/metrics")
+
+        for phase in ("schema", "pool", "bcrypt", "validators", "total"):
+            assert f'app_startup_seconds{{phase="{phase}"}}' in response.text
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.idempotency import front_cache
+from app.models import IdempotencyKey
+from tests.conftest import client, TestingSessionLocal
+
+
+class TestIdempotentCalculations:
+    """Test suite for Idempotency-Key on POST /calculations."""
+
+    def test_retry_returns_original_response(self, sample_user):
+        """Test a retried request replays the stored response without a second row."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+        headers = {"Idempotency-Key": "calc-1"}
+        first = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+        retry = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert len(client.get("/calculations").json()) == 1
+
+    def test_replay_from_table_after_front_cache_loss(self, sample_user):
+        """Test the table still answers when another worker (or a restart) has no cached copy."""
+        calc = {"operation": "multiply", "operand1": 2, "operand2": 3}
+        headers = {"Idempotency-Key": "calc-2"}
+        first = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+        front_cache.clear()
+        retry = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+
+        assert retry.json() == first.json()
+        assert len(client.get("/calculations").json()) == 1
+
+    def test_concurrent_duplicate_rolls_back(self, sample_user, monkeypatch):
+        """Test a request that loses the race for a key undoes its insert and replays the winner."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+        headers = {"Idempotency-Key": "calc-race"}
+        first = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+
+        # Simulate a duplicate that passed the lookup before the first one committed
+        monkeypatch.setattr("app.routes.calculations.find_response", lambda *args: None)
+        duplicate = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+
+        assert duplicate.json() == first.json()
+        assert len(client.get("/calculations").json()) == 1
+        assert client.get(f"/users/{sample_user['id']}/stats").json()["count"] == 1
+
+    def test_key_reused_with_different_request(self, sample_user):
+        """Test a key cannot be replayed for a different body."""
+        headers = {"Idempotency-Key": "calc-3"}
+        client.post(f"/calculations?user_id={sample_user['id']}", json={"operation": "add", "operand1": 1, "operand2": 1}, headers=headers)
+        response = client.post(f"/calculations?user_id={sample_user['id']}", json={"operation": "add", "operand1": 1, "operand2": 2}, headers=headers)
+
+        assert response.status_code == 422
+        assert len(client.get("/calculations").json()) == 1
+
+    def test_expired_key_runs_again(self, sample_user):
+        """Test an expired key no longer replays."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+        headers = {"Idempotency-Key": "calc-4"}
+        client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+        with TestingSessionLocal() as db:
+            db.execute(update(IdempotencyKey).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            db.commit()
+        front_cache.clear()
+
+        retry = client.post(f"/calculations?user_id={sample_user['id']}", json=calc, headers=headers)
+
+        assert retry.status_code == 201
+        assert "Idempotent-Replayed" not in retry.headers
+        assert len(client.get("/calculations").json()) == 2
+
+    def test_errors_are_not_stored(self):
+        """Test a failed request can be retried with the same key."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+        response = client.post("/calculations?user_id=99999", json=calc, headers={"Idempotency-Key": "calc-5"})
+
+        assert response.status_code == 404
+        with TestingSessionLocal() as db:
+            assert db.query(IdempotencyKey).count() == 0
+
+
+class TestIdempotentRegistration:
+    """Test suite for Idempotency-Key on POST /users/register."""
+
+    def test_retry_skips_hashing(self, monkeypatch):
+        """Test a retried registration returns the new user without hashing again."""
+        user_data = {"username": "retry", "email": "retry@example.com", "password": "password123"}
+        headers = {"Idempotency-Key": "register-1"}
+        first = client.post("/users/register", json=user_data, headers=headers)
+
+        def fail(password):
+            raise AssertionError("password hashed again")
+        monkeypatch.setattr("app.routes.users.hash_password_offloaded", fail)
+        retry = client.post("/users/register", json=user_data, headers=headers)
+
+        assert first.status_code == retry.status_code == 201
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+
+    def test_concurrent_duplicate_replays_winner(self, monkeypatch):
+        """Test a registration that loses the race on the username replays the winner's response."""
+        user_data = {"username": "racer", "email": "racer@example.com", "password": "password123"}
+        headers = {"Idempotency-Key": "register-race"}
+        first = client.post("/users/register", json=user_data, headers=headers)
+
+        # Simulate a duplicate that passed the lookup before the first one committed
+        monkeypatch.setattr("app.routes.users.find_response", lambda *args: None)
+        front_cache.clear()
+        duplicate = client.post("/users/register", json=user_data, headers=headers)
+
+        assert duplicate.status_code == 201
+        assert duplicate.json() == first.json()
+        assert duplicate.headers["Idempotent-Replayed"] == "true"
+
+    def test_conflict_without_key_is_rejected(self):
+        """Test a duplicate username without a key is still an error."""
+        user_data = {"username": "taken", "email": "taken@example.com", "password": "password123"}
+        client.post("/users/register", json=user_data, headers={"Idempotency-Key": "register-taken"})
+
+        duplicate = client.post("/users/register", json={**user_data, "email": "other@example.com"})
+
+        assert duplicate.status_code == 400
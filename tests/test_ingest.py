@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import ingest
+from app.ingest import GroupCommitBuffer, IngestBufferFull
+from tests.conftest import client, engine
+
+
+@pytest.fixture
+def group_commit():
+    """Route add_calculation through a group-commit buffer on the test database."""
+    ingest.buffer = GroupCommitBuffer(engine, batch_rows=8, flush_ms=50)
+    ingest.buffer.start()
+    yield ingest.buffer
+    ingest.stop_buffer()
+
+
+class TestGroupCommit:
+    """Test suite for the write-behind ingestion buffer."""
+
+    def test_concurrent_adds_share_commits(self, sample_user, group_commit):
+        """Test concurrent requests are stored in fewer commits and get their own IDs."""
+        def add(operand):
+            calc = {"operation": "add", "operand1": operand, "operand2": 1}
+            return client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            responses = list(pool.map(add, range(16)))
+
+        assert all(response.status_code == 201 for response in responses)
+        assert [response.json()["result"] for response in responses] == [operand + 1 for operand in range(16)]
+        assert len({response.json()["id"] for response in responses}) == 16
+        assert group_commit.flushes < 16
+        assert client.get(f"/users/{sample_user['id']}/stats").json()["count"] == 16
+
+    def test_concurrent_same_key_stores_one_row(self, sample_user, group_commit):
+        """Test racing requests with one Idempotency-Key store a single calculation."""
+        calc = {"operation": "add", "operand1": 2, "operand2": 3}
+
+        def add(_):
+            return client.post(
+                f"/calculations?user_id={sample_user['id']}", json=calc, headers={"Idempotency-Key": "race"}
+            )
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(add, range(8)))
+
+        assert all(response.status_code == 201 for response in responses)
+        assert len({response.json()["id"] for response in responses}) == 1
+        assert len(client.get("/calculations").json()) == 1
+        assert client.get(f"/users/{sample_user['id']}/stats").json()["count"] == 1
+
+    def test_unknown_user_does_not_fail_group(self, sample_user, group_commit):
+        """Test a row for a missing user is rejected alone."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 1}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            missing = pool.submit(client.post, "/calculations?user_id=99999", json=calc)
+            valid = pool.submit(client.post, f"/calculations?user_id={sample_user['id']}", json=calc)
+
+        assert missing.result().status_code == 404
+        assert valid.result().status_code == 201
+
+    def test_full_buffer_sheds_load(self, sample_user):
+        """Test backpressure turns into 503 once the buffer is full."""
+        ingest.buffer = GroupCommitBuffer(engine, max_pending=1)  # no flusher running
+        try:
+            ingest.buffer.submit({"user_id": sample_user["id"]}, timeout=0)
+            with pytest.raises(IngestBufferFull):
+                ingest.buffer.submit({"user_id": sample_user["id"]}, timeout=0.01)
+
+            calc = {"operation": "add", "operand1": 1, "operand2": 1}
+            response = client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+            assert response.status_code == 503
+            assert response.headers["Retry-After"] == "1"
+        finally:
+            ingest.buffer = None
+
+    def test_close_flushes_pending_rows(self, sample_user):
+        """Test stopping the buffer stores every row it accepted."""
+        buffer = GroupCommitBuffer(engine, batch_rows=2)
+        rows = [
+            {"operation": "add", "operand1": i, "operand2": 0, "result": i, "user_id": sample_user["id"]}
+            for i in range(5)
+        ]
+        futures = [buffer.submit(row) for row in rows]
+
+        buffer.close()
+
+        assert [future.result().result for future in futures] == [0, 1, 2, 3, 4]
+        assert buffer.flushes == 3
+        assert len(client.get("/calculations").json()) == 5
+        with pytest.raises(IngestBufferFull):
+            buffer.submit(rows[0])
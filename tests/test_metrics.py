@@ -0,0 +1,68 @@
+import pytest
+from app import metrics
+from app.cache import cache
+from app.metrics import Histogram, instrument_engine
+from tests.conftest import client, engine
+
+# The tests use their own engine, instrument it like app.database does
+instrument_engine(engine)
+
+
+class TestMetricPrimitives:
+    """Test suite for the metric types."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test observations land in cumulative Prometheus buckets."""
+        histogram = Histogram("test_seconds", "Test histogram.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+
+        text = histogram.render()
+
+        assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in text
+        assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in text
+        assert 'test_seconds_count{route="/a"} 3' in text
+
+
+class TestMetricsEndpoint:
+    """Test suite for request and SQL instrumentation."""
+
+    def test_route_latency_uses_route_template(self, sample_user):
+        """Test requests are labelled by route template, not raw path."""
+        before = metrics.http_latency.count("GET", "/users/{user_id}")
+
+        client.get(f"/users/{sample_user['id']}")
+
+        assert metrics.http_latency.count("GET", "/users/{user_id}") == before + 1
+
+    def test_sql_queries_are_attributed_to_requests(self, sample_user):
+        """Test statements executed by a handler are counted for its route."""
+        route = ("GET", "/calculations/{calculation_id}")
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        calc_id = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()["id"]
+        cache.clear()
+        before = metrics.db_queries.value()
+        requests_before = metrics.request_db_queries.count(*route)
+        queries_before = metrics.request_db_queries.total(*route)
+
+        assert client.get(f"/calculations/{calc_id}").status_code == 200
+
+        assert metrics.db_queries.value() > before
+        assert metrics.request_db_queries.count(*route) == requests_before + 1
+        assert metrics.request_db_queries.total(*route) >= queries_before + 1
+
+    def test_metrics_endpoint_prometheus_format(self, sample_user):
+        """Test /metrics renders the Prometheus text format."""
+        client.get(f"/users/{sample_user['id']}")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE http_request_duration_seconds histogram" in response.text
+        assert 'http_requests_total{method="GET",route="/users/{user_id}",status="200"}' in response.text
+        assert "db_queries_total" in response.text
+        assert "password_hash_seconds_count" in response.text
+        assert 'db_pool_checked_out{engine="sync"}' in response.text
@@ -0,0 +1,116 @@
+import json
+import os
+from datetime import date, datetime
+import pytest
+from sqlalchemy import update
+from app import partitions
+from app.models import Calculation
+from app.partitions import add_months, archive_before, ensure_partitions, partition_name
+from tests.conftest import client, engine
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    """Point the cold archive at a temporary directory."""
+    monkeypatch.setattr(partitions, "ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def add_calculation(user_id, operand, created_at):
+    """Add a calculation and backdate it."""
+    calc = {"operation": "add", "operand1": operand, "operand2": 1}
+    calc_id = client.post(f"/calculations?user_id={user_id}", json=calc).json()["id"]
+    with engine.begin() as connection:
+        connection.execute(update(Calculation).where(Calculation.id == calc_id).values(created_at=created_at))
+    return calc_id
+
+
+class TestPartitionHelpers:
+    """Test suite for monthly partition bookkeeping."""
+
+    def test_months_roll_over_years(self):
+        """Test month arithmetic across year boundaries."""
+        assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+        assert partition_name(date(2024, 3, 1)) == "calculations_p2024_03"
+
+    def test_ensure_is_noop_without_partitioning(self):
+        """Test nothing is created when the table is not partitioned."""
+        with engine.begin() as connection:
+            assert ensure_partitions(connection) == []
+
+    def test_ensure_skips_existing_unpartitioned_table(self, monkeypatch):
+        """Test turning partitioning on over an unpartitioned table does not abort startup."""
+        if engine.dialect.name != "postgresql":
+            pytest.skip("Postgres partitioning")
+        monkeypatch.setattr(partitions, "PARTITION_CALCULATIONS", True)
+        with engine.begin() as connection:
+            if partitions.is_partitioned(connection):
+                pytest.skip("calculations is already partitioned")
+            assert ensure_partitions(connection) == []
+
+
+class TestArchive:
+    """Test suite for moving old months to the cold archive."""
+
+    def test_archive_moves_old_months(self, sample_user, archive_dir):
+        """Test old months leave the table, land in compressed files and stats follow."""
+        add_calculation(sample_user["id"], 1, datetime(2023, 1, 15))
+        add_calculation(sample_user["id"], 2, datetime(2023, 1, 20))
+        add_calculation(sample_user["id"], 3, datetime(2023, 3, 2))
+        recent = add_calculation(sample_user["id"], 4, datetime(2024, 6, 1))
+
+        with engine.begin() as connection:
+            archived = archive_before(connection, date(2024, 1, 1))
+
+        assert [(month, count) for month, count in archived if count] == [
+            (date(2023, 1, 1), 2), (date(2023, 3, 1), 1),
+        ]
+        assert sorted(os.listdir(archive_dir)) == ["calculations_2023_01_0.npz", "calculations_2023_03_0.npz"]
+        assert [calc["id"] for calc in client.get("/calculations").json()] == [recent]
+        assert client.get(f"/users/{sample_user['id']}/stats").json()["count"] == 1
+
+    def test_archive_files_in_month_order(self, archive_dir):
+        """Test archive files are read oldest month first, and in write order within a month."""
+        names = [
+            "calculations_2023_10_0.npz", "calculations_2023_02_10.npz", "calculations_2023_02_2.npz",
+            "calculations_2022_12_0.npz", "notes.txt",
+        ]
+        for name in names:
+            (archive_dir / name).touch()
+
+        assert [os.path.basename(path) for path in partitions.archive_files()] == [
+            "calculations_2022_12_0.npz", "calculations_2023_02_2.npz",
+            "calculations_2023_02_10.npz", "calculations_2023_10_0.npz",
+        ]
+
+    def test_export_reads_archive(self, sample_user, archive_dir):
+        """Test archived rows stay available through the export endpoint."""
+        old = add_calculation(sample_user["id"], 1, datetime(2023, 1, 15))
+        recent = add_calculation(sample_user["id"], 2, datetime(2024, 6, 1))
+        with engine.begin() as connection:
+            archive_before(connection, date(2024, 1, 1))
+
+        live_only = client.get("/calculations/export").text.splitlines()
+        response = client.get(f"/calculations/export?include_archived=true&user_id={sample_user['id']}")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+
+        assert len(live_only) == 1
+        assert [row["id"] for row in rows] == [old, recent]
+        assert rows[0]["created_at"] == "2023-01-15T00:00:00"
+        assert rows[0]["result"] == 2
+        assert client.get("/calculations/export?include_archived=true&user_id=99999").text == ""
+
+
+class TestBrowseTimeRange:
+    """Test suite for created_at bounds on browse."""
+
+    def test_browse_by_created_range(self, sample_user):
+        """Test browse only returns calculations inside the range."""
+        add_calculation(sample_user["id"], 1, datetime(2024, 1, 15))
+        inside = add_calculation(sample_user["id"], 2, datetime(2024, 2, 15))
+        add_calculation(sample_user["id"], 3, datetime(2024, 3, 15))
+
+        response = client.get("/calculations?created_after=2024-02-01T00:00:00&created_before=2024-03-01T00:00:00")
+
+        assert [calc["id"] for calc in response.json()] == [inside]
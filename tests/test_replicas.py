@@ -0,0 +1,106 @@
+import math
+import pytest
+from sqlalchemy import create_engine, insert
+from app import replicas
+from app.cache import cache, calculation_key, user_key
+from app.metrics import db_read_routing
+from app.models import Base, Calculation, User
+from app.replicas import READ_YOUR_WRITES_COOKIE, ReplicaSet
+from tests.conftest import client
+
+
+def make_replica(path, calculations: int) -> str:
+    """Create a replica database holding one user with some calculations."""
+    url = f"sqlite:///{path}"
+    replica_engine = create_engine(url)
+    Base.metadata.create_all(bind=replica_engine)
+    with replica_engine.begin() as connection:
+        connection.execute(insert(User).values(id=1, username="replica", email="replica@example.com", hashed_password="x"))
+        for operand in range(calculations):
+            connection.execute(insert(Calculation).values(
+                operation="add", operand1=operand, operand2=0, result=operand, user_id=1
+            ))
+    replica_engine.dispose()
+    return url
+
+
+@pytest.fixture
+def two_replicas(tmp_path, monkeypatch):
+    """Route reads across two healthy replicas holding one and two calculations."""
+    lags = {}
+    replica_set = ReplicaSet(
+        [make_replica(tmp_path / "a.db", 1), make_replica(tmp_path / "b.db", 2)],
+        max_lag=5,
+        lag_probe=lambda engine: lags.get(engine.url.database, 0.0),
+    )
+    replica_set.lags = lags
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+    client.cookies.clear()
+    yield replica_set
+    client.cookies.clear()
+
+
+class TestReadReplicas:
+    """Test suite for replica routing of read endpoints."""
+
+    def test_reads_round_robin_across_replicas(self, two_replicas):
+        """Test successive reads alternate between the replicas."""
+        sizes = [len(client.get("/calculations").json()) for _ in range(4)]
+
+        assert sorted(sizes) == [1, 1, 2, 2]
+        assert sizes[0] != sizes[1]
+
+    def test_lagging_replica_is_skipped(self, two_replicas, tmp_path):
+        """Test a replica beyond the lag limit gets no reads."""
+        two_replicas.lags[str(tmp_path / "b.db")] = 30.0
+        two_replicas.check()
+
+        assert [len(client.get("/calculations").json()) for _ in range(3)] == [1, 1, 1]
+
+    def test_all_lagging_falls_back_to_primary(self, two_replicas, tmp_path):
+        """Test reads go to the primary when no replica is usable."""
+        two_replicas.lags[str(tmp_path / "a.db")] = math.inf
+        two_replicas.lags[str(tmp_path / "b.db")] = 30.0
+        two_replicas.check()
+        before = db_read_routing.value("primary_lag")
+
+        assert client.get("/calculations").json() == []
+        assert db_read_routing.value("primary_lag") == before + 1
+
+    def test_reads_follow_own_writes(self, two_replicas):
+        """Test a client reads from the primary right after writing."""
+        response = client.post("/users/register", json={
+            "username": "writer", "email": "writer@example.com", "password": "password123"
+        })
+        assert READ_YOUR_WRITES_COOKIE in response.cookies
+
+        assert client.get(f"/users/{response.json()['id']}").json()["username"] == "writer"
+        assert client.get("/calculations").json() == []
+
+        client.cookies.clear()
+        assert len(client.get("/calculations").json()) in (1, 2)
+
+    def test_failed_write_is_not_sticky(self, two_replicas):
+        """Test only successful mutations pin reads to the primary."""
+        response = client.post("/calculations?user_id=99999", json={"operation": "add", "operand1": 1, "operand2": 1})
+
+        assert response.status_code == 404
+        assert READ_YOUR_WRITES_COOKIE not in response.cookies
+
+    def test_replica_reads_are_not_cached(self, two_replicas):
+        """Test a row read from a replica, which may be stale, never fills the shared cache."""
+        assert client.get("/calculations/1").status_code == 200
+        assert client.get("/users/1").json()["username"] == "replica"
+
+        assert cache.get(calculation_key(1)) is None
+        assert cache.get(user_key(1)) is None
+
+    def test_recent_writer_skips_the_cache(self, two_replicas):
+        """Test a client with the read-your-writes cookie reads the primary instead of a cached copy."""
+        response = client.post("/users/register", json={
+            "username": "fresh", "email": "fresh@example.com", "password": "password123"
+        })
+        user_id = response.json()["id"]
+        cache.set(user_key(user_id), b'{"username": "stale"}')
+
+        assert client.get(f"/users/{user_id}").json()["username"] == "fresh"
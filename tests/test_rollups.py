@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta, timezone
+import time
+from sqlalchemy import func, select
+from app import rollups
+from app.models import Calculation, CalculationRollup
+from app.rollups import RollupCompactor, compact, rebuild_rollups, record_rollups, rollup_series, truncate
+from tests.conftest import client, engine
+
+
+def add(user_id: int, operation: str, operand1: float, operand2: float) -> dict:
+    calc = {"operation": operation, "operand1": operand1, "operand2": operand2}
+    return client.post(f"/calculations?user_id={user_id}", json=calc).json()
+
+
+def rollup_rows(granularity: str) -> int:
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count()).select_from(CalculationRollup).where(CalculationRollup.granularity == granularity)
+        ).scalar()
+
+
+def counts(points) -> dict:
+    return {point["operation"]: point["count"] for point in points}
+
+
+class TestRollupWrites:
+    """Test suite for keeping rollups current on every write."""
+
+    def test_adds_are_counted(self, sample_user):
+        """Test each add lands in the minute bucket of its operation."""
+        add(sample_user["id"], "add", 1, 2)
+        add(sample_user["id"], "add", 3, 4)
+        add(sample_user["id"], "divide", 8, 2)
+
+        response = client.get(f"/calculations/rollup?bucket=minute&user_id={sample_user['id']}")
+
+        assert response.status_code == 200
+        assert counts(response.json()) == {"add": 2, "divide": 1}
+        assert {point["operation"]: point["total"] for point in response.json()} == {"add": 10, "divide": 4}
+        assert all(point["bucket"] == "minute" for point in response.json())
+
+    def test_edit_and_delete_adjust_buckets(self, sample_user):
+        """Test edits move counts between operations and deletes remove them."""
+        first = add(sample_user["id"], "add", 1, 2)
+        second = add(sample_user["id"], "add", 5, 5)
+        client.patch(f"/calculations/{first['id']}", json={"operation": "multiply"})
+        client.delete(f"/calculations/{second['id']}")
+
+        points = client.get(f"/calculations/rollup?bucket=hour&user_id={sample_user['id']}").json()
+
+        assert counts(points) == {"multiply": 1}
+        assert points[0]["total"] == 2
+
+    def test_inserts_use_stored_created_at(self, sample_user, monkeypatch):
+        """Test single and batch adds count in the bucket their later delete subtracts from."""
+        class OtherMinute(datetime):
+            @classmethod
+            def utcnow(cls):
+                # Stands in for an insert and its created_at falling in different minutes
+                return datetime(2001, 1, 1, 0, 0, 30)
+
+        monkeypatch.setattr(rollups, "datetime", OtherMinute)
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        created = [add(sample_user["id"], "add", 1, 2)]
+        batch = client.post(f"/calculations/batch?user_id={sample_user['id']}", json=[calc, calc]).json()
+        created += [item["calculation"] for item in batch["results"]]
+        for calculation in created:
+            assert client.delete(f"/calculations/{calculation['id']}").status_code == 200
+
+        with engine.connect() as connection:
+            buckets = connection.execute(
+                select(CalculationRollup.bucket_start, CalculationRollup.count)
+                .where(CalculationRollup.user_id == sample_user["id"])
+            ).all()
+        assert buckets
+        assert all(count == 0 for _, count in buckets)
+
+    def test_bulk_changes_adjust_buckets(self, sample_user):
+        """Test bulk edits and deletes keep rollups in line with the table."""
+        for operand in range(4):
+            add(sample_user["id"], "add", operand, 1)
+        client.patch("/calculations/bulk", json={
+            "filter": {"user_id": sample_user["id"], "operation": "add"},
+            "changes": {"operation": "subtract"},
+        })
+        client.request("DELETE", "/calculations/bulk", json={"ids": [add(sample_user["id"], "divide", 1, 1)["id"]]})
+
+        points = client.get(f"/calculations/rollup?bucket=day&user_id={sample_user['id']}").json()
+
+        assert counts(points) == {"subtract": 4}
+        assert points[0]["total"] == sum(operand - 1 for operand in range(4))
+
+    def test_token_user_and_operation_filter(self, sample_user):
+        """Test the user comes from the bearer token and operation narrows the series."""
+        add(sample_user["id"], "add", 1, 2)
+        add(sample_user["id"], "divide", 8, 2)
+        token = client.post(
+            "/users/login", json={"username": "testuser", "password": "testpassword123"}
+        ).json()["access_token"]
+
+        response = client.get(
+            "/calculations/rollup?operation=divide", headers={"Authorization": f"Bearer {token}"}
+        )
+
+        assert counts(response.json()) == {"divide": 1}
+
+    def test_requires_user(self):
+        """Test a rollup without a token or user_id is unauthorized."""
+        assert client.get("/calculations/rollup").status_code == 401
+
+    def test_invalid_range(self, sample_user):
+        """Test a start after the end is rejected."""
+        response = client.get(
+            f"/calculations/rollup?user_id={sample_user['id']}&start=2024-02-01T00:00:00&end=2024-01-01T00:00:00"
+        )
+
+        assert response.status_code == 400
+
+    def test_range_with_utc_offsets(self, sample_user):
+        """Test start and end with a Z or +02:00 offset are read as the same UTC instants."""
+        add(sample_user["id"], "add", 1, 2)
+        now = datetime.now(timezone.utc)
+        start = (now - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        end = (now + timedelta(hours=1)).astimezone(timezone(timedelta(hours=2))).isoformat()
+
+        for query in (f"start={start}", f"start={start}&end={end}", f"bucket=day&start={start}&end={end}"):
+            response = client.get(f"/calculations/rollup?user_id={sample_user['id']}&{query.replace('+', '%2B')}")
+            assert response.status_code == 200
+            assert counts(response.json()) == {"add": 1}
+
+        response = client.get(f"/calculations/rollup?user_id={sample_user['id']}&end={start}")
+        assert counts(response.json()) == {}
+
+
+class TestRollupCompaction:
+    """Test suite for folding old buckets into coarser ones."""
+
+    def test_compaction_preserves_totals(self, sample_user):
+        """Test old minutes become hours, older hours become days, and counts survive."""
+        now = datetime(2024, 6, 30, 12, 0)
+        moments = [now - timedelta(days=days, minutes=minutes) for days in (0, 2, 60) for minutes in (1, 2, 3)]
+        with engine.begin() as connection:
+            record_rollups(connection, added=[
+                {"user_id": sample_user["id"], "operation": "add", "result": 1.0, "created_at": moment}
+                for moment in moments
+            ])
+        assert rollup_rows("minute") == 9
+
+        with engine.begin() as connection:
+            assert compact(connection, now=now) == {"minute": 6, "hour": 1}
+        assert (rollup_rows("minute"), rollup_rows("hour"), rollup_rows("day")) == (3, 1, 1)
+
+        with engine.connect() as connection:
+            points = rollup_series(connection, sample_user["id"], "hour", now - timedelta(days=90), now)
+        assert [(point["bucket"], point["count"]) for point in points] == [("day", 3), ("hour", 3), ("hour", 3)]
+        assert sum(point["total"] for point in points) == 9
+
+    def test_late_corrections_merge_into_coarse_buckets(self, sample_user):
+        """Test a change to an already compacted bucket is merged on the next compaction."""
+        now = datetime(2024, 6, 30, 12, 0)
+        old = {"user_id": sample_user["id"], "operation": "add", "result": 2.0, "created_at": now - timedelta(days=3)}
+        with engine.begin() as connection:
+            record_rollups(connection, added=[old, old])
+            compact(connection, now=now)
+            record_rollups(connection, removed=[old])
+            compact(connection, now=now)
+
+        with engine.connect() as connection:
+            points = rollup_series(connection, sample_user["id"], "hour", now - timedelta(days=7), now)
+        assert [(point["bucket_start"], point["count"], point["total"]) for point in points] == [
+            (truncate(old["created_at"], "hour"), 1, 2.0)
+        ]
+        assert rollup_rows("minute") == 0
+
+    def test_rebuild_matches_the_calculations(self, sample_user, monkeypatch):
+        """Test a rebuild recomputes every bucket from the table in chunks and compacts old ones."""
+        now = datetime(2024, 6, 30, 12, 0)
+        rows = [
+            {"operation": "add", "operand1": 1, "operand2": 1, "result": 2.0, "user_id": sample_user["id"],
+             "created_at": now - timedelta(days=days)}
+            for days in (0, 0, 3, 60)
+        ]
+        monkeypatch.setattr(rollups, "REBUILD_CHUNK_ROWS", 3)
+        with engine.begin() as connection:
+            connection.execute(Calculation.__table__.insert(), rows)
+            connection.execute(CalculationRollup.__table__.delete())
+            assert rebuild_rollups(connection, now=now) == 4
+
+        assert (rollup_rows("minute"), rollup_rows("hour"), rollup_rows("day")) == (1, 1, 1)
+        with engine.connect() as connection:
+            points = rollup_series(
+                connection, sample_user["id"], "day", now - timedelta(days=90), now + timedelta(minutes=1)
+            )
+        assert [point["count"] for point in points] == [1, 1, 2]
+        assert sum(point["total"] for point in points) == 8.0
+
+    def test_year_of_hours_reads_few_rows(self, sample_user):
+        """Test a year of activity compacts to about one row per day."""
+        now = datetime(2024, 12, 31, 0, 0)
+        with engine.begin() as connection:
+            record_rollups(connection, added=[
+                {"user_id": sample_user["id"], "operation": "add", "result": 1.0,
+                 "created_at": now - timedelta(hours=hours)}
+                for hours in range(1, 365 * 24, 3)
+            ])
+            compact(connection, now=now)
+
+        assert rollup_rows("minute") + rollup_rows("hour") + rollup_rows("day") < 700
+        with engine.connect() as connection:
+            points = rollup_series(connection, sample_user["id"], "hour", now - timedelta(days=365), now)
+        assert sum(point["count"] for point in points) == len(range(1, 365 * 24, 3))
+
+    def test_background_compactor(self, sample_user):
+        """Test the compaction thread runs and stops cleanly."""
+        old = datetime.utcnow() - timedelta(days=3)
+        with engine.begin() as connection:
+            record_rollups(connection, added=[
+                {"user_id": sample_user["id"], "operation": "add", "result": 1.0, "created_at": old}
+            ])
+        compactor = RollupCompactor(engine, interval=0.01)
+        compactor.start()
+        try:
+            deadline = time.monotonic() + 5
+            while rollup_rows("minute") and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            compactor.stop()
+
+        assert rollup_rows("minute") == 0
+        assert rollup_rows("hour") == 1
@@ -0,0 +1,30 @@
+import json
+import pytest
+from app.schemas import CalculationRead
+from app.serialization import dump_calculation, dump_calculations
+from benchmarks.serialization import make_rows
+from tests.conftest import client
+
+
+class TestFastSerialization:
+    """Test suite for the orjson fast path."""
+
+    def test_matches_response_model_output(self):
+        """Test the fast path encodes exactly what CalculationRead would."""
+        objects, rows = make_rows(3)
+
+        expected = [json.loads(CalculationRead.model_validate(obj).model_dump_json()) for obj in objects]
+
+        assert json.loads(dump_calculations(rows)) == expected
+        assert json.loads(dump_calculation(rows[0])) == expected[0]
+
+    def test_browse_and_read_payloads(self, sample_user):
+        """Test the endpoints return the same fields as before."""
+        calc = {"operation": "divide", "operand1": 9, "operand2": 3}
+        created = client.post(f"/calculations?user_id={sample_user['id']}", json=calc).json()
+
+        listed = client.get("/calculations").json()
+        read = client.get(f"/calculations/{created['id']}").json()
+
+        assert listed == [created]
+        assert read == created
@@ -0,0 +1,95 @@
+import pytest
+from app.stats import rebuild_stats
+from tests.conftest import client, engine
+
+
+def add_calc(user_id, operation, operand1, operand2):
+    """Create a calculation and return its JSON body."""
+    calc = {"operation": operation, "operand1": operand1, "operand2": operand2}
+    return client.post(f"/calculations?user_id={user_id}", json=calc).json()
+
+
+def stats_by_operation(user_id):
+    """Fetch a user's statistics keyed by operation."""
+    response = client.get(f"/users/{user_id}/stats")
+    assert response.status_code == 200
+    return {row["operation"]: row for row in response.json()["operations"]}
+
+
+class TestUserStats:
+    """Test suite for incrementally maintained calculation statistics."""
+
+    def test_stats_empty(self, sample_user):
+        """Test a user without calculations has empty statistics."""
+        response = client.get(f"/users/{sample_user['id']}/stats")
+
+        assert response.status_code == 200
+        assert response.json() == {"user_id": sample_user["id"], "count": 0, "operations": []}
+
+    def test_stats_user_not_found(self):
+        """Test statistics for a non-existent user."""
+        response = client.get("/users/99999/stats")
+
+        assert response.status_code == 404
+
+    def test_stats_follow_add(self, sample_user):
+        """Test adding calculations updates the summaries."""
+        add_calc(sample_user["id"], "add", 1, 2)
+        add_calc(sample_user["id"], "add", 10, 5)
+        add_calc(sample_user["id"], "multiply", 2, 3)
+
+        stats = stats_by_operation(sample_user["id"])
+
+        assert stats["add"]["count"] == 2
+        assert stats["add"]["total"] == 18
+        assert stats["add"]["min_result"] == 3
+        assert stats["add"]["max_result"] == 15
+        assert stats["add"]["average"] == 9
+        assert stats["multiply"]["count"] == 1
+
+    def test_stats_follow_edit(self, sample_user):
+        """Test editing moves a calculation between summaries and rescans extremes."""
+        first = add_calc(sample_user["id"], "add", 1, 2)
+        add_calc(sample_user["id"], "add", 10, 5)
+
+        client.patch(f"/calculations/{first['id']}", json={"operation": "multiply"})
+        stats = stats_by_operation(sample_user["id"])
+
+        assert stats["add"]["count"] == 1
+        assert stats["add"]["min_result"] == 15
+        assert stats["multiply"]["count"] == 1
+        assert stats["multiply"]["total"] == 2
+
+    def test_stats_follow_delete(self, sample_user):
+        """Test deleting calculations shrinks and finally removes a summary."""
+        first = add_calc(sample_user["id"], "add", 1, 2)
+        second = add_calc(sample_user["id"], "add", 10, 5)
+
+        client.delete(f"/calculations/{second['id']}")
+        assert stats_by_operation(sample_user["id"])["add"]["max_result"] == 3
+
+        client.delete(f"/calculations/{first['id']}")
+        assert "add" not in stats_by_operation(sample_user["id"])
+
+    def test_stats_follow_batch(self, sample_user):
+        """Test bulk inserted calculations are counted."""
+        items = [
+            {"operation": "subtract", "operand1": 5, "operand2": 1},
+            {"operation": "subtract", "operand1": 9, "operand2": 1},
+        ]
+        client.post(f"/calculations/batch?user_id={sample_user['id']}", json=items)
+
+        stats = stats_by_operation(sample_user["id"])
+        assert stats["subtract"]["count"] == 2
+        assert stats["subtract"]["max_result"] == 8
+
+    def test_rebuild_matches_incremental(self, sample_user):
+        """Test a bulk rebuild reproduces the incrementally maintained summaries."""
+        add_calc(sample_user["id"], "add", 1, 2)
+        add_calc(sample_user["id"], "divide", 9, 3)
+        before = stats_by_operation(sample_user["id"])
+
+        with engine.begin() as connection:
+            rebuild_stats(connection)
+
+        assert stats_by_operation(sample_user["id"]) == before
@@ -0,0 +1,137 @@
+import time
+import pytest
+from sqlalchemy import event
+from app.tokens import ACCESS, REFRESH, InvalidToken, decode_token, encode_token
+from tests.conftest import client, engine
+
+
+@pytest.fixture
+def tokens(sample_user):
+    """Log the sample user in and return its token pair."""
+    response = client.post("/users/login", json={"username": "testuser", "password": "testpassword123"})
+    return response.json()
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+class TestTokenEncoding:
+    """Test suite for signing and verifying tokens."""
+
+    def test_round_trip(self):
+        """Test a signed token decodes to its user and type."""
+        claims = decode_token(encode_token(7, ACCESS, 60), ACCESS)
+        assert claims["sub"] == 7
+        assert claims["typ"] == ACCESS
+
+    def test_rejects_tampering(self):
+        """Test a changed payload or signature fails verification."""
+        token = encode_token(7, ACCESS, 60)
+        other = encode_token(8, ACCESS, 60)
+        forged = ".".join(token.split(".")[:1] + other.split(".")[1:2] + token.split(".")[2:])
+        for bad in (forged, token[:-2] + "xx", "not-a-token", ""):
+            with pytest.raises(InvalidToken):
+                decode_token(bad, ACCESS)
+
+    def test_rejects_expired_and_wrong_type(self):
+        """Test expired tokens and refresh tokens are not accepted as access tokens."""
+        with pytest.raises(InvalidToken, match="expired"):
+            decode_token(encode_token(7, ACCESS, 60, now=time.time() - 120), ACCESS)
+        with pytest.raises(InvalidToken, match="type"):
+            decode_token(encode_token(7, REFRESH, 60), ACCESS)
+
+
+class TestTokenSessions:
+    """Test suite for logging in with tokens and using them on calculation routes."""
+
+    def test_login_returns_tokens(self, tokens, sample_user):
+        """Test login issues an access and a refresh token for the user."""
+        assert "Login successful" in tokens["message"]
+        assert tokens["token_type"] == "bearer"
+        assert decode_token(tokens["access_token"], ACCESS)["sub"] == sample_user["id"]
+        assert decode_token(tokens["refresh_token"], REFRESH)["sub"] == sample_user["id"]
+
+    def test_add_takes_user_from_token(self, tokens, sample_user):
+        """Test a calculation is created for the token's user without a user_id."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        response = client.post("/calculations", json=calc, headers=bearer(tokens["access_token"]))
+
+        assert response.status_code == 201
+        assert response.json()["user_id"] == sample_user["id"]
+
+    def test_add_requires_identity(self):
+        """Test adding without a token or user_id is unauthorized."""
+        response = client.post("/calculations", json={"operation": "add", "operand1": 1, "operand2": 2})
+
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+
+    def test_invalid_token_is_rejected(self, sample_user):
+        """Test a bad token is refused even when a user_id is given."""
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        response = client.post(
+            f"/calculations?user_id={sample_user['id']}", json=calc, headers=bearer("bad.token.value")
+        )
+
+        assert response.status_code == 401
+
+    def test_user_id_must_match_token(self, tokens, sample_user):
+        """Test a token cannot act for a different user_id."""
+        response = client.get(f"/calculations?user_id={sample_user['id'] + 1}", headers=bearer(tokens["access_token"]))
+
+        assert response.status_code == 403
+
+    def test_browse_is_scoped_to_token_user(self, tokens, sample_user):
+        """Test browsing with a token only lists the token user's calculations."""
+        other = client.post(
+            "/users/register", json={"username": "other", "email": "other@example.com", "password": "password123"}
+        ).json()
+        calc = {"operation": "add", "operand1": 1, "operand2": 2}
+        client.post(f"/calculations?user_id={sample_user['id']}", json=calc)
+        client.post(f"/calculations?user_id={other['id']}", json=calc)
+
+        response = client.get("/calculations", headers=bearer(tokens["access_token"]))
+
+        assert response.status_code == 200
+        assert [row["user_id"] for row in response.json()] == [sample_user["id"]]
+
+    def test_token_check_needs_no_queries(self, tokens):
+        """Test a token-authenticated browse runs no more SQL than an anonymous one."""
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            client.get("/calculations")
+            anonymous = len(statements)
+            statements.clear()
+            client.get("/calculations", headers=bearer(tokens["access_token"]))
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert len(statements) == anonymous
+        assert not any("users" in statement for statement in statements)
+
+    def test_refresh_issues_new_pair(self, tokens, sample_user):
+        """Test a refresh token is exchanged for a working token pair."""
+        response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+        assert response.status_code == 200
+        refreshed = response.json()
+        assert decode_token(refreshed["access_token"], ACCESS)["sub"] == sample_user["id"]
+        assert refreshed["refresh_token"] != tokens["refresh_token"]
+
+    def test_refresh_rejects_access_token(self, tokens):
+        """Test an access token cannot be used to refresh."""
+        response = client.post("/users/refresh", json={"refresh_token": tokens["access_token"]})
+
+        assert response.status_code == 401
+
+    def test_refresh_rejects_deleted_user(self):
+        """Test refreshing fails once the user no longer exists."""
+        response = client.post("/users/refresh", json={"refresh_token": encode_token(99999, REFRESH, 60)})
+
+        assert response.status_code == 401
@@ -1,5 +1,10 @@
+import threading
 import pytest
-from tests.conftest import client
+from sqlalchemy import event
+from app import hashing
+from app.models import User
+from app.utils import pwd_context
+from tests.conftest import client, engine, TestingSessionLocal
 
 
 class TestUserRegistration:
@@ -46,6 +51,27 @@ class TestUserRegistration:
         assert response.status_code == 400
         assert "Email already registered" in response.json()["detail"]
     
+    def test_register_user_single_statement(self, sample_user):
+        """Test registration issues one INSERT, duplicate or not."""
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            ok = client.post("/users/register", json={
+                "username": "fresh", "email": "fresh@example.com", "password": "password123"
+            })
+            duplicate = client.post("/users/register", json={
+                "username": "other", "email": "test@example.com", "password": "password123"
+            })
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert ok.status_code == 201
+        assert duplicate.status_code == 400
+        assert "Email already registered" in duplicate.json()["detail"]
+        assert len(statements) == 2
+        assert all(statement.startswith("INSERT INTO users") for statement in statements)
+    
     def test_register_user_invalid_email(self):
         """Test registration with invalid email format."""
         user_data = {
@@ -139,3 +165,46 @@ class TestUserRetrieval:
         
         assert response.status_code == 404
         assert "User not found" in response.json()["detail"]
+
+
+class TestPasswordHashing:
+    """Test suite for offloaded password hashing."""
+    
+    def test_login_rehashes_outdated_cost(self):
+        """Test that login upgrades a hash created with a lower bcrypt cost."""
+        db = TestingSessionLocal()
+        weak_hash = pwd_context.handler("bcrypt").using(rounds=4).hash("password123")
+        db.add(User(username="legacy", email="legacy@example.com", hashed_password=weak_hash))
+        db.commit()
+        
+        response = client.post("/users/login", json={"username": "legacy", "password": "password123"})
+        
+        assert response.status_code == 200
+        stored = db.query(User).filter(User.username == "legacy").first()
+        db.refresh(stored)
+        assert stored.hashed_password != weak_hash
+        assert not hashing.needs_rehash(stored.hashed_password)
+        db.close()
+    
+    def test_saturated_pool_returns_503(self, monkeypatch):
+        """Test that registration is shed with 503 when no hashing slot is free."""
+        monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(1))
+        hashing._slots.acquire()
+        user_data = {
+            "username": "busyuser",
+            "email": "busy@example.com",
+            "password": "password123"
+        }
+        response = client.post("/users/register", json=user_data)
+        
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    
+    def test_calibrate_bcrypt_respects_bounds(self):
+        """Test that calibration stays within the configured cost range."""
+        original = hashing.current_rounds()
+        try:
+            assert hashing.calibrate_bcrypt(target_ms=0.001) == hashing.BCRYPT_MIN_ROUNDS
+            assert hashing.current_rounds() == hashing.BCRYPT_MIN_ROUNDS
+        finally:
+            pwd_context.update(bcrypt__default_rounds=original, bcrypt__min_rounds=original)